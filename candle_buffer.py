@@ -0,0 +1,179 @@
+"""
+K线环形缓冲区 - 增量维护固定容量的OHLCV窗口
+
+每个周期只从缓冲区最新一根K线（上次拉取时可能尚未收盘）开始向交易所请求：
+- 与最新一根K线时间戳相同的数据原地覆盖，上次的部分数据由此更新为最终数据；
+- 更新的K线追加到尾部，容量满时覆盖最旧的一根；
+- 底层使用预分配的numpy数组，避免每个周期重新构建整段数据。
+"""
+
+import time
+
+import numpy as np
+
+OHLCV_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+# ccxt 周期字符串对应的毫秒数
+TIMEFRAME_MS = {
+    '1m': 60 * 1000,
+    '3m': 3 * 60 * 1000,
+    '5m': 5 * 60 * 1000,
+    '15m': 15 * 60 * 1000,
+    '30m': 30 * 60 * 1000,
+    '1h': 60 * 60 * 1000,
+    '2h': 2 * 60 * 60 * 1000,
+    '4h': 4 * 60 * 60 * 1000,
+    '1d': 24 * 60 * 60 * 1000,
+}
+
+
+def timeframe_to_ms(timeframe):
+    """将 '15m' / '1h' 等周期转换为毫秒"""
+    if timeframe in TIMEFRAME_MS:
+        return TIMEFRAME_MS[timeframe]
+    unit = timeframe[-1]
+    value = int(timeframe[:-1])
+    scale = {'m': 60 * 1000, 'h': 60 * 60 * 1000, 'd': 24 * 60 * 60 * 1000, 'w': 7 * 24 * 60 * 60 * 1000}
+    if unit not in scale:
+        raise ValueError(f"不支持的K线周期: {timeframe}")
+    return value * scale[unit]
+
+
+class CandleBuffer:
+    """固定容量的K线环形缓冲区（数组存储，按开盘时间升序读取）"""
+
+    def __init__(self, capacity, timeframe='15m', value_dtype=np.float64):
+        if capacity < 2:
+            raise ValueError("K线缓冲区容量至少为2")
+        self.capacity = int(capacity)
+        self.timeframe = timeframe
+        self.timeframe_ms = timeframe_to_ms(timeframe)
+        self._ts = np.zeros(self.capacity, dtype=np.int64)
+        # 列顺序: open, high, low, close, volume（value_dtype=float32 时为紧凑存储）
+        self._values = np.zeros((self.capacity, 5), dtype=value_dtype)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        self._start = 0
+        self._size = 0
+
+    def _slot(self, i):
+        """第 i 根（0为最旧）K线在底层数组中的位置"""
+        return (self._start + i) % self.capacity
+
+    @property
+    def last_ts(self):
+        """最新一根K线（可能尚未收盘）的开盘时间，空缓冲区返回None"""
+        if self._size == 0:
+            return None
+        return int(self._ts[self._slot(self._size - 1)])
+
+    def since(self):
+        """增量请求的起始时间：缓冲区最新一根K线（可能尚未收盘）的开盘时间
+
+        从这一根开始重新请求，上次拉取时尚未收盘的K线会被交易所返回的最终数据覆盖；
+        若从"下一根"开始请求，它将永远停留在首次拉取时的部分数据。
+        """
+        return self.last_ts
+
+    def rows_since(self, ts):
+        """开盘时间晚于 ts 的K线（ccxt列表格式）；ts 为None时返回全部"""
+        timestamps = self.timestamps()
+        start = 0 if ts is None else int(np.searchsorted(timestamps, ts, side='right'))
+        values = self._ordered(self._values)[start:]
+        return [[int(t)] + row.tolist() for t, row in zip(timestamps[start:], values)]
+
+    def is_stale(self, now_ms=None):
+        """缺口超过缓冲区容量时，增量请求无法补齐，需要整段重取"""
+        if self._size == 0:
+            return True
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        return now_ms - self.last_ts > self.capacity * self.timeframe_ms
+
+    def update(self, rows):
+        """合并交易所返回的OHLCV行，返回新追加的K线数量"""
+        appended = 0
+        if not rows:
+            return appended
+        for row in sorted(rows, key=lambda r: r[0]):
+            ts = int(row[0])
+            values = [float(v) if v is not None else np.nan for v in row[1:6]]
+            last = self.last_ts
+            if last is None or ts > last:
+                if self._size < self.capacity:
+                    slot = self._slot(self._size)
+                    self._size += 1
+                else:
+                    slot = self._start
+                    self._start = (self._start + 1) % self.capacity
+                self._ts[slot] = ts
+                self._values[slot] = values
+                appended += 1
+            elif ts == last:
+                # 未收盘K线原地更新
+                self._values[self._slot(self._size - 1)] = values
+            else:
+                # 历史K线修正：仅在仍处于窗口内时覆盖
+                ordered = self.timestamps()
+                idx = int(np.searchsorted(ordered, ts))
+                if idx < self._size and ordered[idx] == ts:
+                    self._values[self._slot(idx)] = values
+        return appended
+
+    def _ordered(self, array):
+        end = self._start + self._size
+        if end <= self.capacity:
+            return array[self._start:end]
+        return np.concatenate((array[self._start:], array[:end - self.capacity]))
+
+    def timestamps(self):
+        """按时间升序的开盘时间数组"""
+        return self._ordered(self._ts)
+
+    def arrays(self):
+        """按时间升序返回各列数组，键与 OHLCV_COLUMNS 一致"""
+        values = self._ordered(self._values)
+        return {
+            'timestamp': self.timestamps(),
+            'open': values[:, 0],
+            'high': values[:, 1],
+            'low': values[:, 2],
+            'close': values[:, 3],
+            'volume': values[:, 4],
+        }
+
+    def to_ohlcv(self):
+        """转换为 ccxt fetch_ohlcv 的列表格式"""
+        return self.rows_since(None)
+
+
+def _self_check():
+    """模拟两次增量拉取：首次拉取时最后一根尚未收盘，第二次拉取后应被最终数据覆盖"""
+    tf_ms = timeframe_to_ms('15m')
+    t0 = 90000000 - 3 * tf_ms
+    closed = [[t0 + i * tf_ms, 1.0, 1.2, 0.9, 1.1, 10.0] for i in range(3)]
+    forming = [90000000, 1.5, 1.5, 1.5, 1.5, 0.1]       # 开盘后几秒的部分数据
+    final = [90000000, 1.5, 1.9, 1.4, 1.8, 42.0]        # 收盘后的最终数据
+    nxt = [90000000 + tf_ms, 1.8, 1.8, 1.8, 1.8, 0.2]
+
+    def exchange(since):
+        rows = closed + [final, nxt]
+        return [r for r in rows if r[0] >= since]
+
+    buf = CandleBuffer(10, '15m')
+    buf.update(closed + [forming])
+    assert buf.since() == 90000000, buf.since()
+    buf.update(exchange(buf.since()))
+    last_closed = buf.to_ohlcv()[-2]
+    assert last_closed == final, f"未收盘K线未被最终数据覆盖: {last_closed}"
+    assert buf.rows_since(90000000) == [nxt]
+    assert len(buf) == 5
+    print(f"✅ 未收盘K线在下次拉取后更新为最终数据: close={last_closed[4]} volume={last_closed[5]}")
+
+
+if __name__ == "__main__":
+    _self_check()
@@ -0,0 +1,264 @@
+"""
+本地K线存储 - 按 (数据源, 符号, 周期) 持久化已收盘K线
+
+文件格式为定长二进制记录（CANDLE_DTYPE），只追加写入、按开盘时间严格递增，
+因此文件本身即是开盘时间的有序索引：读取时用 numpy.memmap 映射，
+np.searchsorted 二分定位区间，不需要把整段历史读入内存。
+
+- 首次运行按页批量回填历史（Binance USDM 单页最多1500根）；已有记录少于所需根数时，
+  向前补齐更早的历史（整文件原子重写，仅发生一次）；
+- 重启后直接从磁盘预热K线窗口，无需重新拉取；
+- 只写入已收盘K线，未收盘K线仍由 CandleBuffer 维护。
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+from candle_buffer import timeframe_to_ms
+
+CANDLE_STORE_DIR = os.path.join(os.path.dirname(__file__), 'data', 'candles')
+
+CANDLE_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+
+# 单次回填请求的最大K线数量
+BACKFILL_PAGE_LIMIT = 1500
+
+
+def records_to_rows(records):
+    """结构化记录 -> ccxt fetch_ohlcv 列表格式"""
+    return [[int(r[0])] + [float(v) for v in tuple(r)[1:6]] for r in records]
+
+
+def _safe_name(text):
+    return ''.join(ch if ch.isalnum() else '_' for ch in text)
+
+
+class CandleStore:
+    """只追加的本地K线文件，memmap 读取"""
+
+    def __init__(self, source_id, symbol, timeframe, directory=CANDLE_STORE_DIR, dtype=CANDLE_DTYPE):
+        self.source_id = source_id
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.timeframe_ms = timeframe_to_ms(timeframe)
+        self.dtype = np.dtype(dtype)
+        # 紧凑格式使用单独的文件，避免与 float64 记录混写
+        suffix = '' if self.dtype == CANDLE_DTYPE else f"_{self.dtype.itemsize}b"
+        self.path = os.path.join(directory, f"{_safe_name(source_id)}_{_safe_name(symbol)}_{timeframe}{suffix}.bin")
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._mmap_size = -1
+        os.makedirs(directory, exist_ok=True)
+        self._repair()
+
+    def _repair(self):
+        """截掉异常中断写入留下的不完整记录"""
+        if not os.path.exists(self.path):
+            return
+        size = os.path.getsize(self.path)
+        extra = size % self.dtype.itemsize
+        if extra:
+            with open(self.path, 'r+b') as f:
+                f.truncate(size - extra)
+            print(f"⚠️ K线存储文件尾部不完整，已截断{extra}字节: {self.path}")
+
+    def _records(self):
+        """当前文件内容的只读memmap（文件增长后重新映射）"""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size == 0:
+            return np.empty(0, dtype=self.dtype)
+        if size != self._mmap_size:
+            self._mmap = np.memmap(self.path, dtype=self.dtype, mode='r')
+            self._mmap_size = size
+        return self._mmap
+
+    def __len__(self):
+        return len(self._records())
+
+    @property
+    def first_ts(self):
+        records = self._records()
+        return int(records['timestamp'][0]) if len(records) else None
+
+    @property
+    def last_ts(self):
+        records = self._records()
+        return int(records['timestamp'][-1]) if len(records) else None
+
+    def append(self, rows, now_ms=None):
+        """追加已收盘且比现有记录更新的K线，返回写入条数"""
+        if not rows:
+            return 0
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        with self._lock:
+            last = self.last_ts
+            fresh = []
+            for row in sorted(rows, key=lambda r: r[0]):
+                ts = int(row[0])
+                if last is not None and ts <= last:
+                    continue
+                if ts + self.timeframe_ms > now_ms:
+                    break  # 未收盘
+                fresh.append((ts, *(float(v) for v in row[1:6])))
+                last = ts
+            if not fresh:
+                return 0
+            with open(self.path, 'ab') as f:
+                f.write(np.array(fresh, dtype=self.dtype).tobytes())
+            return len(fresh)
+
+    def sync_from_buffer(self, buf, now_ms=None):
+        """把缓冲区中比存储更新、且已收盘的K线写入存储，返回写入条数
+
+        缓冲区每次从最新一根K线开始重新拉取，收盘后的K线已被最终数据覆盖；
+        以存储的最后一条记录为界从缓冲区取行，而不是依赖本次请求恰好返回了哪些K线。
+        """
+        return self.append(buf.rows_since(self.last_ts), now_ms)
+
+    def read(self, since=None, until=None):
+        """按开盘时间区间 [since, until) 读取记录（memmap切片，只读）"""
+        records = self._records()
+        ts = records['timestamp']
+        lo = int(np.searchsorted(ts, since, side='left')) if since is not None else 0
+        hi = int(np.searchsorted(ts, until, side='left')) if until is not None else len(records)
+        return records[lo:hi]
+
+    def tail(self, n):
+        """最近 n 根已收盘K线"""
+        records = self._records()
+        return records[-n:] if n < len(records) else records
+
+    def tail_rows(self, n):
+        """最近 n 根已收盘K线（ccxt列表格式）"""
+        return records_to_rows(self.tail(n))
+
+    def _fetch_pages(self, client, since, until, max_pages, now_ms):
+        """分页拉取 [since, until) 内已收盘K线（ccxt列表格式，时间严格递增）"""
+        rows = []
+        for _ in range(max_pages):
+            # 只剩未收盘K线时无需请求
+            if since >= until or since + self.timeframe_ms > now_ms:
+                break
+            page = client.fetch_ohlcv(self.symbol, self.timeframe, since=since, limit=BACKFILL_PAGE_LIMIT)
+            if not page:
+                break
+            for row in sorted(page, key=lambda r: r[0]):
+                ts = int(row[0])
+                if ts >= until or ts + self.timeframe_ms > now_ms:
+                    break
+                if not rows or ts > rows[-1][0]:
+                    rows.append([ts] + [float(v) for v in row[1:6]])
+            next_since = int(page[-1][0]) + self.timeframe_ms
+            if next_since <= since:
+                break
+            since = next_since
+        return rows
+
+    def _prepend(self, rows):
+        """把更早的K线写到文件开头（写临时文件后原子替换）"""
+        with self._lock:
+            existing = np.array(self._records())
+            older = np.array([tuple(r) for r in rows], dtype=self.dtype)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(older.tobytes())
+                f.write(existing.tobytes())
+            self._mmap = None
+            self._mmap_size = -1
+            os.replace(tmp_path, self.path)
+        return len(older)
+
+    def backfill(self, client, min_points, max_pages=20, now_ms=None):
+        """批量分页补齐历史：保证至少覆盖最近 min_points 根，并补齐最后一根之后的缺口"""
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        start = now_ms - (min_points + 1) * self.timeframe_ms
+        written = 0
+        first = self.first_ts
+        if first is not None and first > start + self.timeframe_ms:
+            older = self._fetch_pages(client, start, first, max_pages, now_ms)
+            if older:
+                written += self._prepend(older)
+        last = self.last_ts
+        since = start if last is None else last + self.timeframe_ms
+        rows = self._fetch_pages(client, since, now_ms, max_pages, now_ms)
+        written += self.append(rows, now_ms)
+        if written:
+            print(f"✅ K线存储回填 {self.symbol} {self.timeframe}: {written}根，共{len(self)}根")
+        return written
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_candle_store(source_id, symbol, timeframe, directory=CANDLE_STORE_DIR, dtype=CANDLE_DTYPE):
+    """获取进程内共享的 CandleStore 实例"""
+    key = (source_id, symbol, timeframe, directory, np.dtype(dtype))
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = CandleStore(source_id, symbol, timeframe, directory, dtype)
+            _stores[key] = store
+        return store
+
+
+def _self_check():
+    """模拟两个拉取周期：上次未收盘的K线收盘后，应以最终数据写入存储"""
+    import tempfile
+
+    from candle_buffer import CandleBuffer
+
+    tf_ms = timeframe_to_ms('15m')
+    base = 90000000
+    closed = [[base - (3 - i) * tf_ms, 1.0, 1.2, 0.9, 1.1, 10.0] for i in range(3)]
+    forming = [base, 1.5, 1.5, 1.5, 1.5, 0.1]
+    final = [base, 1.5, 1.9, 1.4, 1.8, 42.0]
+    nxt = [base + tf_ms, 1.8, 1.8, 1.8, 1.8, 0.2]
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = CandleStore('check', 'BTC/USDT', '15m', directory)
+        buf = CandleBuffer(10, '15m')
+
+        # 第一个周期：最后一根尚未收盘，只写入前3根
+        now = base + 5000
+        buf.update(closed + [forming])
+        assert store.sync_from_buffer(buf, now) == 3
+        assert store.last_ts == closed[-1][0]
+
+        # 第二个周期：从最新一根开始重新拉取，交易所返回其最终数据与新的未收盘K线
+        now = base + tf_ms + 5000
+        buf.update([r for r in closed + [final, nxt] if r[0] >= buf.since()])
+        assert store.sync_from_buffer(buf, now) == 1
+        record = records_to_rows(store.tail(1))[0]
+        assert record == final, f"存储中的K线不是最终数据: {record}"
+        assert store.sync_from_buffer(buf, now) == 0
+        print(f"✅ 收盘后的K线以最终数据写入存储: close={record[4]} volume={record[5]}，共{len(store)}根")
+        store._mmap = None  # 释放映射后再删除临时目录
+
+        # 已有记录不足 min_points 根时向前补齐，文件仍按时间严格递增
+        class FakeClient:
+            def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+                first = -(-since // tf_ms) * tf_ms
+                return [[t, 1.0, 1.0, 1.0, 1.0, 1.0] for t in range(first, first + limit * tf_ms, tf_ms)]
+
+        store = CandleStore('check', 'ETH/USDT', '15m', directory)
+        now = base + 5000
+        store.append(FakeClient().fetch_ohlcv(None, None, base - 10 * tf_ms, 10), now)
+        store.backfill(FakeClient(), 3000, now_ms=now)
+        ts = store.read()['timestamp']
+        assert len(store) >= 3000 and (np.diff(ts) == tf_ms).all() and int(ts[-1]) == base - tf_ms, len(store)
+        store._mmap = None
+
+
+if __name__ == "__main__":
+    _self_check()
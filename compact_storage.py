@@ -0,0 +1,133 @@
+"""
+紧凑K线/指标存储 - 可选的 float32 结构化数组表示（MEMORY_CONFIG['compact_candles'] 开启）
+
+- K线: int64 毫秒时间戳 + float32 开高低收量，每根 28 字节（float64 为 48 字节）；
+- 指标: 同样以 float32 列存放，计算时统一升为 float64，内核精度不变；
+- 精度检查: 对同一段K线分别用 float64 与 float32 输入计算决策用指标，差异需在容差内。
+
+float32 有效位约7位，BTC 价格下分辨率约 0.004 USDT，远小于决策使用的价位精度。
+运行 `python compact_storage.py` 查看每根K线的内存占用与精度检查结果。
+"""
+
+import numpy as np
+
+from feature_pipeline import RAW_COLUMNS, TECHNICAL_DATA_FEATURES, feature_pipeline
+
+COMPACT_VALUE_DTYPE = np.float32
+
+COMPACT_CANDLE_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('open', '<f4'),
+    ('high', '<f4'),
+    ('low', '<f4'),
+    ('close', '<f4'),
+    ('volume', '<f4'),
+])
+
+# 决策相关指标的容差：('price', r) 表示不超过 收盘价×r；('abs', a) 为绝对误差；('rel', r) 为相对误差
+PRECISION_TOLERANCE = {
+    'sma_5': ('price', 1e-6),
+    'sma_20': ('price', 1e-6),
+    'sma_50': ('price', 1e-6),
+    'macd': ('price', 1e-6),
+    'macd_signal': ('price', 1e-6),
+    'macd_histogram': ('price', 1e-6),
+    'bb_upper': ('price', 1e-6),
+    'bb_lower': ('price', 1e-6),
+    'rsi': ('abs', 0.01),
+    'bb_position': ('abs', 1e-3),
+    'volume_ratio': ('rel', 1e-4),
+}
+
+
+def bytes_per_candle(dtype):
+    return np.dtype(dtype).itemsize
+
+
+def to_compact_records(data, extra_columns=()):
+    """DataFrame / ccxt列表 / 列字典 -> 紧凑结构化数组
+
+    extra_columns: 额外保存的指标列（float32）
+    """
+    if isinstance(data, list):
+        block = np.asarray(data, dtype=np.float64)
+        columns = {'timestamp': block[:, 0].astype(np.int64)}
+        columns.update({col: block[:, i + 1] for i, col in enumerate(RAW_COLUMNS)})
+    else:
+        columns = data
+    dtype = COMPACT_CANDLE_DTYPE
+    if extra_columns:
+        dtype = np.dtype(COMPACT_CANDLE_DTYPE.descr + [(name, '<f4') for name in extra_columns])
+    records = np.empty(len(columns['close']), dtype=dtype)
+    timestamps = np.asarray(columns['timestamp'])
+    if np.issubdtype(timestamps.dtype, np.datetime64):
+        timestamps = timestamps.astype('datetime64[ms]').astype(np.int64)
+    records['timestamp'] = timestamps
+    for name in dtype.names[1:]:
+        records[name] = np.asarray(columns[name], dtype=np.float64)
+    return records
+
+
+def compact_columns(records):
+    """紧凑结构化数组 -> {列名: float64数组}（计算前升精度）"""
+    columns = {'timestamp': records['timestamp'].astype(np.int64)}
+    for name in records.dtype.names[1:]:
+        columns[name] = records[name].astype(np.float64)
+    return columns
+
+
+def precision_report(rows, features=TECHNICAL_DATA_FEATURES):
+    """分别用 float64 与 float32 K线计算最新指标，返回 {指标: (误差, 容差)}"""
+    block = np.asarray(rows, dtype=np.float64)
+    full = {col: block[:, i + 1] for i, col in enumerate(RAW_COLUMNS)}
+    compact = {col: arr.astype(COMPACT_VALUE_DTYPE).astype(np.float64) for col, arr in full.items()}
+    expected, _ = feature_pipeline.latest(full, features)
+    actual, _ = feature_pipeline.latest(compact, features)
+    price = abs(full['close'][-1])
+    report = {}
+    for name in features:
+        a, b = expected[name], actual[name]
+        if np.isnan(a) and np.isnan(b):
+            report[name] = (0.0, 0.0)
+            continue
+        kind, value = PRECISION_TOLERANCE.get(name, ('rel', 1e-5))
+        if kind == 'price':
+            error, tolerance = abs(a - b), price * value
+        elif kind == 'abs':
+            error, tolerance = abs(a - b), value
+        else:
+            error, tolerance = abs(a - b) / max(abs(a), 1e-12), value
+        report[name] = (error, tolerance)
+    return report
+
+
+def check_compact_precision(rows, features=TECHNICAL_DATA_FEATURES):
+    """返回 (是否全部在容差内, 超出容差的指标)"""
+    report = precision_report(rows, features)
+    failed = {name: v for name, v in report.items() if not v[0] <= v[1]}
+    return not failed, failed
+
+
+def _self_check():
+    from synthetic_market import generate_ohlcv, to_ohlcv_rows
+    from candle_store import CANDLE_DTYPE
+
+    full, compact = bytes_per_candle(CANDLE_DTYPE), bytes_per_candle(COMPACT_CANDLE_DTYPE)
+    print(f"📦 每根K线: float64 {full} 字节, 紧凑 {compact} 字节 ({compact / full:.0%})")
+    worst = {}
+    for seed in range(20):
+        for start_price in (68000.0, 3500.0, 0.5):
+            rows = to_ohlcv_rows(generate_ohlcv(500, seed=seed, start_price=start_price))
+            ok, failed = check_compact_precision(rows)
+            if not ok:
+                raise AssertionError(f"seed={seed} price={start_price} 精度超出容差: {failed}")
+            for name, (error, tolerance) in precision_report(rows).items():
+                ratio = error / tolerance if tolerance else 0.0
+                worst[name] = max(worst.get(name, 0.0), ratio)
+    print("✅ float32 K线计算的决策指标均在容差内（误差/容差 最大值）:")
+    for name, ratio in worst.items():
+        print(f"   {name}: {ratio:.3f}")
+
+
+if __name__ == "__main__":
+    _self_check()
@@ -0,0 +1,174 @@
+"""
+决策缓存 - 市场状态未发生实质变化时复用上一次通过校验的AI决策，跳过本周期的大模型调用
+
+指纹由 Prompt 的输入量化后组成：价格（按0.2%分桶）、RSI/布林带位置/量比分桶、MACD柱方向、
+趋势与多周期共振标签、波动状态、持仓（方向与数量，原值）、上次信号、市场情绪分桶。
+指纹相同且未超出时效预算（最长存活时间、最多连续复用次数）时直接返回缓存决策；
+持仓变化会改变指纹，因此一定重新调用模型。
+价格在同一分桶内仍可能变动，复用时止损/止盈按决策时与当前价格的距离比例平移到当前价格
+（保持原决策的止损幅度与盈亏比），不会沿用过时的绝对价位。
+
+统计命中率与按历史调用延迟估算的节省时间，供 /api/health 与 Web 面板展示。
+"""
+
+import copy
+import math
+import os
+import threading
+import time
+
+DECISION_CACHE_CONFIG = {
+    'enabled': os.getenv('DECISION_CACHE', 'true').lower() == 'true',
+    'max_age_seconds': int(os.getenv('DECISION_CACHE_MAX_AGE', '1800')),  # 默认30分钟（两根15m K线）
+    'max_reuses': 3,            # 同一决策最多连续复用次数
+    'price_band_pct': 0.002,    # 价格分桶宽度（相对价格）
+    'rsi_step': 5.0,
+    'bb_step': 0.1,
+    'volume_ratio_step': 0.5,
+    'sentiment_step': 0.1,
+}
+
+
+def _bucket(value, step):
+    """数值分桶；None/NaN 返回None"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(value) or math.isinf(value):
+        return None
+    return int(math.floor(value / step))
+
+
+def _direction(value):
+    """数值方向：1 / -1 / 0；None/NaN 返回None"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(value):
+        return None
+    return (value > 0) - (value < 0)
+
+
+def market_fingerprint(price_data, position=None, last_signal=None, sentiment=None, config=None):
+    """量化后的市场状态指纹（可哈希的元组）"""
+    config = dict(DECISION_CACHE_CONFIG, **(config or {}))
+    tech = price_data.get('technical_data') or {}
+    trend = price_data.get('trend_analysis') or {}
+    vol = price_data.get('volatility_analysis') or {}
+    price = float(price_data.get('price') or 0)
+    price_bucket = int(math.floor(math.log(price) / math.log1p(config['price_band_pct']))) if price > 0 else None
+    confluence = trend.get('mtf_confluence') or {}
+    return (
+        price_data.get('timeframe'),
+        price_bucket,
+        _bucket(tech.get('rsi'), config['rsi_step']),
+        _bucket(tech.get('bb_position'), config['bb_step']),
+        _bucket(tech.get('volume_ratio'), config['volume_ratio_step']),
+        _direction(tech.get('macd_histogram')),
+        trend.get('short_term'),
+        trend.get('medium_term'),
+        trend.get('overall'),
+        trend.get('macd'),
+        confluence.get('label'),
+        vol.get('regime'),
+        (position.get('side'), position.get('size')) if position else None,
+        (last_signal.get('signal'), last_signal.get('confidence')) if last_signal else None,
+        _bucket((sentiment or {}).get('net_sentiment'), config['sentiment_step']),
+    )
+
+
+def rebase_levels(decision, from_price, to_price):
+    """把决策的止损/止盈按相对距离从 from_price 平移到 to_price（原地修改并返回）；
+    价位缺失或价格无效时保持原值"""
+    try:
+        from_price, to_price = float(from_price), float(to_price)
+    except (TypeError, ValueError):
+        return decision
+    if not (from_price > 0 and to_price > 0):
+        return decision
+    scale = to_price / from_price
+    for name in ('stop_loss', 'take_profit'):
+        try:
+            level = float(decision.get(name))
+        except (TypeError, ValueError):
+            continue
+        decision[name] = level * scale
+    return decision
+
+
+class DecisionCache:
+    """单槽位决策缓存：只保存最近一次通过校验的决策（线程安全）"""
+
+    def __init__(self, config=None):
+        self.config = dict(DECISION_CACHE_CONFIG, **(config or {}))
+        self._lock = threading.Lock()
+        self._entry = None  # {'fingerprint', 'decision', 'price', 'stored_at', 'reuses'}
+        self._avg_latency = None
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'saved_seconds': 0.0}
+
+    def lookup(self, fingerprint, now=None, price=None):
+        """命中返回缓存决策的副本；未命中、过期或超出复用次数返回None
+
+        price 为当前价格时，副本的止损/止盈按相对距离平移到该价格。
+        """
+        if not self.config['enabled']:
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entry
+            if entry is None or entry['fingerprint'] != fingerprint:
+                self._stats['misses'] += 1
+                return None
+            if now - entry['stored_at'] > self.config['max_age_seconds'] or entry['reuses'] >= self.config['max_reuses']:
+                self._entry = None
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+            entry['reuses'] += 1
+            self._stats['hits'] += 1
+            self._stats['saved_seconds'] += self._avg_latency or 0.0
+            decision = copy.deepcopy(entry['decision'])
+        if price is not None:
+            rebase_levels(decision, entry['price'], price)
+        return decision
+
+    def store(self, fingerprint, decision, latency_seconds=None, now=None, price=None):
+        """保存一次新调用得到的决策（price 为决策时的价格），并更新调用延迟的移动平均"""
+        with self._lock:
+            if latency_seconds is not None:
+                if self._avg_latency is None:
+                    self._avg_latency = latency_seconds
+                else:
+                    self._avg_latency += 0.2 * (latency_seconds - self._avg_latency)
+            if not self.config['enabled']:
+                return
+            self._entry = {
+                'fingerprint': fingerprint,
+                'decision': copy.deepcopy(decision),
+                'price': price,
+                'stored_at': time.time() if now is None else now,
+                'reuses': 0,
+            }
+
+    def invalidate(self):
+        with self._lock:
+            self._entry = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'enabled': self.config['enabled'],
+                'hits': self._stats['hits'],
+                'misses': self._stats['misses'],
+                'expired': self._stats['expired'],
+                'hit_rate': round(self._stats['hits'] / lookups, 4) if lookups else 0.0,
+                'saved_seconds': round(self._stats['saved_seconds'], 3),
+                'avg_llm_latency_seconds': round(self._avg_latency, 3) if self._avg_latency is not None else None,
+            }
+
+
+# 进程内共享：交易循环使用，Web 面板读取统计
+decision_cache = DecisionCache()
@@ -0,0 +1,467 @@
+"""
+AI决策解析 - 单遍宽容解析 + 字段校验，替代 safe_json_parse 的多次重试与正则修复
+
+- 回复以 '{' 开头（JSON 输出模式下的常态）时直接从首字符解码，否则先定位第一个 '{'；
+  解码用标准库 raw_decode（C实现），对象之后的说明文字/代码围栏直接忽略；
+- 标准 JSON 解析失败时，从同一位置做一次宽容解析：单引号字符串、未加引号的键、尾随逗号、
+  True/False/None、// 注释均可接受，但字符串内容原样保留（不做任何正则替换）；
+- 按 DECISION_SCHEMA 校验字段：signal/confidence 归一为大写枚举，stop_loss/take_profit 强制转换为
+  正的浮点数（可接受 "61,200.5"、"$61200 USDT" 等写法），HOLD 允许止损止盈为空；
+  枚举取值集合与别名表在导入时预先编译，校验时不再逐次构造；
+- 常态快速路径：必需字段齐全且都是规范取值（大写枚举、正数价位）时直接构造结果，
+  其余情况走完整校验，两条路径结果一致。
+
+回复样例夹具 fixtures/decision_replies.jsonl 记录各种回复形态及人工核对的期望决策，自检时逐条比对。
+设置 DECISION_RECORD_FILE 后，每条模型回复及其解析结果追加写入该文件（JSONL，与夹具同格式的
+reply/decision 字段），自检时回放以发现解析结果的漂移；核对期望后可追加到夹具。
+
+同一输入的结果是确定的：要么得到规范化的决策字典，要么抛出 DecisionParseError 并列出全部问题。
+运行 `python decision_parser.py` 执行样例检查，并与旧解析链对比耗时：JSON 模式的标准回复约快一成
+（约4.0µs 对 4.4µs）；混合了各种异常形态的全部样例平均每条略慢（约10.3µs 对 9.9µs），
+多出的是旧解析链直接放弃的宽容解析与字段校验。
+"""
+
+import json
+import math
+import os
+import re
+
+_DECODER = json.JSONDecoder()
+_NUMBER = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?')
+_IDENTIFIER = re.compile(r'[A-Za-z_一-鿿][\w一-鿿]*')
+_PRICE_TEXT = re.compile(r'[-+]?\d+(?:\.\d+)?')
+_WHITESPACE = ' \t\r\n'
+_INF = float('inf')
+_LITERALS = {'true': True, 'false': False, 'null': None, 'True': True, 'False': False, 'None': None}
+
+# 录制模型回复的 JSONL 文件，留空不录制
+DECISION_RECORD_FILE = os.getenv('DECISION_RECORD_FILE', '')
+
+# 字段规则：类型、是否必需、枚举取值（及别名）
+DECISION_SCHEMA = {
+    'signal': {'type': 'enum', 'required': True, 'values': ('BUY', 'SELL', 'HOLD'),
+               'aliases': {'LONG': 'BUY', 'SHORT': 'SELL'}, 'case': 'upper'},
+    'reason': {'type': 'str', 'required': True},
+    'stop_loss': {'type': 'price', 'required': True},
+    'take_profit': {'type': 'price', 'required': True},
+    'confidence': {'type': 'enum', 'required': True, 'values': ('HIGH', 'MEDIUM', 'LOW'), 'case': 'upper'},
+    'strategy_tag': {'type': 'enum', 'values': ('trend_follow', 'mean_reversion', 'breakout', 'other'),
+                     'case': 'lower'},
+    'time_horizon': {'type': 'enum', 'values': ('scalp', 'intraday', 'swing'), 'case': 'lower'},
+    'risk_budget': {'type': 'enum', 'values': ('low', 'medium', 'high'), 'case': 'lower'},
+}
+
+
+def _compile_schema(schema):
+    """schema -> [(字段, 类型, 是否必需, 取值集合, 取值说明, 别名表, 是否大写)]"""
+    return [(name, rule['type'], bool(rule.get('required')), frozenset(rule.get('values', ())),
+             '/'.join(rule.get('values', ())), rule.get('aliases', {}), rule.get('case') == 'upper')
+            for name, rule in schema.items()]
+
+
+_COMPILED_SCHEMA = _compile_schema(DECISION_SCHEMA)
+_SIGNALS = frozenset(DECISION_SCHEMA['signal']['values'])
+_CONFIDENCES = frozenset(DECISION_SCHEMA['confidence']['values'])
+_NUMBER_TYPES = (int, float)
+_OPTIONAL_ENUMS = tuple((name, frozenset(rule['values'])) for name, rule in DECISION_SCHEMA.items()
+                        if not rule.get('required'))
+
+
+class DecisionParseError(ValueError):
+    """回复无法解析为有效决策；errors 为全部问题列表"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__("; ".join(self.errors))
+
+
+# ========== 宽容 JSON 解析（单遍递归下降） ==========
+
+class _TolerantParser:
+    def __init__(self, text):
+        self.text = text
+        self.n = len(text)
+
+    def error(self, pos, message):
+        return DecisionParseError([f"JSON格式错误(位置{pos}): {message}"])
+
+    def skip(self, pos):
+        text = self.text
+        while pos < self.n:
+            ch = text[pos]
+            if ch in _WHITESPACE:
+                pos += 1
+            elif text.startswith('//', pos):
+                end = text.find('\n', pos)
+                pos = self.n if end == -1 else end + 1
+            else:
+                break
+        return pos
+
+    def value(self, pos):
+        pos = self.skip(pos)
+        if pos >= self.n:
+            raise self.error(pos, "内容不完整")
+        ch = self.text[pos]
+        if ch == '{':
+            return self.object(pos)
+        if ch == '[':
+            return self.array(pos)
+        if ch == '"':
+            try:
+                return json.decoder.scanstring(self.text, pos + 1)
+            except json.JSONDecodeError as e:
+                raise self.error(pos, e.msg)
+        if ch == "'":
+            return self.single_quoted(pos)
+        m = _NUMBER.match(self.text, pos)
+        if m:
+            s = m.group()
+            return (float(s) if any(c in s for c in '.eE') else int(s)), m.end()
+        m = _IDENTIFIER.match(self.text, pos)
+        if m and m.group() in _LITERALS:
+            return _LITERALS[m.group()], m.end()
+        raise self.error(pos, f"无法识别的值 {self.text[pos:pos + 10]!r}")
+
+    def single_quoted(self, pos):
+        chars = []
+        i = pos + 1
+        while i < self.n:
+            ch = self.text[i]
+            if ch == '\\' and i + 1 < self.n:
+                nxt = self.text[i + 1]
+                chars.append({'n': '\n', 't': '\t', "'": "'", '"': '"', '\\': '\\'}.get(nxt, '\\' + nxt))
+                i += 2
+            elif ch == "'":
+                return ''.join(chars), i + 1
+            else:
+                chars.append(ch)
+                i += 1
+        raise self.error(pos, "字符串未结束")
+
+    def key(self, pos):
+        ch = self.text[pos]
+        if ch in '"\'':
+            return self.value(pos)
+        m = _IDENTIFIER.match(self.text, pos)
+        if not m:
+            raise self.error(pos, "缺少键名")
+        return m.group(), m.end()
+
+    def object(self, pos):
+        result = {}
+        pos = self.skip(pos + 1)
+        while True:
+            if pos >= self.n:
+                raise self.error(pos, "对象未结束")
+            if self.text[pos] == '}':
+                return result, pos + 1
+            key, pos = self.key(pos)
+            pos = self.skip(pos)
+            if pos >= self.n or self.text[pos] != ':':
+                raise self.error(pos, "键后缺少冒号")
+            result[key], pos = self.value(pos + 1)
+            pos = self.skip(pos)
+            if pos < self.n and self.text[pos] == ',':
+                pos = self.skip(pos + 1)
+            elif pos < self.n and self.text[pos] != '}':
+                raise self.error(pos, "缺少逗号")
+
+    def array(self, pos):
+        result = []
+        pos = self.skip(pos + 1)
+        while True:
+            if pos >= self.n:
+                raise self.error(pos, "数组未结束")
+            if self.text[pos] == ']':
+                return result, pos + 1
+            item, pos = self.value(pos)
+            result.append(item)
+            pos = self.skip(pos)
+            if pos < self.n and self.text[pos] == ',':
+                pos = self.skip(pos + 1)
+            elif pos < self.n and self.text[pos] != ']':
+                raise self.error(pos, "缺少逗号")
+
+
+def parse_json_object(text):
+    """提取并解析回复中的第一个 JSON 对象（忽略其前后的文字与代码围栏）"""
+    if text[:1] == '{':
+        # JSON 输出模式下的常态：对象从首字符开始，直接解码
+        start = 0
+    else:
+        start = text.find('{') if text else -1
+        if start == -1:
+            raise DecisionParseError(["回复中未找到JSON对象"])
+    try:
+        obj, _ = _DECODER.raw_decode(text, start)
+    except json.JSONDecodeError:
+        obj, _ = _TolerantParser(text).object(start)
+    return obj
+
+
+# ========== 字段校验与类型转换 ==========
+
+def coerce_price(value):
+    """价位 -> 正的有限浮点数；无法转换时抛出 ValueError"""
+    if isinstance(value, bool):
+        raise ValueError(f"不是数值: {value!r}")
+    if isinstance(value, (int, float)):
+        price = float(value)
+    elif isinstance(value, str):
+        text = value.replace(',', '').replace('$', '').replace('USDT', '').strip()
+        if not _PRICE_TEXT.fullmatch(text):
+            raise ValueError(f"不是数值: {value!r}")
+        price = float(text)
+    else:
+        raise ValueError(f"不是数值: {value!r}")
+    if not math.isfinite(price) or price <= 0:
+        raise ValueError(f"价位必须为正数: {value!r}")
+    return price
+
+
+def _fast_decision(obj):
+    """常态快速路径：必需字段齐全且均为规范取值时直接构造结果，否则返回None走完整校验"""
+    get = obj.get
+    signal = get('signal')
+    confidence = get('confidence')
+    reason = get('reason')
+    stop_loss = get('stop_loss')
+    take_profit = get('take_profit')
+    try:
+        if not (signal in _SIGNALS and confidence in _CONFIDENCES and type(reason) is str
+                and type(stop_loss) in _NUMBER_TYPES and 0 < stop_loss < _INF
+                and type(take_profit) in _NUMBER_TYPES and 0 < take_profit < _INF):
+            return None
+        decision = {'signal': signal, 'reason': reason.strip(), 'stop_loss': float(stop_loss),
+                    'take_profit': float(take_profit), 'confidence': confidence}
+        if len(obj) > 5:
+            for name, values in _OPTIONAL_ENUMS:
+                if name in obj:
+                    if obj[name] not in values:
+                        return None
+                    decision[name] = obj[name]
+    except TypeError:
+        # 不可哈希的取值（列表/对象）交给完整校验报错
+        return None
+    return decision
+
+
+def validate_decision(obj, schema=DECISION_SCHEMA):
+    """按 schema 校验并规范化决策字段，返回新字典；不合法时抛出 DecisionParseError"""
+    if schema is DECISION_SCHEMA and type(obj) is dict:
+        decision = _fast_decision(obj)
+        if decision is not None:
+            return decision
+    if not isinstance(obj, dict):
+        raise DecisionParseError([f"决策必须是JSON对象，实际为 {type(obj).__name__}"])
+    rules = _COMPILED_SCHEMA if schema is DECISION_SCHEMA else _compile_schema(schema)
+    errors = []
+    decision = {}
+    for name, kind, required, values, choices, aliases, upper in rules:
+        value = obj.get(name)
+        if value is None:
+            if required and not (kind == 'price' and name in obj):
+                errors.append(f"缺少字段 {name}")
+            elif name in obj:
+                decision[name] = None
+            continue
+        if kind == 'price':
+            if type(value) in (int, float) and 0 < value < _INF:
+                decision[name] = float(value)
+                continue
+            try:
+                decision[name] = coerce_price(value)
+            except ValueError as e:
+                errors.append(f"{name}: {e}")
+        elif kind == 'str':
+            decision[name] = value.strip() if type(value) is str else str(value).strip()
+        elif type(value) is str and value in values:
+            decision[name] = value
+        else:
+            text = str(value).strip()
+            text = text.upper() if upper else text.lower()
+            text = aliases.get(text, text)
+            if text in values:
+                decision[name] = text
+            elif required:
+                errors.append(f"{name} 取值无效: {value!r}（可选 {choices}）")
+            # 可选字段取值无效时丢弃，由下游使用默认值
+
+    # 只有 HOLD 允许不给止损止盈
+    if decision.get('signal') != 'HOLD':
+        for name in ('stop_loss', 'take_profit'):
+            if name in obj and obj[name] is None:
+                errors.append(f"{decision.get('signal', '交易')}信号缺少 {name}")
+    if errors:
+        raise DecisionParseError(errors)
+    return decision
+
+
+def parse_decision(text):
+    """模型回复文本 -> 规范化决策字典"""
+    return validate_decision(parse_json_object(text))
+
+
+def record_reply(text, decision, path=None):
+    """追加一条模型回复及其解析结果（无效时为None）到录制文件；未配置时不做任何事"""
+    path = path or DECISION_RECORD_FILE
+    if not path:
+        return
+    try:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'reply': text, 'decision': decision}, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"录制模型回复失败(忽略继续): {e}")
+
+
+def load_recorded_corpus(path=None):
+    """读取录制文件 -> [(名称, 回复文本, 录制时的解析结果)]；只用于检查解析结果是否随代码改动漂移"""
+    path = path or DECISION_RECORD_FILE
+    if not path or not os.path.exists(path):
+        return []
+    corpus = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for i, line in enumerate(f, 1):
+            if line.strip():
+                item = json.loads(line)
+                corpus.append((f"录制#{i}", item['reply'], item['decision']))
+    return corpus
+
+
+# ========== 回归样例与基准 ==========
+
+# 回复样例夹具：与录制文件同格式（每行 {"name", "reply", "decision"}），期望决策为逐条人工核对的
+# 完整规范化结果，不由本解析器生成；覆盖 JSON 输出模式的常态回复与代码围栏、前后说明文字、
+# 尾随逗号、单引号、未加引号的键、字符串价位、被截断的流等形态。期望为null表示应当拒绝。
+# 线上录制的回复人工核对期望后追加到该文件。
+DECISION_FIXTURE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures',
+                                     'decision_replies.jsonl')
+
+
+def load_fixture_corpus(path=DECISION_FIXTURE_FILE):
+    """读取回复样例夹具 -> [(名称, 回复文本, 期望决策)]"""
+    corpus = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                corpus.append((item['name'], item['reply'], item['decision']))
+    return corpus
+
+
+def _legacy_parse(result):
+    """原解析链（find/rfind 截取 + safe_json_parse），仅用于回归对比"""
+    start_idx = result.find('{')
+    end_idx = result.rfind('}') + 1
+    if start_idx == -1 or end_idx == 0:
+        return None
+    json_str = result[start_idx:end_idx]
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        try:
+            if '```json' in json_str:
+                start = json_str.find('```json') + 7
+                end = json_str.find('```', start)
+                if end != -1:
+                    json_str = json_str[start:end].strip()
+            elif '```' in json_str:
+                start = json_str.find('```') + 3
+                end = json_str.find('```', start)
+                if end != -1:
+                    json_str = json_str[start:end].strip()
+            try:
+                return json.loads(json_str)
+            except Exception:
+                pass
+            json_str = json_str.replace("'", '"')
+            json_str = re.sub(r'(\w+):', r'"\1":', json_str)
+            json_str = re.sub(r',\s*}', '}', json_str)
+            json_str = re.sub(r',\s*]', ']', json_str)
+            return json.loads(json_str)
+        except json.JSONDecodeError:
+            return None
+
+
+def _legacy_decision(result):
+    """原决策链：_legacy_parse + 必需字段检查，仅用于基准对比"""
+    decision = _legacy_parse(result)
+    if decision is None or not all(f in decision for f in ('signal', 'reason', 'stop_loss', 'take_profit',
+                                                           'confidence')):
+        return None
+    return decision
+
+
+def _matches(decision, expected, exact=False):
+    if expected is None:
+        return decision is None
+    if exact:
+        return decision == expected
+    return decision is not None and all(decision.get(k) == v for k, v in expected.items())
+
+
+def _parse_or_none(text):
+    try:
+        return parse_decision(text)
+    except DecisionParseError:
+        return None
+
+
+def _self_check():
+    import time
+
+    fixture = load_fixture_corpus()
+    legacy_diff = []
+    for name, text, expected in fixture:
+        decision = _parse_or_none(text)
+        if not _matches(decision, expected, exact=True):
+            raise AssertionError(f"样例「{name}」解析结果不符: {decision}，期望 {expected}")
+        if not _matches(_legacy_parse(text), expected):
+            legacy_diff.append(name)
+        if decision is not None:
+            # 快速路径命中时须与完整校验（非同一 schema 对象即不走快速路径）结果一致
+            obj = parse_json_object(text)
+            fast = _fast_decision(obj) if type(obj) is dict else None
+            if fast is not None and fast != validate_decision(obj, dict(DECISION_SCHEMA)):
+                raise AssertionError(f"样例「{name}」快速路径与完整校验结果不一致")
+    print(f"✅ 回复样例夹具 {len(fixture)} 条全部符合人工核对的期望决策")
+    print(f"   旧解析链结果不符的样例({len(legacy_diff)}): {', '.join(legacy_diff)}")
+
+    recorded = load_recorded_corpus()
+    for name, text, expected in recorded:
+        if _parse_or_none(text) != expected:
+            raise AssertionError(f"录制回复「{name}」的解析结果与录制时不一致")
+    if recorded:
+        print(f"✅ 录制回复 {len(recorded)} 条解析结果与录制时一致")
+    else:
+        print("⏭️ 未设置 DECISION_RECORD_FILE 或文件不存在，跳过录制回复回放")
+
+    def bench(fns, texts, rounds):
+        # 交替计时、取多次中的最好成绩，减少机器抖动对比较的影响
+        best = [math.inf] * len(fns)
+        for _ in range(15):
+            for i, fn in enumerate(fns):
+                started = time.perf_counter()
+                for _ in range(rounds):
+                    for text in texts:
+                        try:
+                            fn(text)
+                        except DecisionParseError:
+                            pass
+                best[i] = min(best[i], (time.perf_counter() - started) / rounds / len(texts) * 1e6)
+        return best
+
+    texts = [text for _, text, _ in fixture]
+    new, old = bench((parse_decision, _legacy_decision), texts, 100)
+    print(f"⏱️ 全部样例平均每条: 新解析+校验 {new:.1f}µs, 旧解析链 {old:.1f}µs")
+    # JSON 输出模式下的常态：回复即为单个标准JSON对象
+    clean = [fixture[0][1]]
+    new, old = bench((parse_decision, _legacy_decision), clean, 2000)
+    print(f"⏱️ JSON模式标准回复: 新解析+校验 {new:.1f}µs, 旧解析链 {old:.1f}µs")
+
+
+if __name__ == "__main__":
+    _self_check()
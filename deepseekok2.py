@@ -2,6 +2,8 @@ import os
 import time
 import schedule
 import gc
+import queue
+import threading
 import psutil
 
 # 可选导入openai，避免版本兼容问题
@@ -24,13 +26,37 @@ except Exception as _ccxt_err:
     _ccxt = None
     _CCXT_AVAILABLE = False
     print(f"警告: ccxt不可用，将使用回退数据: {_ccxt_err}")
+import numpy as np
 import pandas as pd
 import re
 from dotenv import load_dotenv
-import json
-import requests
 from datetime import datetime, timedelta
 load_dotenv()
+from candle_buffer import CandleBuffer, OHLCV_COLUMNS, timeframe_to_ms
+from candle_store import CANDLE_DTYPE, get_candle_store, records_to_rows
+from compact_storage import (COMPACT_CANDLE_DTYPE, COMPACT_VALUE_DTYPE, check_compact_precision,
+                             to_compact_records)
+from market_cache import market_cache
+from kline_stream import KlineStream, _WEBSOCKET_AVAILABLE
+from source_race import source_racer
+from http_client import http_get, http_post
+from synthetic_market import generate_ohlcv, to_ohlcv_rows
+from sltp_watcher import StopTakeProfitWatcher, evaluate_stop_take_profit
+from rate_limiter import ScheduledExchange, request_scheduler
+from resampler import get_resampler
+from mtf_features import MtfFeatureCache, confluence, required_bars
+from indicator_engine import StreamingIndicators
+from feature_pipeline import TECHNICAL_DATA_FEATURES, feature_pipeline
+from batch_indicators import compute_batch_technical_data
+from levels_engine import LevelsEngine
+from volatility_tracker import (VOLATILITY_CONFIG, VolatilityTracker, default_stops, load_tracker,
+                                save_tracker)
+from snapshot_cache import current_candle_key, indicator_snapshot_cache
+from decision_cache import decision_cache, market_fingerprint
+from llm_ensemble import AI_PROVIDERS, ENSEMBLE_MODES, LLMEnsemble
+from stream_json import read_completion
+from decision_parser import DecisionParseError, parse_decision, record_reply
+from prompt_layout import prompt_stats
 from paper_trading import (
     init_db,
     record_trade,
@@ -46,22 +72,16 @@ from paper_trading import (
 AI_PROVIDER = os.getenv('AI_PROVIDER', 'deepseek').lower()  # 'deepseek' 或 'qwen'
 
 if _OPENAI_AVAILABLE and OpenAI:
-    if AI_PROVIDER == 'qwen':
-        # 阿里百炼Qwen客户端
-        ai_client = OpenAI(
-            api_key=os.getenv('DASHSCOPE_API_KEY'),
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-        )
-        AI_MODEL = "qwen-max"
-        print(f"使用AI模型: 阿里百炼 {AI_MODEL}")
-    else:
-        # DeepSeek客户端（默认）
-        ai_client = OpenAI(
-            api_key=os.getenv('DEEPSEEK_API_KEY'),
-            base_url="https://api.deepseek.com"
-        )
-        AI_MODEL = "deepseek-chat"
-        print(f"使用AI模型: DeepSeek {AI_MODEL}")
+    # 阿里百炼Qwen 或 DeepSeek（默认）
+    if AI_PROVIDER not in AI_PROVIDERS:
+        AI_PROVIDER = 'deepseek'
+    _provider = AI_PROVIDERS[AI_PROVIDER]
+    ai_client = OpenAI(
+        api_key=os.getenv(_provider['api_key_env']),
+        base_url=_provider['base_url']
+    )
+    AI_MODEL = _provider['model']
+    print(f"使用AI模型: {_provider['label']} {AI_MODEL}")
     
     # 保持向后兼容
     deepseek_client = ai_client
@@ -72,8 +92,30 @@ else:
     AI_MODEL = "disabled"
     AI_PROVIDER = "none"
 
+# 多模型并发决策（AI_ENSEMBLE=deepseek,qwen 开启）：同一Prompt并发发送，截止时间内合并结果
+ai_ensemble = None
+_ensemble_names = [n.strip().lower() for n in os.getenv('AI_ENSEMBLE', '').split(',') if n.strip()]
+if _OPENAI_AVAILABLE and OpenAI and _ensemble_names:
+    _members = {}
+    for _name in _ensemble_names:
+        _spec = AI_PROVIDERS.get(_name)
+        if _spec is None or not os.getenv(_spec['api_key_env']):
+            print(f"⚠️ 多模型决策跳过 {_name}：未知模型或未配置API密钥")
+            continue
+        _members[_name] = (OpenAI(api_key=os.getenv(_spec['api_key_env']), base_url=_spec['base_url']), _spec['model'])
+    _mode = os.getenv('AI_ENSEMBLE_MODE', 'vote').lower()
+    if len(_members) >= 2 and _mode in ENSEMBLE_MODES:
+        ai_ensemble = LLMEnsemble(_members, mode=_mode,
+                                  deadline=float(os.getenv('AI_ENSEMBLE_DEADLINE', '20')))
+        print(f"使用多模型并发决策: {', '.join(_members)}（合并方式 {_mode}，截止 {ai_ensemble.deadline:g}s）")
+    else:
+        print(f"⚠️ 多模型决策需要至少2个可用模型且合并方式为 {'/'.join(ENSEMBLE_MODES)}，保持单模型")
+
 # 初始化 Binance USDT-M 永续合约交易所（延迟创建，避免本地无ccxt时报错）
 exchange = None
+# 仅用于公开行情的长期客户端（备用数据源），进程内只创建一次
+_public_exchange = None
+_public_exchange_lock = threading.Lock()
 
 # 内存优化配置 - 平衡版本（避免过度优化导致容器退出）
 MEMORY_CONFIG = {
@@ -81,7 +123,10 @@ MEMORY_CONFIG = {
     'trade_history_limit': 30,     # 恢复到合理值：30条交易历史
     'profit_curve_limit': 50,      # 恢复到合理值：50个盈亏点
     'signal_history_limit': 15,    # 恢复到合理值：15条信号历史
-    'kline_data_points': 36        # 恢复到合理值：36个K线数据点（9小时数据）
+    'kline_data_points': 36,       # 恢复到合理值：36个K线数据点（9小时数据）
+    'indicator_history_points': 200,  # 指标计算使用的本地历史K线数量（来自磁盘K线存储）
+    # 紧凑存储：K线/指标以 float32 结构化数组保存（每根K线 48 -> 28 字节），计算时升为 float64
+    'compact_candles': os.getenv('COMPACT_CANDLES', 'false').lower() == 'true'
 }
 
 # 交易参数配置 - 结合两个版本的优点
@@ -92,6 +137,9 @@ TRADE_CONFIG = {
     'timeframe': '15m',  # 使用15分钟K线
     'test_mode': False,  # 测试模式
     'data_points': MEMORY_CONFIG['kline_data_points'],  # 优化：12小时数据（48根15分钟K线）
+    'history_points': MEMORY_CONFIG['indicator_history_points'],  # 指标计算回看长度
+    # 本地K线存储：持久化已收盘K线，重启后从磁盘预热
+    'candle_store': os.getenv('CANDLE_STORE', 'true').lower() == 'true',
     'analysis_periods': {
         'short_term': 10,  # 短期均线（从20减少到10）
         'medium_term': 20,  # 中期均线（从50减少到20）
@@ -100,7 +148,23 @@ TRADE_CONFIG = {
     # 执行门槛与防频繁交易参数
     'min_confidence_for_trade': 'MEDIUM',  # 低于该信心不执行
     'signal_cooldown_minutes': 15,         # 信号冷却时间，避免频繁开仓
-    'require_signal_confirmation': True    # 首次建仓需近3次里至少2次相同信号
+    'require_signal_confirmation': True,   # 首次建仓需近3次里至少2次相同信号
+    # 多品种批量扫描：每个交易周期后一次向量化计算这些合约的技术指标（逗号分隔，留空不扫描）
+    'scan_symbols': [s.strip() for s in os.getenv('SCAN_SYMBOLS', '').split(',') if s.strip()],
+    # WebSocket流模式：K线收盘即触发决策（需安装 websocket-client）
+    'stream_mode': os.getenv('STREAM_MODE', 'false').lower() == 'true',
+    # 数据源对冲竞速：统一截止时间与补发间隔（秒）
+    'source_deadline_seconds': 10.0,
+    'source_hedge_delay_seconds': 1.5,
+    # 流式调用模型：决策JSON完整即关闭流，不等待其后的说明文字
+    'ai_stream': os.getenv('AI_STREAM', 'false').lower() == 'true',
+    # 接口侧JSON输出模式（response_format=json_object），回复保证为单个JSON对象
+    'ai_json_mode': os.getenv('AI_JSON_MODE', 'true').lower() == 'true',
+    # 多周期趋势：由交易周期K线在本地合成的高周期（无需额外请求）
+    'mtf_timeframes': ['1h', '4h', '1d'],
+    # 回退模拟数据：无真实价格时的基础价格与行情模型（gbm / regime）
+    'fallback_base_price': 68000.0,
+    'fallback_model': 'regime'
 }
 
 # 全局变量存储历史数据
@@ -108,6 +172,48 @@ price_history = []
 signal_history = []
 position = None
 
+# K线环形缓冲区：(数据源, 符号, 周期) -> CandleBuffer，跨周期复用
+_candle_buffers = {}
+# 同一 (数据源, 符号, 周期) 的缓冲区/存储读写串行化（竞速中落败或超时的线程仍在运行）
+_candle_locks = {}
+_candle_locks_guard = threading.Lock()
+_compact_precision_checked = False
+
+# 高周期特征缓存：(数据源, 符号, 周期) -> MtfFeatureCache，只在对应周期K线收盘时重算
+_mtf_feature_caches = {}
+
+# 流式指标引擎：(符号, 周期) -> StreamingIndicators，每根新收盘K线 O(1) 更新
+_indicator_engines = {}
+_indicator_lock = threading.Lock()
+
+# 支撑阻力位引擎：(符号, 周期) -> LevelsEngine，跨周期缓存枢轴点与成交量分布
+_levels_engines = {}
+_levels_lock = threading.Lock()
+
+# 波动率跟踪器：(符号, 周期) -> VolatilityTracker，ATR/已实现波动率/波动状态，状态落盘跨重启保留
+_volatility_trackers = {}
+_volatility_lock = threading.Lock()
+
+# 各消费方读取的指标（特征管线与流式指标引擎都只计算这些及其依赖）
+PROMPT_FEATURES = TECHNICAL_DATA_FEATURES
+TREND_FEATURES = ('sma_20', 'sma_50', 'macd', 'macd_signal', 'rsi')
+LEVEL_FEATURES = ('bb_upper', 'bb_lower', 'recent_high', 'recent_low')
+PRICE_DATA_FEATURES = tuple(dict.fromkeys(PROMPT_FEATURES + TREND_FEATURES + LEVEL_FEATURES))
+
+# WebSocket K线流（流模式下启用）与收盘事件队列
+_kline_stream = None
+_stream_events = queue.Queue(maxsize=1)
+
+# 交易锁：下单/平仓记录、持仓与价位登记串行化（交易主循环与止盈止损监视线程共用）
+_trade_lock = threading.RLock()
+
+# 止盈止损监视器：两次决策之间按标记价格检查开仓价位
+sltp_watcher = StopTakeProfitWatcher(
+    price_source=lambda: get_mark_price(),
+    on_trigger=lambda *args: _on_sltp_trigger(*args),
+    interval=float(os.getenv('SLTP_CHECK_INTERVAL', '3'))
+)
+
 # Web展示相关的全局数据存储
 web_data = {
     'account_info': {},
@@ -122,10 +228,15 @@ web_data = {
     },
     'kline_data': [],
     'data_source': None,
+    'data_sources': {},  # 各数据源成功率/延迟统计
     'is_fallback_data': False,
     'timeframe': None,
     'profit_curve': [],  # 收益曲线数据
     'last_update': None,
+    'decision_cache': {},  # 决策缓存命中率/节省的模型调用时间
+    'ai_ensemble': {},     # 多模型并发决策：各模型延迟/一致率
+    'prompt': {},          # Prompt token 预算与前缀缓存命中
+    'symbol_scan': {},     # 多品种批量扫描结果（SCAN_SYMBOLS）
     'ai_model_info': {
         'provider': AI_PROVIDER,
         'model': AI_MODEL,
@@ -157,26 +268,32 @@ def setup_exchange():
                 secret = os.getenv('BINANCE_SECRET_KEY')
                 
                 if api_key and secret and not TRADE_CONFIG['test_mode']:
-                    # 实盘模式：使用API密钥
-                    exchange = _ccxt.binanceusdm({
+                    # 实盘模式：使用API密钥（所有请求经共享调度器，统一限频预算）
+                    exchange = ScheduledExchange(_ccxt.binanceusdm({
                         'apiKey': api_key,
                         'secret': secret,
                         'enableRateLimit': True,
                         'options': {'defaultType': 'future'}
-                    })
+                    }))
                     print("已初始化 Binance USDT-M 期货接口（实盘模式）")
                 else:
                     # 模拟模式：不使用API密钥，仅用于获取公开数据
-                    exchange = _ccxt.binanceusdm({
+                    exchange = ScheduledExchange(_ccxt.binanceusdm({
                         'enableRateLimit': True,
                         'options': {'defaultType': 'future'}
-                    })
+                    }))
                     print("已初始化 Binance USDT-M 期货接口（模拟模式，仅公开数据）")
                     
             except Exception as e_init:
                 print(f"初始化交易所失败: {e_init}")
                 return False
 
+        # 市场元数据走缓存（内存/磁盘，按TTL刷新）
+        try:
+            market_cache.ensure(exchange)
+        except Exception as e_markets:
+            print(f"加载市场失败(忽略继续): {e_markets}")
+
         # 只有在实盘模式且有API密钥时才设置杠杆和保证金模式
         if not TRADE_CONFIG['test_mode'] and hasattr(exchange, 'apiKey') and exchange.apiKey:
             # 设置杠杆（Binance Futures）
@@ -261,65 +378,25 @@ def safe_fetch_balance():
         return simulated_balance
 
 
-def calculate_technical_indicators(df):
-    """计算技术指标 - 来自第一个策略"""
+def get_support_resistance_levels(df, lookback=20, latest=None):
+    """计算支撑阻力位（latest: 流式指标引擎的最新快照，提供时不再扫描DataFrame）"""
     try:
-        # 移动平均线
-        df['sma_5'] = df['close'].rolling(window=5, min_periods=1).mean()
-        df['sma_20'] = df['close'].rolling(window=20, min_periods=1).mean()
-        df['sma_50'] = df['close'].rolling(window=50, min_periods=1).mean()
-
-        # 指数移动平均线
-        df['ema_12'] = df['close'].ewm(span=12).mean()
-        df['ema_26'] = df['close'].ewm(span=26).mean()
-        df['macd'] = df['ema_12'] - df['ema_26']
-        df['macd_signal'] = df['macd'].ewm(span=9).mean()
-        df['macd_histogram'] = df['macd'] - df['macd_signal']
-
-        # 相对强弱指数 (RSI)
-        delta = df['close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
-        rs = gain / loss
-        df['rsi'] = 100 - (100 / (1 + rs))
-
-        # 布林带
-        df['bb_middle'] = df['close'].rolling(20).mean()
-        bb_std = df['close'].rolling(20).std()
-        df['bb_upper'] = df['bb_middle'] + (bb_std * 2)
-        df['bb_lower'] = df['bb_middle'] - (bb_std * 2)
-        df['bb_position'] = (df['close'] - df['bb_lower']) / (df['bb_upper'] - df['bb_lower'])
-
-        # 成交量均线
-        df['volume_ma'] = df['volume'].rolling(20).mean()
-        df['volume_ratio'] = df['volume'] / df['volume_ma']
-
-        # 支撑阻力位
-        df['resistance'] = df['high'].rolling(20).max()
-        df['support'] = df['low'].rolling(20).min()
-
-        # 填充NaN值
-        df = df.bfill().ffill()
-
-        return df
-    except Exception as e:
-        print(f"技术指标计算失败: {e}")
-        return df
-
-
-def get_support_resistance_levels(df, lookback=20):
-    """计算支撑阻力位"""
-    try:
-        recent_high = df['high'].tail(lookback).max()
-        recent_low = df['low'].tail(lookback).min()
-        current_price = df['close'].iloc[-1]
+        if latest is not None:
+            recent_high = latest['recent_high']
+            recent_low = latest['recent_low']
+            current_price = latest['close']
+        else:
+            recent_high = df['high'].tail(lookback).max()
+            recent_low = df['low'].tail(lookback).min()
+            current_price = df['close'].iloc[-1]
 
         resistance_level = recent_high
         support_level = recent_low
 
         # 动态支撑阻力（基于布林带）
-        bb_upper = df['bb_upper'].iloc[-1]
-        bb_lower = df['bb_lower'].iloc[-1]
+        current = latest if latest is not None else df.iloc[-1]
+        bb_upper = current['bb_upper']
+        bb_lower = current['bb_lower']
 
         return {
             'static_resistance': resistance_level,
@@ -354,7 +431,7 @@ def get_sentiment_indicators():
         }
 
         headers = {"Content-Type": "application/json", "X-API-KEY": API_KEY}
-        response = requests.post(API_URL, json=request_body, headers=headers)
+        response = http_post(API_URL, json=request_body, headers=headers)
 
         if response.status_code == 200:
             data = response.json()
@@ -409,17 +486,19 @@ def get_sentiment_indicators():
         return None
 
 
-def get_market_trend(df):
-    """判断市场趋势"""
+def get_market_trend(df, mtf_features=None, latest=None):
+    """判断市场趋势（mtf_features: {周期: 高周期趋势/动量特征}，由 get_mtf_features 提供；
+    latest: 流式指标引擎的最新快照，提供时直接使用）"""
     try:
-        current_price = df['close'].iloc[-1]
+        current = latest if latest is not None else df.iloc[-1]
+        current_price = current['close']
 
         # 多时间框架趋势分析
-        trend_short = "上涨" if current_price > df['sma_20'].iloc[-1] else "下跌"
-        trend_medium = "上涨" if current_price > df['sma_50'].iloc[-1] else "下跌"
+        trend_short = "上涨" if current_price > current['sma_20'] else "下跌"
+        trend_medium = "上涨" if current_price > current['sma_50'] else "下跌"
 
         # MACD趋势
-        macd_trend = "bullish" if df['macd'].iloc[-1] > df['macd_signal'].iloc[-1] else "bearish"
+        macd_trend = "bullish" if current['macd'] > current['macd_signal'] else "bearish"
 
         # 综合趋势判断
         if trend_short == "上涨" and trend_medium == "上涨":
@@ -429,301 +508,627 @@ def get_market_trend(df):
         else:
             overall_trend = "震荡整理"
 
+        # 高周期趋势与共振（本地重采样，K线不足时跳过）
+        multi_timeframe = {tf: f for tf, f in (mtf_features or {}).items() if f}
+
         return {
             'short_term': trend_short,
             'medium_term': trend_medium,
             'macd': macd_trend,
             'overall': overall_trend,
-            'rsi_level': df['rsi'].iloc[-1]
+            'rsi_level': current['rsi'],
+            'multi_timeframe': multi_timeframe,
+            'mtf_confluence': confluence(multi_timeframe)
         }
     except Exception as e:
         print(f"趋势分析失败: {e}")
         return {}
 
 
+def _parse_binance_price(data):
+    return float(data['price'])
+
+
+def _parse_coinbase_price(data):
+    return float(data['data']['rates']['USD'])
+
+
+def _parse_coingecko_price(data):
+    return float(data['bitcoin']['usd'])
+
+
+# 公共价格API：(名称, 地址, 解析函数)
+PRICE_APIS = [
+    ('Binance', "https://api.binance.com/api/v3/ticker/price?symbol=BTCUSDT", _parse_binance_price),
+    ('Coinbase', "https://api.coinbase.com/v2/exchange-rates?currency=BTC", _parse_coinbase_price),
+    ('CoinGecko', "https://api.coingecko.com/api/v3/simple/price?ids=bitcoin&vs_currencies=usd", _parse_coingecko_price),
+]
+
+
+def _fetch_api_price(api_url, parser):
+    response = http_get(api_url, timeout=5)
+    response.raise_for_status()
+    return parser(response.json())
+
+
 def get_real_btc_price():
-    """获取实时BTC价格，用于fallback数据"""
+    """获取实时BTC现货价格（多个公共API对冲竞速，取最先返回的有效价格）；全部失败返回None"""
     try:
-        # 尝试从多个公共API获取实时BTC价格
-        apis = [
-            "https://api.binance.com/api/v3/ticker/price?symbol=BTCUSDT",
-            "https://api.coinbase.com/v2/exchange-rates?currency=BTC",
-            "https://api.coingecko.com/api/v3/simple/price?ids=bitcoin&vs_currencies=usd"
+        candidates = [
+            (name, lambda url=url, parser=parser: _fetch_api_price(url, parser))
+            for name, url, parser in PRICE_APIS
         ]
-        
-        for api_url in apis:
-            try:
-                response = requests.get(api_url, timeout=5)
-                if response.status_code == 200:
-                    data = response.json()
-                    
-                    if "binance" in api_url:
-                        price = float(data['price'])
-                        print(f"✅ 从Binance获取实时BTC价格: ${price:,.2f}")
-                        return price
-                    elif "coinbase" in api_url:
-                        price = float(data['data']['rates']['USD'])
-                        print(f"✅ 从Coinbase获取实时BTC价格: ${price:,.2f}")
-                        return price
-                    elif "coingecko" in api_url:
-                        price = float(data['bitcoin']['usd'])
-                        print(f"✅ 从CoinGecko获取实时BTC价格: ${price:,.2f}")
-                        return price
-            except Exception as e:
-                print(f"⚠️ API {api_url} 失败: {e}")
-                continue
-                
-        print("⚠️ 所有价格API都失败，使用默认价格")
-        return 68000  # 最后的备用价格
-        
+        name, price = source_racer.race(
+            candidates, deadline=5.0,
+            hedge_delay=TRADE_CONFIG['source_hedge_delay_seconds'],
+            validate=lambda p: p is not None and p > 0
+        )
+        if price:
+            return price
+        print("⚠️ 所有价格API都失败")
     except Exception as e:
         print(f"⚠️ 获取实时价格失败: {e}")
-        return 68000
+    return None
+
 
 def generate_fallback_ohlcv_data():
-    """生成fallback OHLCV数据，用于网络连接失败时"""
-    import random
-    import numpy as np
-    
+    """生成fallback OHLCV数据，用于网络连接失败时（本地向量化合成，不访问网络）"""
     print("🔄 网络连接失败，使用本地模拟数据...")
-    
-    # 获取实时BTC价格作为基础价格
-    base_price = get_real_btc_price()
-    data_points = TRADE_CONFIG['data_points']
-    
-    # 生成时间序列
-    now = datetime.now()
-    timestamps = []
-    for i in range(data_points):
-        timestamp = now - timedelta(minutes=15 * (data_points - 1 - i))
-        timestamps.append(int(timestamp.timestamp() * 1000))
-    
-    # 生成OHLCV数据（模拟真实的价格波动）
-    ohlcv = []
-    current_price = base_price
-    
-    for i, timestamp in enumerate(timestamps):
-        # 模拟价格波动（-2% 到 +2%）
-        price_change = random.uniform(-0.02, 0.02)
-        current_price = current_price * (1 + price_change)
-        
-        # 生成OHLC
-        volatility = random.uniform(0.005, 0.015)  # 0.5% - 1.5% 波动
-        high = current_price * (1 + volatility)
-        low = current_price * (1 - volatility)
-        open_price = current_price * random.uniform(0.995, 1.005)
-        close_price = current_price
-        
-        # 生成成交量
-        volume = random.uniform(100, 1000)
-        
-        ohlcv.append([timestamp, open_price, high, low, close_price, volume])
-    
-    return ohlcv
 
-def get_btc_ohlcv_enhanced():
-    """增强版：获取BTC K线数据并计算技术指标（以 Binance FAPI 为主）"""
+    # 以最近一次真实价格为基础价格，没有时使用配置的默认价格
+    base_price = to_float(web_data.get('current_price'), 0.0) or TRADE_CONFIG['fallback_base_price']
+    seed = os.getenv('SYNTHETIC_SEED')
+    arrays = generate_ohlcv(
+        TRADE_CONFIG['history_points'],
+        timeframe=TRADE_CONFIG['timeframe'],
+        start_price=base_price,
+        model=TRADE_CONFIG['fallback_model'],
+        seed=int(seed) if seed else None
+    )
+    return to_ohlcv_rows(arrays)
+
+
+def get_public_exchange():
+    """获取长期复用的 Binance USDM 公开行情客户端（备用数据源）"""
+    global _public_exchange
+    with _public_exchange_lock:
+        if _public_exchange is None:
+            _public_exchange = ScheduledExchange(_ccxt.binanceusdm({
+                'enableRateLimit': True,
+                'options': {'defaultType': 'future'}
+            }))
     try:
-        # 本地无ccxt时，直接使用fallback数据
-        if not _CCXT_AVAILABLE:
-            fallback_ohlcv = generate_fallback_ohlcv_data()
-            df = pd.DataFrame(fallback_ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df = calculate_technical_indicators(df)
+        market_cache.ensure(_public_exchange)
+    except Exception as be:
+        print(f"Binance市场加载失败(忽略继续): {be}")
+    return _public_exchange
 
-            current_data = df.iloc[-1]
-            previous_data = df.iloc[-2]
 
-            trend_analysis = get_market_trend(df)
-            levels_analysis = get_support_resistance_levels(df)
+def new_candle_buffer(capacity, timeframe):
+    """按内存配置创建K线缓冲区（紧凑模式下价格/成交量为 float32）"""
+    value_dtype = COMPACT_VALUE_DTYPE if MEMORY_CONFIG['compact_candles'] else np.float64
+    return CandleBuffer(capacity, timeframe, value_dtype=value_dtype)
 
-            return {
-                'price': current_data['close'],
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'high': current_data['high'],
-                'low': current_data['low'],
-                'volume': current_data['volume'],
-                'timeframe': TRADE_CONFIG['timeframe'],
-                'price_change': ((current_data['close'] - previous_data['close']) / previous_data['close']) * 100,
-                'kline_data': df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].tail(10).to_dict('records'),
-                'technical_data': {
-                    'sma_5': current_data.get('sma_5', 0),
-                    'sma_20': current_data.get('sma_20', 0),
-                    'sma_50': current_data.get('sma_50', 0),
-                    'rsi': current_data.get('rsi', 0),
-                    'macd': current_data.get('macd', 0),
-                    'macd_signal': current_data.get('macd_signal', 0),
-                    'macd_histogram': current_data.get('macd_histogram', 0),
-                    'bb_upper': current_data.get('bb_upper', 0),
-                    'bb_lower': current_data.get('bb_lower', 0),
-                    'bb_position': current_data.get('bb_position', 0),
-                    'volume_ratio': current_data.get('volume_ratio', 0)
-                },
-                'trend_analysis': trend_analysis,
-                'levels_analysis': levels_analysis,
-                'full_data': df,
-                'data_source': 'fallback-local',
-                'is_fallback_data': True
-            }
 
-        # 预加载交易所市场，避免符号不识别（exchange可能未初始化）
-        if exchange:
-            try:
-                exchange.load_markets()
-            except Exception as e:
-                print(f"加载市场失败(忽略继续): {e}")
+def open_candle_store(source_id, symbol, timeframe):
+    """按内存配置打开本地K线存储（紧凑模式使用单独的 float32 文件）"""
+    dtype = COMPACT_CANDLE_DTYPE if MEMORY_CONFIG['compact_candles'] else CANDLE_DTYPE
+    return get_candle_store(source_id, symbol, timeframe, dtype=dtype)
 
-        ohlcv = None
-        data_source = None
 
-        # 主数据源：Binance USDM 永续（优先使用配置符号）
+def verify_compact_precision(rows):
+    """紧凑模式下，首次拿到真实K线时检查 float32 存储对决策指标的精度影响（每进程一次）"""
+    global _compact_precision_checked
+    # 需要足够长的原始（float64）K线才有意义；增量拉取的少量K线跳过，等下一次整段拉取
+    if not MEMORY_CONFIG['compact_candles'] or _compact_precision_checked or len(rows) < 20:
+        return
+    _compact_precision_checked = True
+    try:
+        ok, failed = check_compact_precision(rows)
+    except Exception as e:
+        print(f"紧凑存储精度检查失败(忽略继续): {e}")
+        return
+    if ok:
+        print("✅ 紧凑K线存储精度检查通过")
+    else:
+        print("⚠️ 紧凑K线存储精度超出容差，建议关闭 COMPACT_CANDLES: " +
+              ", ".join(f"{name}(误差{err:.6g}/容差{tol:.6g})" for name, (err, tol) in failed.items()))
+
+
+def candle_lock(source_id, symbol, timeframe):
+    """指定数据源/符号/周期的K线读写锁（可重入）"""
+    key = (source_id, symbol, timeframe)
+    with _candle_locks_guard:
+        lock = _candle_locks.get(key)
+        if lock is None:
+            lock = threading.RLock()
+            _candle_locks[key] = lock
+        return lock
+
+
+def get_candle_buffer(source_id, symbol, timeframe):
+    """获取（或创建）指定数据源/符号/周期的K线缓冲区"""
+    key = (source_id, symbol, timeframe)
+    with _candle_locks_guard:
+        buf = _candle_buffers.get(key)
+        if buf is None:
+            buf = new_candle_buffer(TRADE_CONFIG['data_points'], timeframe)
+            _candle_buffers[key] = buf
+        return buf
+
+
+def backfill_points(symbol, timeframe):
+    """本地K线存储需覆盖的基础K线数：交易品种/周期还要满足各高周期特征的完整回看（日线约35天）"""
+    points = TRADE_CONFIG['history_points']
+    if symbol != TRADE_CONFIG['symbol'] or timeframe != TRADE_CONFIG['timeframe']:
+        return points
+    base_ms = timeframe_to_ms(timeframe)
+    # 首个高周期桶通常从中间开始会被丢弃，多补一个桶
+    for tf in TRADE_CONFIG['mtf_timeframes']:
+        points = max(points, timeframe_to_ms(tf) // base_ms * (required_bars() + 1))
+    return points
+
+
+def backfill_candle_store(client, symbol, timeframe=None, source_id=None):
+    """缓冲区为空或与最新行情之间有缺口时，分页回填本地K线存储
+
+    回填可能需要数千根K线、数秒时间，只在数据源竞速之外调用（启动流模式前、每周期竞速前），
+    竞速中的增量拉取不再回填。
+    """
+    timeframe = timeframe or TRADE_CONFIG['timeframe']
+    source_id = source_id or getattr(client, 'id', 'exchange')
+    if not TRADE_CONFIG['candle_store']:
+        return 0
+    with candle_lock(source_id, symbol, timeframe):
+        if not get_candle_buffer(source_id, symbol, timeframe).is_stale():
+            return 0
         try:
-            ohlcv = exchange.fetch_ohlcv(
-                TRADE_CONFIG['symbol'], TRADE_CONFIG['timeframe'],
-                limit=TRADE_CONFIG['data_points']
-            )
-            data_source = getattr(exchange, 'id', 'binanceusdm')
-        except Exception as e1:
-            print(f"fetch_ohlcv失败({TRADE_CONFIG['symbol']}): {e1}，尝试现货BTC/USDT")
+            return open_candle_store(source_id, symbol, timeframe).backfill(client, backfill_points(symbol, timeframe))
+        except Exception as e_backfill:
+            print(f"K线存储回填失败(忽略继续): {e_backfill}")
+            return 0
+
+
+def fetch_ohlcv_incremental(client, symbol, timeframe=None, source_id=None):
+    """增量获取K线：首次从磁盘预热后整段拉取，之后从最新一根K线（可能尚未收盘）开始重新请求"""
+    timeframe = timeframe or TRADE_CONFIG['timeframe']
+    source_id = source_id or getattr(client, 'id', 'exchange')
+    with candle_lock(source_id, symbol, timeframe):
+        buf = get_candle_buffer(source_id, symbol, timeframe)
+        store = open_candle_store(source_id, symbol, timeframe) if TRADE_CONFIG['candle_store'] else None
+
+        if buf.is_stale():
+            buf.clear()
+            if store is not None:
+                buf.update(store.tail_rows(buf.capacity))
+
+        if buf.is_stale():
+            rows = client.fetch_ohlcv(symbol, timeframe, limit=TRADE_CONFIG['data_points'])
+        else:
+            rows = client.fetch_ohlcv(symbol, timeframe, since=buf.since(), limit=TRADE_CONFIG['data_points'])
+        verify_compact_precision(rows)
+        buf.update(rows)
+        if len(buf) == 0:
+            raise ValueError(f"{symbol} 未返回K线数据")
+        # 存储与缓冲区之间有缺口（未回填）时不写入，避免存储中留下断档，等待下次回填补齐
+        if store is not None and (store.last_ts is None or int(buf.timestamps()[0]) <= store.last_ts + buf.timeframe_ms):
             try:
-                ohlcv = exchange.fetch_ohlcv(
-                    'BTC/USDT', TRADE_CONFIG['timeframe'],
-                    limit=TRADE_CONFIG['data_points']
-                )
-                data_source = getattr(exchange, 'id', 'binance')
-            except Exception as e2:
-                print(f"获取增强K线数据失败: {e2}")
+                store.sync_from_buffer(buf)
+            except Exception as e_store:
+                print(f"写入K线存储失败(忽略继续): {e_store}")
+        return buf
+
+
+def load_ohlcv_history(client, symbol, timeframe=None, source_id=None):
+    """增量获取K线，并拼接本地存储中的更长历史，用于指标计算（ccxt列表格式）"""
+    timeframe = timeframe or TRADE_CONFIG['timeframe']
+    source_id = source_id or getattr(client, 'id', 'exchange')
+    with candle_lock(source_id, symbol, timeframe):
+        buf = fetch_ohlcv_incremental(client, symbol, timeframe, source_id)
+        rows = buf.to_ohlcv()
+        if not TRADE_CONFIG['candle_store']:
+            return rows
+        store = open_candle_store(source_id, symbol, timeframe)
+        history = store.read(until=rows[0][0])
+        need = TRADE_CONFIG['history_points'] - len(rows)
+        # 存储历史与窗口不相接（尚未回填缺口）时不拼接
+        if need <= 0 or len(history) == 0 or int(history['timestamp'][-1]) + buf.timeframe_ms < rows[0][0]:
+            return rows
+        return records_to_rows(history[-need:]) + rows
+
+
+def ohlcv_to_dataframe(ohlcv):
+    """将K线缓冲区或 ccxt 列表格式转换为DataFrame"""
+    if isinstance(ohlcv, CandleBuffer):
+        df = pd.DataFrame(ohlcv.arrays(), columns=OHLCV_COLUMNS)
+    else:
+        df = pd.DataFrame(ohlcv, columns=OHLCV_COLUMNS)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    return df
 
-        # 如果主路径成功，直接返回
-        if ohlcv:
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df = calculate_technical_indicators(df)
 
-            current_data = df.iloc[-1]
-            previous_data = df.iloc[-2]
+def scan_symbols_technical_data(symbols, client=None, timeframe=None):
+    """批量扫描多个USDM永续合约：逐个增量拉取K线（共享限频预算），指标一次向量化计算
 
-            trend_analysis = get_market_trend(df)
-            levels_analysis = get_support_resistance_levels(df)
+    返回 {符号: {'price', 'technical_data', 'feature_warnings'}}，拉取失败的符号跳过
+    """
+    client = client or exchange or get_public_exchange()
+    symbol_data = {}
+    for symbol in symbols:
+        try:
+            symbol_data[symbol] = fetch_ohlcv_incremental(client, symbol, timeframe).arrays()
+        except Exception as e:
+            print(f"扫描 {symbol} K线失败(跳过): {e}")
+    return compute_batch_technical_data(symbol_data)
+
+
+def update_symbol_scan():
+    """扫描 SCAN_SYMBOLS 中的合约，结果写入 web_data['symbol_scan']（未配置或无ccxt时跳过）"""
+    if not TRADE_CONFIG['scan_symbols'] or not _CCXT_AVAILABLE:
+        return None
+    started = time.time()
+    try:
+        results = scan_symbols_technical_data(TRADE_CONFIG['scan_symbols'])
+    except Exception as e:
+        print(f"多品种扫描失败(忽略继续): {e}")
+        return None
+    web_data['symbol_scan'] = {
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'timeframe': TRADE_CONFIG['timeframe'],
+        'symbols': results,
+        'failed': [s for s in TRADE_CONFIG['scan_symbols'] if s not in results],
+        'elapsed_ms': round((time.time() - started) * 1000, 1),
+    }
+    print(f"🔎 多品种扫描完成: {len(results)}/{len(TRADE_CONFIG['scan_symbols'])} 个品种")
+    return results
 
-            return {
-                'price': current_data['close'],
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'high': current_data['high'],
-                'low': current_data['low'],
-                'volume': current_data['volume'],
-                'timeframe': TRADE_CONFIG['timeframe'],
-                'price_change': ((current_data['close'] - previous_data['close']) / previous_data['close']) * 100,
-                'kline_data': df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].tail(10).to_dict('records'),
-                'technical_data': {
-                    'sma_5': current_data.get('sma_5', 0),
-                    'sma_20': current_data.get('sma_20', 0),
-                    'sma_50': current_data.get('sma_50', 0),
-                    'rsi': current_data.get('rsi', 0),
-                    'macd': current_data.get('macd', 0),
-                    'macd_signal': current_data.get('macd_signal', 0),
-                    'macd_histogram': current_data.get('macd_histogram', 0),
-                    'bb_upper': current_data.get('bb_upper', 0),
-                    'bb_lower': current_data.get('bb_lower', 0),
-                    'bb_position': current_data.get('bb_position', 0),
-                    'volume_ratio': current_data.get('volume_ratio', 0)
-                },
-                'trend_analysis': trend_analysis,
-                'levels_analysis': levels_analysis,
-                'full_data': df,
-                'data_source': data_source
-            }
 
-        # 备用数据源：直接使用 Binance USDM
+def get_mtf_features(rows, symbol, source_id=None):
+    """将交易周期K线增量并入本地重采样器，返回各高周期的趋势/动量特征
+
+    重采样器按 (数据源, 符号, 周期) 区分，不同来源/品种的K线不会混入同一组高周期K线；
+    首次使用时，先用同一数据源本地K线存储中的更长历史预热（日线需要较多基础K线）；
+    特征只在对应高周期有新K线收盘时重算。
+    """
+    key = (source_id, symbol, TRADE_CONFIG['timeframe'])
+    resampler = get_resampler(
+        key, TRADE_CONFIG['timeframe'], TRADE_CONFIG['mtf_timeframes'],
+        capacity=TRADE_CONFIG['history_points']
+    )
+    if resampler.last_base_ts is None and TRADE_CONFIG['candle_store'] and source_id and rows:
         try:
-            print("🔁 尝试使用Binance USDT-M期货数据作为备用数据源")
-            binance = _ccxt.binanceusdm({'options': {'defaultType': 'future'}})
+            store = open_candle_store(source_id, symbol, TRADE_CONFIG['timeframe'])
+            resampler.update(records_to_rows(store.read(until=rows[0][0])))
+        except Exception as e:
+            print(f"读取K线存储预热高周期失败(忽略继续): {e}")
+    resampler.update(rows)
+    cache = _mtf_feature_caches.setdefault(key, MtfFeatureCache())
+    return cache.get(resampler, TRADE_CONFIG['mtf_timeframes'])
+
+
+def split_closed_candles(rows, tf_ms, now_ms=None):
+    """拆分为 (已收盘K线列表, 未收盘的最后一根或None)"""
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    closed = [r for r in rows if r[0] + tf_ms <= now_ms]
+    forming = rows[-1] if rows and rows[-1][0] + tf_ms > now_ms else None
+    return closed, forming
+
+
+def get_latest_indicators(rows, symbol, timeframe=None, now_ms=None):
+    """将K线增量喂入流式指标引擎，返回最后一行（含未收盘K线）的指标快照
+
+    已收盘K线只提交一次；未收盘K线仅预览，不改变引擎状态。
+    引擎为空或与输入之间存在缺口时，用本次输入的已收盘K线重建。
+    """
+    timeframe = timeframe or TRADE_CONFIG['timeframe']
+    tf_ms = timeframe_to_ms(timeframe)
+    closed, forming = split_closed_candles(rows, tf_ms, now_ms)
+
+    with _indicator_lock:
+        engine = _indicator_engines.get((symbol, timeframe))
+        if engine is None:
+            engine = StreamingIndicators(features=PRICE_DATA_FEATURES)
+            _indicator_engines[(symbol, timeframe)] = engine
+        if closed and (engine.last_ts is None or closed[0][0] > engine.last_ts + tf_ms):
+            engine.reset()
+        for row in closed:
+            if engine.last_ts is None or row[0] > engine.last_ts:
+                engine.update(row)
+        if forming is not None and (engine.last_ts is None or forming[0] > engine.last_ts):
+            return engine.preview(forming)
+        return engine.snapshot()
+
+
+def get_key_levels(rows, symbol, timeframe=None, source_id=None, now_ms=None):
+    """增量更新枢轴点/成交量分布引擎，返回当前价格上下方的关键价位
+
+    引擎为空或出现缺口时，优先用本地K线存储中的更长历史重建（source_id 对应存储目录）
+    """
+    timeframe = timeframe or TRADE_CONFIG['timeframe']
+    tf_ms = timeframe_to_ms(timeframe)
+    closed, _ = split_closed_candles(rows, tf_ms, now_ms)
+    if not rows:
+        return {}
+
+    with _levels_lock:
+        engine = _levels_engines.get((symbol, timeframe))
+        if engine is None:
+            engine = LevelsEngine()
+            _levels_engines[(symbol, timeframe)] = engine
+        if closed and (engine.last_ts is None or closed[0][0] > engine.last_ts + tf_ms):
+            engine.reset()
+            if TRADE_CONFIG['candle_store'] and source_id:
+                try:
+                    store = open_candle_store(source_id, symbol, timeframe)
+                    history = store.read(until=closed[0][0])[-engine.config['history']:]
+                    engine.warm(history['timestamp'], history['high'], history['low'],
+                                history['close'], history['volume'])
+                except Exception as e:
+                    print(f"读取K线存储构建支撑阻力位失败(忽略继续): {e}")
+        for row in closed:
+            if engine.last_ts is None or row[0] > engine.last_ts:
+                engine.update(row)
+        return engine.levels(float(rows[-1][4]))
+
+
+def get_volatility_state(rows, symbol, timeframe=None, source_id=None, now_ms=None):
+    """增量更新波动率跟踪器，返回 ATR/已实现波动率/波动状态快照
+
+    首次使用时从磁盘恢复上次的状态；状态与输入之间有缺口时，优先用本地K线存储中的更长历史重建。
+    有新的已收盘K线提交时写回磁盘。
+    """
+    timeframe = timeframe or TRADE_CONFIG['timeframe']
+    tf_ms = timeframe_to_ms(timeframe)
+    closed, _ = split_closed_candles(rows, tf_ms, now_ms)
+
+    with _volatility_lock:
+        tracker = _volatility_trackers.get((symbol, timeframe))
+        if tracker is None:
+            tracker = load_tracker(symbol, timeframe)
+            _volatility_trackers[(symbol, timeframe)] = tracker
+        if closed and (tracker.last_ts is None or closed[0][0] > tracker.last_ts + tf_ms):
+            tracker.reset()
+            if TRADE_CONFIG['candle_store'] and source_id:
+                try:
+                    store = open_candle_store(source_id, symbol, timeframe)
+                    history = store.read(until=closed[0][0])[-TRADE_CONFIG['history_points']:]
+                    if len(history):
+                        tracker.warm(history['high'], history['low'], history['close'],
+                                     last_ts=history['timestamp'][-1])
+                except Exception as e:
+                    print(f"读取K线存储构建波动率状态失败(忽略继续): {e}")
+        committed = 0
+        for row in closed:
+            if tracker.last_ts is None or row[0] > tracker.last_ts:
+                tracker.update(row)
+                committed += 1
+        if committed:
+            save_tracker(tracker, symbol)
+        return tracker.state()
+
+
+def build_price_data(df, mtf_features=None, indicators=None, key_levels=None, volatility=None, **extra):
+    """组装 price_data 结构
+
+    indicators: 流式指标引擎的最新快照（实时数据路径，引擎只维护 PRICE_DATA_FEATURES 所需状态）；
+                为None时由特征管线只计算所需指标
+    key_levels: 枢轴点/成交量分布价位（get_key_levels），并入 levels_analysis
+    volatility: 波动率跟踪器快照（get_volatility_state）；为None时用本段K线临时计算
+    """
+    short = feature_pipeline.window_report(PRICE_DATA_FEATURES, len(df))
+    if indicators is None:
+        columns = {col: df[col].to_numpy(dtype=np.float64) for col in ('open', 'high', 'low', 'close', 'volume')}
+        indicators, _ = feature_pipeline.latest(columns, PRICE_DATA_FEATURES)
+        indicators.update({col: arr[-1] for col, arr in columns.items()})
+    if short:
+        print("⚠️ K线数量不足，以下指标窗口不完整: " +
+              ", ".join(f"{name}(需{need}根/现{have}根)" for name, (need, have) in short.items()))
+    current_data = indicators
+    previous_data = df.iloc[-2]
+
+    trend_analysis = get_market_trend(df, mtf_features, latest=indicators)
+    levels_analysis = get_support_resistance_levels(df, latest=indicators)
+    if key_levels:
+        levels_analysis.update(key_levels)
+    if volatility is None:
+        tracker = VolatilityTracker(TRADE_CONFIG['timeframe'])
+        tracker.warm(df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy())
+        volatility = tracker.state()
+
+    price_data = {
+        'price': current_data['close'],
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'high': current_data['high'],
+        'low': current_data['low'],
+        'volume': current_data['volume'],
+        'timeframe': TRADE_CONFIG['timeframe'],
+        'price_change': ((current_data['close'] - previous_data['close']) / previous_data['close']) * 100,
+        'kline_data': df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].tail(10).to_dict('records'),
+        'technical_data': {name: current_data.get(name, 0) for name in TECHNICAL_DATA_FEATURES},
+        'trend_analysis': trend_analysis,
+        'levels_analysis': levels_analysis,
+        'volatility_analysis': volatility,
+        'feature_warnings': short,
+        'candle_open_ms': int(df['timestamp'].iloc[-1].value // 1_000_000),
+        # 紧凑模式下以 float32 结构化数组保存整段K线
+        'full_data': to_compact_records(df) if MEMORY_CONFIG['compact_candles'] else df
+    }
+    price_data.update(extra)
+    return price_data
+
+
+def _on_stream_candle_close(stream, row):
+    """K线收盘回调（WebSocket线程）：只投递事件，决策在主线程执行"""
+    try:
+        _stream_events.put_nowait(row)
+    except queue.Full:
+        # 上一次决策尚未消费，丢弃旧事件，只保留最新收盘
+        try:
+            _stream_events.get_nowait()
+        except queue.Empty:
+            pass
+        _stream_events.put_nowait(row)
+
+
+def _on_stream_mark_price(price):
+    """标记价格推送：更新展示价格，并逐笔检查止盈止损"""
+    web_data['current_price'] = price
+    if _is_paper_trading():
+        sltp_watcher.on_price(price)
+
+
+def start_kline_stream():
+    """启动WebSocket K线流，先用REST数据（含本地存储历史）预热窗口。失败返回False（回退轮询）
+
+    窗口容量为 history_points，与REST路径的指标计算长度一致（sma_50 等长窗口指标需要）。
+    """
+    global _kline_stream
+    if not _WEBSOCKET_AVAILABLE:
+        print("⚠️ websocket-client不可用，流模式回退为REST轮询")
+        return False
+    if _kline_stream is not None:
+        return True
+    try:
+        stream = KlineStream(
+            TRADE_CONFIG['symbol'], TRADE_CONFIG['timeframe'],
+            buffer=new_candle_buffer(TRADE_CONFIG['history_points'], TRADE_CONFIG['timeframe']),
+            on_candle_close=_on_stream_candle_close,
+            on_mark_price=_on_stream_mark_price,
+            url=os.getenv('KLINE_STREAM_URL') or None
+        )
+        if _CCXT_AVAILABLE and exchange is not None:
             try:
-                binance.load_markets()
-            except Exception as be:
-                print(f"Binance市场加载失败(忽略继续): {be}")
-            ohlcv = binance.fetch_ohlcv('BTC/USDT', TRADE_CONFIG['timeframe'],
-                                        limit=TRADE_CONFIG['data_points'])
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df = calculate_technical_indicators(df)
-
-            current_data = df.iloc[-1]
-            previous_data = df.iloc[-2]
-
-            trend_analysis = get_market_trend(df)
-            levels_analysis = get_support_resistance_levels(df)
-
-            return {
-                'price': current_data['close'],
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'high': current_data['high'],
-                'low': current_data['low'],
-                'volume': current_data['volume'],
-                'timeframe': TRADE_CONFIG['timeframe'],
-                'price_change': ((current_data['close'] - previous_data['close']) / previous_data['close']) * 100,
-                'kline_data': df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].tail(10).to_dict('records'),
-                'technical_data': {
-                    'sma_5': current_data.get('sma_5', 0),
-                    'sma_20': current_data.get('sma_20', 0),
-                    'sma_50': current_data.get('sma_50', 0),
-                    'rsi': current_data.get('rsi', 0),
-                    'macd': current_data.get('macd', 0),
-                    'macd_signal': current_data.get('macd_signal', 0),
-                    'macd_histogram': current_data.get('macd_histogram', 0),
-                    'bb_upper': current_data.get('bb_upper', 0),
-                    'bb_lower': current_data.get('bb_lower', 0),
-                    'bb_position': current_data.get('bb_position', 0),
-                    'volume_ratio': current_data.get('volume_ratio', 0)
-                },
-                'trend_analysis': trend_analysis,
-                'levels_analysis': levels_analysis,
-                'full_data': df,
-                'data_source': 'binanceusdm'
-            }
-        except Exception as be2:
-            print(f"Binance备用数据源获取失败: {be2}")
+                backfill_candle_store(exchange, TRADE_CONFIG['symbol'])
+                stream.buffer.update(load_ohlcv_history(exchange, TRADE_CONFIG['symbol']))
+            except Exception as e_warm:
+                print(f"流模式预热K线失败(忽略继续): {e_warm}")
+        stream.start()
+        _kline_stream = stream
+        return True
+    except Exception as e:
+        print(f"启动WebSocket K线流失败: {e}")
+        return False
 
-        # 使用本地fallback数据
+
+def get_stream_price_data():
+    """基于WebSocket内存K线窗口构建 price_data；流不可用时返回None"""
+    if _kline_stream is None or not _kline_stream.is_healthy():
+        return None
+    candles = _kline_stream.snapshot()
+    if len(candles) < 2:
+        return None
+    return build_price_data(ohlcv_to_dataframe(candles),
+                            mtf_features=get_mtf_features(candles, TRADE_CONFIG['symbol'],
+                                                          getattr(exchange, 'id', None)),
+                            indicators=get_latest_indicators(candles, TRADE_CONFIG['symbol']),
+                            key_levels=get_key_levels(candles, TRADE_CONFIG['symbol'],
+                                                      source_id=getattr(exchange, 'id', None)),
+                            volatility=get_volatility_state(candles, TRADE_CONFIG['symbol'],
+                                                            source_id=getattr(exchange, 'id', None)),
+                            data_source='binanceusdm-ws')
+
+
+def wait_for_stream_candle(poll_seconds=5.0):
+    """阻塞等待下一根K线收盘事件；流不健康或超时返回None，由调用方回退到REST轮询
+
+    按 poll_seconds 分段等待，每段检查连接健康度，断流后最多 poll_seconds 秒即可发现。
+    """
+    deadline = time.time() + timeframe_to_ms(TRADE_CONFIG['timeframe']) / 1000 * 2
+    while True:
+        if not _kline_stream.is_healthy():
+            print("⚠️ WebSocket K线流无数据，本周期回退为REST轮询")
+            return None
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            print("⚠️ 等待K线收盘事件超时，本周期回退为REST轮询")
+            return None
         try:
-            fallback_ohlcv = generate_fallback_ohlcv_data()
-            df = pd.DataFrame(fallback_ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df = calculate_technical_indicators(df)
+            _stream_events.get(timeout=min(poll_seconds, remaining))
+            break
+        except queue.Empty:
+            continue
+    if _kline_stream.last_close_latency_ms is not None:
+        print(f"⚡ K线收盘事件延迟: {_kline_stream.last_close_latency_ms}ms")
+    return get_stream_price_data()
 
-            current_data = df.iloc[-1]
-            previous_data = df.iloc[-2]
 
-            trend_analysis = get_market_trend(df)
-            levels_analysis = get_support_resistance_levels(df)
+def _snapshot_cacheable(key):
+    """只缓存真实行情、且最新K线正是当前K线的结果"""
+    return lambda data: not data.get('is_fallback_data') and data.get('candle_open_ms') == key[2]
 
-            return {
-                'price': current_data['close'],
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'high': current_data['high'],
-                'low': current_data['low'],
-                'volume': current_data['volume'],
-                'timeframe': TRADE_CONFIG['timeframe'],
-                'price_change': ((current_data['close'] - previous_data['close']) / previous_data['close']) * 100,
-                'kline_data': df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].tail(10).to_dict('records'),
-                'technical_data': {
-                    'sma_5': current_data.get('sma_5', 0),
-                    'sma_20': current_data.get('sma_20', 0),
-                    'sma_50': current_data.get('sma_50', 0),
-                    'rsi': current_data.get('rsi', 0),
-                    'macd': current_data.get('macd', 0),
-                    'macd_signal': current_data.get('macd_signal', 0),
-                    'macd_histogram': current_data.get('macd_histogram', 0),
-                    'bb_upper': current_data.get('bb_upper', 0),
-                    'bb_lower': current_data.get('bb_lower', 0),
-                    'bb_position': current_data.get('bb_position', 0),
-                    'volume_ratio': current_data.get('volume_ratio', 0)
-                },
-                'trend_analysis': trend_analysis,
-                'levels_analysis': levels_analysis,
-                'full_data': df,
-                'is_fallback_data': True
-            }
+
+def get_btc_ohlcv_enhanced():
+    """增强版：获取BTC K线数据并计算技术指标（同一根K线内复用快照缓存，不重复拉取与计算）"""
+    key = current_candle_key(TRADE_CONFIG['symbol'], TRADE_CONFIG['timeframe'])
+    return indicator_snapshot_cache.get_or_load(key, _load_btc_price_data, _snapshot_cacheable(key))
+
+
+def _load_btc_price_data():
+    """获取BTC K线数据并计算技术指标（以 Binance FAPI 为主）"""
+    try:
+        # 流模式下优先使用WebSocket内存K线窗口
+        stream_data = get_stream_price_data()
+        if stream_data:
+            return stream_data
+
+        # 本地无ccxt时，直接使用fallback数据
+        if not _CCXT_AVAILABLE:
+            df = ohlcv_to_dataframe(generate_fallback_ohlcv_data())
+            return build_price_data(df, data_source='fallback-local', is_fallback_data=True)
+
+        # 预加载交易所市场，避免符号不识别（exchange可能未初始化；命中缓存时不访问网络）
+        if exchange:
+            try:
+                market_cache.ensure(exchange)
+            except Exception as e:
+                print(f"加载市场失败(忽略继续): {e}")
+
+        # 候选数据源：主接口（配置符号 / BTC/USDT）与备用的长期公开客户端。
+        # 按历史成功率与延迟排序对冲请求，取最先返回的有效K线
+        sources = {}
+        if exchange:
+            sources['primary'] = (lambda: exchange, TRADE_CONFIG['symbol'], getattr(exchange, 'id', 'exchange'))
+            if TRADE_CONFIG['symbol'] != 'BTC/USDT':
+                sources['primary-btc'] = (lambda: exchange, 'BTC/USDT', getattr(exchange, 'id', 'exchange'))
+        sources['backup'] = (get_public_exchange, 'BTC/USDT', 'binanceusdm-backup')
+        candidates = [
+            (name, lambda client=client, symbol=symbol, store_id=store_id:
+                load_ohlcv_history(client(), symbol, source_id=store_id))
+            for name, (client, symbol, store_id) in sources.items()
+        ]
+
+        # 首次运行/长时间中断后的分页回填在竞速之外完成（只回填最可能胜出的数据源），
+        # 竞速截止时间只覆盖增量请求
+        client, symbol, store_id = sources[source_racer.ranked(candidates)[0][0]]
+        backfill_candle_store(client(), symbol, source_id=store_id)
+
+        name, candles = source_racer.race(
+            candidates,
+            deadline=TRADE_CONFIG['source_deadline_seconds'],
+            hedge_delay=TRADE_CONFIG['source_hedge_delay_seconds'],
+            validate=lambda rows: len(rows) >= 2
+        )
+        web_data['data_sources'] = source_racer.stats()
+
+        if candles:
+            if name == 'backup':
+                print("🔁 使用Binance USDT-M期货备用数据源")
+                data_source = 'binanceusdm'
+            else:
+                data_source = getattr(exchange, 'id', 'binanceusdm')
+            _, symbol, store_id = sources[name]
+            return build_price_data(ohlcv_to_dataframe(candles),
+                                    mtf_features=get_mtf_features(candles, symbol, store_id),
+                                    indicators=get_latest_indicators(candles, symbol),
+                                    key_levels=get_key_levels(candles, symbol, source_id=store_id),
+                                    volatility=get_volatility_state(candles, symbol, source_id=store_id),
+                                    data_source=data_source)
+        print("获取增强K线数据失败：所有数据源均不可用")
+
+        # 使用本地fallback数据
+        try:
+            df = ohlcv_to_dataframe(generate_fallback_ohlcv_data())
+            return build_price_data(df, is_fallback_data=True)
         except Exception as fallback_error:
             print(f"生成fallback数据也失败: {fallback_error}")
             return None
@@ -770,10 +1175,88 @@ def generate_technical_analysis_text(price_data):
     - 静态阻力: {safe_float(levels.get('static_resistance', 0)):.2f}
     - 静态支撑: {safe_float(levels.get('static_support', 0)):.2f}
     """
+
+    if levels.get('pivot_resistances') or levels.get('pivot_supports'):
+        def fmt_levels(prices, touches):
+            return " / ".join(f"{p:.2f}(触及{t}次)" for p, t in zip(prices, touches)) or "无"
+        analysis_text += f"""- 枢轴阻力: {fmt_levels(levels.get('pivot_resistances', []), levels.get('pivot_resistance_touches', []))}
+    - 枢轴支撑: {fmt_levels(levels.get('pivot_supports', []), levels.get('pivot_support_touches', []))}
+    """
+    if levels.get('volume_poc'):
+        analysis_text += f"""- 成交量密集区(POC): {levels['volume_poc']:.2f} | 价值区间: {levels['value_area_low']:.2f} - {levels['value_area_high']:.2f}
+    """
+
+    vol = price_data.get('volatility_analysis') or {}
+    if vol and pd.notna(vol.get('atr')):
+        analysis_text += f"""
+    🌡️ 波动率:
+    - ATR(14): {vol['atr']:.2f} ({safe_float(vol.get('atr_pct')):.2f}%) | 建议止损距离不小于 {safe_float(vol.get('atr_pct')) * VOLATILITY_CONFIG['stop_atr']:.2f}%
+    - 已实现波动率: {safe_float(vol.get('realized_vol_pct')):.3f}%/根 (年化{safe_float(vol.get('annualized_vol_pct')):.1f}%)
+    - 波动状态: {vol.get('regime_label', '未知')}（短期/基准 {safe_float(vol.get('vol_ratio')):.2f}）
+    """
+
+    mtf = trend.get('multi_timeframe') or {}
+    if mtf:
+        mtf_text = "\n    ".join(
+            f"- {tf}: {v['trend']}(均线斜率{v['sma_slope_pct']:+.2f}%) 动量{v['momentum']} "
+            f"RSI {safe_float(v['rsi']):.1f} 最近一根{v['change_pct']:+.2f}%"
+            + ("" if v['complete'] else f" (仅{v['bars']}根，仅供参考)")
+            for tf, v in mtf.items())
+        analysis_text += f"""
+    🕰️ 多周期趋势:
+    {mtf_text}
+    """
+        conf = trend.get('mtf_confluence')
+        if conf:
+            analysis_text += f"""- 多周期共振: {conf['label']}（多头{conf['bullish']}/空头{conf['bearish']}/共{conf['timeframes']}个周期）
+    """
     return analysis_text
 
-def build_ai_prompt(price_data, last_signal=None, sentiment_data=None, current_pos=None):
-    """构建更结构化的AI Prompt，参考AI-Trader风格并结合本项目数据。"""
+def build_system_prompt(timeframe):
+    """静态前缀：角色、原则与输出要求（同一周期配置下逐字节不变，便于接口侧前缀缓存命中）"""
+    return f"""[角色]
+你是专业量化交易AI，专注{timeframe}周期的趋势与风险控制。严格依据用户消息中提供的数据进行分析。
+
+[核心原则]
+1. 盈亏比必须≥1.5:1（潜在盈利/潜在亏损≥1.5）
+2. 严格风险管理：宁可错过机会，不可承担过大风险
+3. 趋势持续性优先：避免因单根K线改变整体判断
+4. 反转需多指标共振：至少2~3项技术指标同向确认
+
+[盈亏比计算规则]
+- 多头：盈亏比 = (止盈价-当前价) / (当前价-止损价)
+- 空头：盈亏比 = (当前价-止盈价) / (止损价-当前价)
+- 要求：盈亏比 ≥ 1.5:1，理想情况 ≥ 2:1
+
+[决策标准]
+1. 如果无法找到盈亏比≥1.5:1的合理位置，输出HOLD
+2. 止损位基于技术支撑/阻力位，不是固定百分比
+3. 止盈位基于下一个重要阻力/支撑位
+4. 优先考虑关键价格位，而非对称的百分比
+5. 防频繁交易：若无明确趋势，输出HOLD
+
+[输出格式]
+仅输出一个JSON对象（不含任何额外文字或注释）：
+{{
+  "signal": "BUY|SELL|HOLD",
+  "reason": "简要分析理由(趋势、关键位、指标共振、盈亏比)",
+  "stop_loss": <number>,
+  "take_profit": <number>,
+  "confidence": "HIGH|MEDIUM|LOW",
+  "strategy_tag": "trend_follow|mean_reversion|breakout|other",
+  "time_horizon": "scalp|intraday|swing",
+  "risk_budget": "low|medium|high"
+}}
+
+[校验规则]
+- 多头：stop_loss < 当前价 < take_profit，且盈亏比≥1.5:1
+- 空头：take_profit < 当前价 < stop_loss，且盈亏比≥1.5:1
+- HOLD时给出保守理由，可设置防守性止损止盈
+"""
+
+
+def build_prompt_sections(price_data, last_signal=None, sentiment_data=None, current_pos=None):
+    """每周期变化的行情数据分段：[(名称, 文本, 优先级)]，优先级为None表示必需，数值越大越先被预算裁掉"""
     tf = TRADE_CONFIG['timeframe']
     # K线摘要（最近5根）
     kline_text = f"【最近5根{tf}K线】\n"
@@ -787,9 +1270,6 @@ def build_ai_prompt(price_data, last_signal=None, sentiment_data=None, current_p
     except Exception:
         kline_text += "(K线数据不可用)\n"
 
-    # 技术分析文本
-    technical_analysis = generate_technical_analysis_text(price_data)
-
     # 上次信号
     signal_text = ""
     if last_signal:
@@ -810,62 +1290,28 @@ def build_ai_prompt(price_data, last_signal=None, sentiment_data=None, current_p
         position_text = "无持仓"
         pnl_text = ""
 
-    # 组合Prompt（严格的结构与输出要求，强调盈亏比）
-    prompt = f"""
-[角色]
-你是专业量化交易AI，专注{tf}周期的趋势与风险控制。
-
-[核心原则]
-1. 盈亏比必须≥1.5:1（潜在盈利/潜在亏损≥1.5）
-2. 严格风险管理：宁可错过机会，不可承担过大风险
-3. 趋势持续性优先：避免因单根K线改变整体判断
-4. 反转需多指标共振：至少2~3项技术指标同向确认
-
-[盈亏比计算规则]
-- 多头：盈亏比 = (止盈价-当前价) / (当前价-止损价)
-- 空头：盈亏比 = (当前价-止盈价) / (止损价-当前价)
-- 要求：盈亏比 ≥ 1.5:1，理想情况 ≥ 2:1
-
-[输入数据]
-{kline_text}
-{technical_analysis}
-{signal_text}
-{sentiment_text}
-
-[当前行情]
+    market_text = f"""[当前行情]
 - 当前价格: ${price_data.get('price',0):,.2f}
 - 时间: {price_data.get('timestamp','')}
 - 当根最高/最低: {price_data.get('high',0):.2f} / {price_data.get('low',0):.2f}
 - 成交量: {price_data.get('volume',0):.2f}
 - 价格变化: {price_data.get('price_change',0):+.2f}%
-- 当前持仓: {position_text}{pnl_text}
+- 当前持仓: {position_text}{pnl_text}"""
 
-[决策标准]
-1. 如果无法找到盈亏比≥1.5:1的合理位置，输出HOLD
-2. 止损位基于技术支撑/阻力位，不是固定百分比
-3. 止盈位基于下一个重要阻力/支撑位
-4. 优先考虑关键价格位，而非对称的百分比
-5. 防频繁交易：若无明确趋势，输出HOLD
+    return [
+        ('market', market_text, None),
+        ('technical', generate_technical_analysis_text(price_data), None),
+        ('klines', kline_text, 1),
+        ('last_signal', signal_text, 2),
+        ('sentiment', sentiment_text, 3),
+        ('instruction', "请依据以上数据，按输出格式给出决策JSON。", None),
+    ]
 
-[输出格式]
-仅输出一个JSON对象（不含任何额外文字或注释）：
-{{
-  "signal": "BUY|SELL|HOLD",
-  "reason": "简要分析理由(趋势、关键位、指标共振、盈亏比)",
-  "stop_loss": <number>,
-  "take_profit": <number>,
-  "confidence": "HIGH|MEDIUM|LOW",
-  "strategy_tag": "trend_follow|mean_reversion|breakout|other",
-  "time_horizon": "scalp|intraday|swing",
-  "risk_budget": "low|medium|high"
-}}
 
-[校验规则]
-- 多头：stop_loss < 当前价 < take_profit，且盈亏比≥1.5:1
-- 空头：take_profit < 当前价 < stop_loss，且盈亏比≥1.5:1
-- HOLD时给出保守理由，可设置防守性止损止盈
-"""
-    return prompt
+def build_ai_messages(price_data, last_signal=None, sentiment_data=None, current_pos=None):
+    """静态 system 前缀 + 行情 user 消息（按 token 预算裁剪），返回 (messages, 本次详情)"""
+    return prompt_stats.build(build_system_prompt(TRADE_CONFIG['timeframe']),
+                              build_prompt_sections(price_data, last_signal, sentiment_data, current_pos))
 
 
 def get_current_position():
@@ -971,42 +1417,6 @@ def compute_paper_position(current_price=None):
         return None
 
 
-def safe_json_parse(json_str):
-    """安全解析JSON，处理格式不规范的情况"""
-    try:
-        return json.loads(json_str)
-    except json.JSONDecodeError:
-        try:
-            # 尝试提取JSON代码块（如果AI包在```json```中）
-            if '```json' in json_str:
-                start = json_str.find('```json') + 7
-                end = json_str.find('```', start)
-                if end != -1:
-                    json_str = json_str[start:end].strip()
-            elif '```' in json_str:
-                start = json_str.find('```') + 3
-                end = json_str.find('```', start)
-                if end != -1:
-                    json_str = json_str[start:end].strip()
-            
-            # 尝试直接解析
-            try:
-                return json.loads(json_str)
-            except:
-                pass
-            
-            # 修复常见的JSON格式问题
-            json_str = json_str.replace("'", '"')
-            json_str = re.sub(r'(\w+):', r'"\1":', json_str)
-            json_str = re.sub(r',\s*}', '}', json_str)
-            json_str = re.sub(r',\s*]', ']', json_str)
-            return json.loads(json_str)
-        except json.JSONDecodeError as e:
-            print(f"JSON解析失败，原始内容: {json_str[:200]}")
-            print(f"错误详情: {e}")
-            return None
-
-
 def validate_risk_reward(signal_data, current_price, min_ratio=1.5):
     """验证盈亏比是否符合要求"""
     if not signal_data or not current_price:
@@ -1144,102 +1554,158 @@ def compute_win_rate_from_history():
         web_data['performance']['win_rate'] = web_data['performance'].get('win_rate', 0.0) or 0.0
 
 
+def _is_paper_trading():
+    return os.getenv('PAPER_TRADING', 'true').lower() == 'true' or TRADE_CONFIG.get('test_mode', False)
+
+
+def record_stop_take_profit_close(levels, price, triggered, close_action, close_signal):
+    """记录止盈/止损平仓事件（数据库 + 内存历史），并更新统计"""
+    sl = levels['stop_loss']
+    tp = levels['take_profit']
+    amount = levels['amount']
+
+    # 记录到数据库
+    signal_data = {
+        'signal': close_signal,
+        'confidence': 'HIGH',
+        'reason': triggered,
+        'stop_loss': sl,
+        'take_profit': tp
+    }
+    price_data = {
+        'price': price,
+        'symbol': TRADE_CONFIG['symbol'],
+        'timeframe': TRADE_CONFIG['timeframe'],
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+    try:
+        record_trade(signal_data, price_data, close_action, amount)
+    except Exception as e_db:
+        print(f"记录平仓到数据库失败: {e_db}")
+
+    # 记录到内存历史
+    web_data['trade_history'].append({
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'symbol': TRADE_CONFIG['symbol'],
+        'timeframe': TRADE_CONFIG['timeframe'],
+        'signal': close_signal,
+        'action': close_action,
+        'amount': amount,
+        'price': price,
+        'stop_loss': sl,
+        'take_profit': tp,
+        'confidence': 'HIGH',
+        'reason': triggered
+    })
+    if len(web_data['trade_history']) > MEMORY_CONFIG['trade_history_limit']:
+        web_data['trade_history'].pop(0)
+
+    # 更新胜率统计
+    try:
+        compute_win_rate_from_history()
+    except Exception as e_stats:
+        print(f"更新胜率统计失败: {e_stats}")
+
+    # 清除纸上持仓（视为已平仓）
+    web_data['current_position'] = None
+    sltp_watcher.clear()
+    print(f"✅ {triggered}，已执行{close_action} @ ${price:,.2f}")
+
+
 def check_stop_take_profit(current_price):
     """检查最近一次开仓是否触发止损/止盈，触发则记录平仓事件并更新统计。
-    仅在模拟/测试模式下执行自动平仓。
+    仅在模拟/测试模式下执行自动平仓。监视器已同步持仓时直接使用内存中的价位。
     """
     try:
-        if not (os.getenv('PAPER_TRADING', 'true').lower() == 'true' or TRADE_CONFIG.get('test_mode', False)):
+        if not _is_paper_trading():
             return False
 
-        last = get_last_open_trade()
-        if not last or last.get('action') not in ('open_long', 'open_short'):
+        price = to_float(current_price, None)
+        if price is None:
             return False
 
-        side = 'long' if last['action'] == 'open_long' else 'short'
-        sl = to_float(last.get('stop_loss'), None)
-        tp = to_float(last.get('take_profit'), None)
-        entry = to_float(last.get('price'), None)
-        amount = to_float(last.get('amount'), None)
-        price = to_float(current_price, None)
+        # 内存价位为准（与后台监视器共用，保证同一持仓只平仓一次）
+        if sltp_watcher.synced:
+            return sltp_watcher.on_price(price)
 
-        if None in (sl, tp, entry, amount, price):
+        last = get_last_open_trade()
+        if not last or last.get('action') not in ('open_long', 'open_short'):
             return False
 
-        triggered = None
-        close_action = None
-        close_signal = None
-        if side == 'long':
-            if price <= sl:
-                triggered = '止损触发'
-                close_action = 'close_long'
-                close_signal = 'SELL'
-            elif price >= tp:
-                triggered = '止盈触发'
-                close_action = 'close_long'
-                close_signal = 'SELL'
-        else:  # short
-            if price >= sl:
-                triggered = '止损触发'
-                close_action = 'close_short'
-                close_signal = 'BUY'
-            elif price <= tp:
-                triggered = '止盈触发'
-                close_action = 'close_short'
-                close_signal = 'BUY'
+        levels = {
+            'side': 'long' if last['action'] == 'open_long' else 'short',
+            'stop_loss': to_float(last.get('stop_loss'), None),
+            'take_profit': to_float(last.get('take_profit'), None),
+            'entry_price': to_float(last.get('price'), None),
+            'amount': to_float(last.get('amount'), None),
+        }
+        if None in levels.values():
+            return False
 
+        triggered, close_action, close_signal = evaluate_stop_take_profit(
+            levels['side'], levels['stop_loss'], levels['take_profit'], price)
         if not triggered:
             return False
 
-        # 记录到数据库
-        signal_data = {
-            'signal': close_signal,
-            'confidence': 'HIGH',
-            'reason': triggered,
-            'stop_loss': sl,
-            'take_profit': tp
-        }
-        price_data = {
-            'price': price,
-            'symbol': TRADE_CONFIG['symbol'],
-            'timeframe': TRADE_CONFIG['timeframe'],
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        try:
-            record_trade(signal_data, price_data, close_action, amount)
-        except Exception as e_db:
-            print(f"记录平仓到数据库失败: {e_db}")
+        record_stop_take_profit_close(levels, price, triggered, close_action, close_signal)
+        return True
+    except Exception as e:
+        print(f"检查止盈止损失败: {e}")
+        return False
 
-        # 记录到内存历史
-        web_data['trade_history'].append({
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'symbol': TRADE_CONFIG['symbol'],
-            'timeframe': TRADE_CONFIG['timeframe'],
-            'signal': close_signal,
-            'action': close_action,
-            'amount': amount,
-            'price': price,
-            'stop_loss': sl,
-            'take_profit': tp,
-            'confidence': 'HIGH',
-            'reason': triggered
-        })
-        if len(web_data['trade_history']) > MEMORY_CONFIG['trade_history_limit']:
-            web_data['trade_history'].pop(0)
 
-        # 更新胜率统计
+def get_mark_price():
+    """最新标记价格：优先WebSocket推送，其次REST行情（仅1权重）；
+    交易所不可用时，BTC/USDT 回退到公共现货价格API竞速"""
+    if _kline_stream is not None and _kline_stream.is_healthy() and _kline_stream.mark_price:
+        return _kline_stream.mark_price
+    if _CCXT_AVAILABLE and exchange is not None:
         try:
-            compute_win_rate_from_history()
-        except Exception as e_stats:
-            print(f"更新胜率统计失败: {e_stats}")
+            ticker = exchange.fetch_ticker(TRADE_CONFIG['symbol'])
+            return to_float(ticker.get('last'), None)
+        except Exception as e:
+            if TRADE_CONFIG['symbol'] != 'BTC/USDT':
+                raise
+            print(f"获取行情失败，改用公共价格API: {e}")
+    if TRADE_CONFIG['symbol'] == 'BTC/USDT':
+        return get_real_btc_price()
+    return None
 
-        # 清除纸上持仓（视为已平仓）
-        web_data['current_position'] = None
-        print(f"✅ {triggered}，已执行{close_action} @ ${price:,.2f}")
-        return True
+
+def _on_sltp_trigger(levels, price, triggered, close_action, close_signal):
+    """监视器触发回调（WebSocket/轮询线程）：持有交易锁平仓，持仓已在此期间平仓或替换时忽略"""
+    try:
+        with _trade_lock:
+            if not sltp_watcher.is_current(levels):
+                print(f"持仓已变化，忽略过期的{triggered}")
+                return
+            record_stop_take_profit_close(levels, price, triggered, close_action, close_signal)
     except Exception as e:
-        print(f"检查止盈止损失败: {e}")
+        print(f"止盈止损平仓记录失败: {e}")
+
+
+def start_sltp_watcher():
+    """从当前纸上持仓同步价位并启动后台监视（仅模拟/测试模式）"""
+    if not _is_paper_trading():
         return False
+    try:
+        pos = compute_paper_position()
+        last = get_last_open_trade() if pos else None
+        if last and last.get('action') in ('open_long', 'open_short'):
+            sl = to_float(last.get('stop_loss'), None)
+            tp = to_float(last.get('take_profit'), None)
+            if sl is not None and tp is not None:
+                sltp_watcher.set_levels(pos['side'], sl, tp, pos['entry_price'], pos['size'])
+            else:
+                sltp_watcher.clear()
+        else:
+            sltp_watcher.clear()
+    except Exception as e:
+        print(f"同步止盈止损价位失败，沿用数据库检查: {e}")
+        return False
+    sltp_watcher.start()
+    print(f"已启动止盈止损监视（每{sltp_watcher.interval:g}秒检查标记价格）")
+    return True
 
 
 def test_ai_connection():
@@ -1286,12 +1752,13 @@ def test_ai_connection():
 
 
 def create_fallback_signal(price_data):
-    """创建备用交易信号，确保盈亏比≥1.5:1"""
+    """创建备用交易信号，确保盈亏比≥1.5:1（止损止盈按ATR，波动率未就绪时为 -2%/+3%）"""
+    stop_loss, take_profit = default_stops(price_data['price'], price_data.get('volatility_analysis'), 'HOLD')
     return {
         "signal": "HOLD",
         "reason": "因技术分析暂时不可用，采取保守策略，盈亏比1.5:1",
-        "stop_loss": price_data['price'] * 0.98,  # -2%
-        "take_profit": price_data['price'] * 1.03,  # +3%, 盈亏比1.5:1
+        "stop_loss": stop_loss,
+        "take_profit": take_profit,
         "confidence": "LOW",
         "strategy_tag": "fallback",
         "time_horizon": "intraday",
@@ -1353,44 +1820,79 @@ def should_execute_trade(signal_data, current_position):
         return True  # 失败时不阻断，避免影响主流程
 
 
-def analyze_with_deepseek(price_data):
-    """使用DeepSeek分析市场并生成交易信号（增强版）"""
+def completion_options():
+    """模型调用参数：流式开关，以及接口侧的 JSON 输出模式（response_format）"""
+    options = {'temperature': 0.1, 'stream': TRADE_CONFIG['ai_stream']}
+    if TRADE_CONFIG['ai_stream']:
+        # usage 随最后一块返回；决策JSON完整后提前关闭的流拿不到
+        options['stream_options'] = {'include_usage': True}
+    if TRADE_CONFIG['ai_json_mode']:
+        options['response_format'] = {'type': 'json_object'}
+    return options
 
-    # 生成技术分析文本
-    technical_analysis = generate_technical_analysis_text(price_data)
 
-    # 构建K线数据文本
-    kline_text = f"【最近5根{TRADE_CONFIG['timeframe']}K线数据】\n"
-    for i, kline in enumerate(price_data['kline_data'][-5:]):
-        trend = "阳线" if kline['close'] > kline['open'] else "阴线"
-        change = ((kline['close'] - kline['open']) / kline['open']) * 100
-        kline_text += f"K线{i + 1}: {trend} 开盘:{kline['open']:.2f} 收盘:{kline['close']:.2f} 涨跌:{change:+.2f}%\n"
+def extract_decision(result):
+    """从模型回复中解析并校验决策；未找到、解析失败或字段无效返回None"""
+    try:
+        decision = parse_decision(result)
+    except DecisionParseError as e:
+        print(f"⚠️ 决策解析失败: {e}")
+        print(f"原始内容: {result[:200]}")
+        decision = None
+    record_reply(result, decision)
+    return decision
+
+
+def _completion_decision(response):
+    """接口响应 -> 决策字典（多模型并发时逐个模型调用），无效返回None"""
+    result, info = read_completion(response) if response else (None, {})
+    prompt_stats.record_usage(info.get('usage'))
+    if not result:
+        return None
+    return extract_decision(result)
 
-    # 添加上次交易信号
-    signal_text = ""
-    if signal_history:
-        last_signal = signal_history[-1]
-        signal_text = f"\n【上次交易信号】\n信号: {last_signal.get('signal', 'N/A')}\n信心: {last_signal.get('confidence', 'N/A')}"
+
+def record_signal(signal_data, price_data):
+    """保存信号到历史记录，并打印信号统计与连续性提示"""
+    signal_data['timestamp'] = price_data['timestamp']
+    signal_history.append(signal_data)
+    if len(signal_history) > MEMORY_CONFIG['signal_history_limit']:
+        signal_history.pop(0)
+
+    # 信号统计
+    signal_count = len([s for s in signal_history if s.get('signal') == signal_data['signal']])
+    total_signals = len(signal_history)
+    print(f"信号统计: {signal_data['signal']} (最近{total_signals}次中出现{signal_count}次)")
+
+    # 信号连续性检查
+    if len(signal_history) >= 3:
+        last_three = [s['signal'] for s in signal_history[-3:]]
+        if len(set(last_three)) == 1:
+            print(f"⚠️ 注意：连续3次{signal_data['signal']}信号")
+
+
+def analyze_with_deepseek(price_data):
+    """使用DeepSeek分析市场并生成交易信号（增强版）"""
 
     # 获取情绪数据
     sentiment_data = get_sentiment_indicators()
-    # 简化情绪文本（多了没用）
     if sentiment_data:
-        sign = '+' if sentiment_data['net_sentiment'] >= 0 else ''
-        sentiment_text = f"【市场情绪】乐观{sentiment_data['positive_ratio']:.1%} 悲观{sentiment_data['negative_ratio']:.1%} 净值{sign}{sentiment_data['net_sentiment']:.3f}"
+        print(f"【市场情绪】净值{sentiment_data.get('net_sentiment', 0):+.3f}")
     else:
-        sentiment_text = "【市场情绪】数据暂不可用"
-
-    print(sentiment_text)
+        print("【市场情绪】数据暂不可用")
 
-    # 添加当前持仓信息
     current_pos = get_current_position()
-    position_text = "无持仓" if not current_pos else f"{current_pos['side']}仓, 数量: {current_pos['size']}, 盈亏: {current_pos['unrealized_pnl']:.2f}USDT"
-    pnl_text = f", 持仓盈亏: {current_pos['unrealized_pnl']:.2f} USDT" if current_pos else ""
-
-    # 使用结构化Prompt覆盖
     last_signal = signal_history[-1] if signal_history else None
-    prompt = build_ai_prompt(price_data, last_signal=last_signal, sentiment_data=sentiment_data, current_pos=current_pos)
+
+    # 市场状态指纹与上次一致（且持仓未变）时复用上次通过校验的决策，跳过本次模型调用
+    fingerprint = market_fingerprint(price_data, current_pos, last_signal, sentiment_data)
+    cached_decision = decision_cache.lookup(fingerprint, price=price_data.get('price'))
+    web_data['decision_cache'] = decision_cache.stats()
+    if cached_decision is not None:
+        print(f"♻️ 市场状态未实质变化，复用上次决策: {cached_decision.get('signal')} - {cached_decision.get('confidence')}"
+              f"（命中率 {web_data['decision_cache']['hit_rate']:.0%}）")
+        record_signal(cached_decision, price_data)
+        return cached_decision
 
     # 检查AI是否可用
     if not _OPENAI_AVAILABLE or ai_client is None:
@@ -1413,85 +1915,92 @@ def analyze_with_deepseek(price_data):
         
         return fallback_decision
 
+    # 静态前缀在前、行情数据在后；超出 token 预算时裁掉低优先级分段
+    messages, prompt_info = build_ai_messages(price_data, last_signal, sentiment_data, current_pos)
+    print(f"📝 Prompt约{prompt_info['total_tokens_est']} tokens（静态前缀约{prompt_info['system_tokens_est']}，"
+          f"预算{prompt_info['budget']}）")
+    if prompt_info['dropped_sections']:
+        print(f"✂️ 超出预算，已省略: {', '.join(prompt_info['dropped_sections'])}")
     try:
-        print(f"⏳ 正在调用{AI_PROVIDER.upper()} API ({AI_MODEL})...")
-        response = ai_client.chat.completions.create(
-            model=AI_MODEL,
-            messages=[
-                {"role": "system",
-                 "content": (
-                     "你是专业量化交易AI。严格依据提供数据进行分析，"
-                     "只输出一个JSON对象（不含任何额外文字），"
-                     "键包括signal、reason、stop_loss、take_profit、confidence、strategy_tag、time_horizon、risk_budget。"
-                     "遵守止损/止盈方向一致性与防频繁交易的原则。"
-                 )},
-                {"role": "user", "content": prompt}
-            ],
-            stream=False,
-            temperature=0.1,
-            timeout=30.0  # 30秒超时
-        )
-        print("✓ API调用成功")
-        
-        # 更新AI连接状态
-        web_data['ai_model_info']['status'] = 'connected'
-        web_data['ai_model_info']['last_check'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        web_data['ai_model_info']['error_message'] = None
-
-        # 检查响应
-        if not response or not response.choices:
-            print(f"❌ {AI_PROVIDER.upper()}返回空响应")
-            web_data['ai_model_info']['status'] = 'error'
-            web_data['ai_model_info']['error_message'] = '响应为空'
-            return create_fallback_signal(price_data)
-        
-        # 安全解析JSON
-        result = response.choices[0].message.content
-        if not result:
-            print(f"❌ {AI_PROVIDER.upper()}返回空内容")
-            return create_fallback_signal(price_data)
-            
-        print(f"\n{'='*60}")
-        print(f"{AI_PROVIDER.upper()}原始回复:")
-        print(result)
-        print(f"{'='*60}\n")
+        if ai_ensemble is not None:
+            print(f"⏳ 正在并发调用 {', '.join(ai_ensemble.names)}（{ai_ensemble.mode}，截止{ai_ensemble.deadline:g}s）...")
+            call_started = time.perf_counter()
+            signal_data, run_info = ai_ensemble.run(messages, _completion_decision, **completion_options())
+            call_latency = time.perf_counter() - call_started
+            web_data['ai_ensemble'] = ai_ensemble.stats()
+            web_data['ai_model_info']['last_check'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            if signal_data is None:
+                print(f"❌ 所有模型均未在截止时间内返回有效决策: {run_info['errors'] or run_info['timed_out']}")
+                web_data['ai_model_info']['status'] = 'error'
+                web_data['ai_model_info']['error_message'] = '多模型均未返回有效决策'
+                return create_fallback_signal(price_data)
+            web_data['ai_model_info']['status'] = 'connected'
+            web_data['ai_model_info']['error_message'] = None
+            signal_data = dict(signal_data)
+            print(f"✓ 多模型决策: {run_info['signal']} - {signal_data.get('confidence')} "
+                  f"（{', '.join(f'{n}:{sig}' for n, sig in run_info['replies'].items())}，"
+                  f"一致率{run_info['agreement']:.0%}，{call_latency:.2f}s）")
+            if run_info['timed_out']:
+                print(f"⏱️ 截止时未返回: {', '.join(run_info['timed_out'])}")
+        else:
+            print(f"⏳ 正在调用{AI_PROVIDER.upper()} API ({AI_MODEL})...")
+            call_started = time.perf_counter()
+            response = ai_client.chat.completions.create(
+                model=AI_MODEL,
+                messages=messages,
+                timeout=30.0,  # 30秒超时
+                **completion_options()
+            )
+            # 流式模式下逐块扫描，决策JSON完整即关闭流
+            result, stream_info = read_completion(response) if response else (None, {})
+            call_latency = time.perf_counter() - call_started
+            print(f"✓ API调用成功 ({call_latency:.2f}s)")
+            usage = prompt_stats.record_usage(stream_info.get('usage'))
+            if usage and usage['cached_tokens'] is not None:
+                print(f"💾 Prompt {usage['prompt_tokens']} tokens，缓存命中 {usage['cached_tokens']}")
+            if stream_info.get('streamed'):
+                print(f"⚡ 流式返回: 首token {stream_info['first_token_s']}s，共{stream_info['chunks']}块，"
+                      + ("决策JSON完整后提前关闭" if stream_info['early_stop'] else "流已结束"))
+
+            # 更新AI连接状态
+            web_data['ai_model_info']['status'] = 'connected'
+            web_data['ai_model_info']['last_check'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            web_data['ai_model_info']['error_message'] = None
 
-        # 提取JSON部分
-        start_idx = result.find('{')
-        end_idx = result.rfind('}') + 1
+            # 检查响应
+            if not result:
+                print(f"❌ {AI_PROVIDER.upper()}返回空响应")
+                web_data['ai_model_info']['status'] = 'error'
+                web_data['ai_model_info']['error_message'] = '响应为空'
+                return create_fallback_signal(price_data)
 
-        if start_idx != -1 and end_idx != 0:
-            json_str = result[start_idx:end_idx]
-            signal_data = safe_json_parse(json_str)
+            print(f"\n{'='*60}")
+            print(f"{AI_PROVIDER.upper()}{'决策JSON' if stream_info.get('streamed') else '原始回复'}:")
+            print(result)
+            print(f"{'='*60}\n")
 
+            signal_data = extract_decision(result)
             if signal_data is None:
-                print("⚠️ JSON解析失败，使用备用信号")
+                print("⚠️ 使用备用信号")
                 signal_data = create_fallback_signal(price_data)
             else:
                 print(f"✓ 成功解析AI决策: {signal_data.get('signal')} - {signal_data.get('confidence')}")
-        else:
-            print("⚠️ 未找到JSON格式，使用备用信号")
-            signal_data = create_fallback_signal(price_data)
-
-        # 验证必需字段
-        required_fields = ['signal', 'reason', 'stop_loss', 'take_profit', 'confidence']
-        if not all(field in signal_data for field in required_fields):
-            missing = [f for f in required_fields if f not in signal_data]
-            print(f"⚠️ 缺少必需字段: {missing}，使用备用信号")
-            signal_data = create_fallback_signal(price_data)
-        
+
+        web_data['prompt'] = prompt_stats.stats()
+
         # 验证盈亏比
         current_price = price_data.get('price', 0)
         is_valid, message = validate_risk_reward(signal_data, current_price)
         if not is_valid:
             print(f"⚠️ 盈亏比验证失败: {message}")
             print("🔄 强制转换为HOLD信号以符合风险管理要求")
-            # 创建优化的HOLD信号，确保盈亏比≥1.5:1
+            # 创建优化的HOLD信号，确保盈亏比≥1.5:1（防守性止损止盈按ATR）
+            stop_loss, take_profit = default_stops(current_price, price_data.get('volatility_analysis'), 'HOLD')
             signal_data = {
                 'signal': 'HOLD',
                 'reason': f'原信号盈亏比不符合要求({message})，转为保守策略',
-                'stop_loss': current_price * 0.98,  # -2%
-                'take_profit': current_price * 1.03,  # +3%, 盈亏比1.5:1
+                'stop_loss': stop_loss,
+                'take_profit': take_profit,
                 'confidence': 'LOW',
                 'strategy_tag': 'risk_management',
                 'time_horizon': 'intraday',
@@ -1499,24 +2008,12 @@ def analyze_with_deepseek(price_data):
             }
         else:
             print(f"✅ 盈亏比验证通过: {message}")
+            if not signal_data.get('is_fallback'):
+                # 本次决策将成为下一周期的"上次信号"，按决策后的状态建立指纹
+                decision_cache.store(market_fingerprint(price_data, current_pos, signal_data, sentiment_data),
+                                     signal_data, call_latency, price=price_data.get('price'))
 
-        # 保存信号到历史记录
-        signal_data['timestamp'] = price_data['timestamp']
-        signal_history.append(signal_data)
-        if len(signal_history) > MEMORY_CONFIG['signal_history_limit']:
-            signal_history.pop(0)
-
-        # 信号统计
-        signal_count = len([s for s in signal_history if s.get('signal') == signal_data['signal']])
-        total_signals = len(signal_history)
-        print(f"信号统计: {signal_data['signal']} (最近{total_signals}次中出现{signal_count}次)")
-
-        # 信号连续性检查
-        if len(signal_history) >= 3:
-            last_three = [s['signal'] for s in signal_history[-3:]]
-            if len(set(last_three)) == 1:
-                print(f"⚠️ 注意：连续3次{signal_data['signal']}信号")
-
+        record_signal(signal_data, price_data)
         return signal_data
 
     except Exception as e:
@@ -1529,6 +2026,12 @@ def analyze_with_deepseek(price_data):
 
 
 def execute_trade(signal_data, price_data):
+    """执行交易（持有交易锁，与止盈止损监视器的平仓互斥）"""
+    with _trade_lock:
+        _execute_trade(signal_data, price_data)
+
+
+def _execute_trade(signal_data, price_data):
     """执行交易 - Binance FAPI 版本（修复保证金检查）"""
     global position, web_data
 
@@ -1562,9 +2065,11 @@ def execute_trade(signal_data, price_data):
                     print(f"🔒 近期已出现{signal_data['signal']}信号，避免频繁反转")
                     return
 
-    # 保障数值字段为浮点数以避免格式化异常
-    _stop_loss = to_float(signal_data.get('stop_loss'), price_data.get('price', 0) * 0.98)
-    _take_profit = to_float(signal_data.get('take_profit'), price_data.get('price', 0) * 1.02)
+    # 保障数值字段为浮点数以避免格式化异常；缺失时按ATR与信号方向给出默认值
+    default_sl, default_tp = default_stops(price_data.get('price', 0), price_data.get('volatility_analysis'),
+                                           signal_data.get('signal'))
+    _stop_loss = to_float(signal_data.get('stop_loss'), default_sl)
+    _take_profit = to_float(signal_data.get('take_profit'), default_tp)
 
     print(f"交易信号: {signal_data['signal']}")
     print(f"信心程度: {signal_data['confidence']}")
@@ -1573,7 +2078,7 @@ def execute_trade(signal_data, price_data):
     print(f"止盈: ${_take_profit:,.2f}")
 
     # 模拟交易：不执行真实下单，只记录数据库
-    if os.getenv('PAPER_TRADING', 'true').lower() == 'true' or TRADE_CONFIG.get('test_mode', False):
+    if _is_paper_trading():
         try:
             # 若存在持仓且新信号与当前方向相反，先记录平仓
             if current_position and signal_data['signal'] in ('BUY', 'SELL'):
@@ -1590,6 +2095,8 @@ def execute_trade(signal_data, price_data):
                         'take_profit': _take_profit
                     }
                     record_trade(close_sd, price_data, close_action, close_amount)
+                    # 原持仓已平仓，撤销其止盈止损价位
+                    sltp_watcher.clear()
                     web_data['trade_history'].append({
                         'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                         'symbol': TRADE_CONFIG['symbol'],
@@ -1610,6 +2117,11 @@ def execute_trade(signal_data, price_data):
             signal_data['stop_loss'] = _stop_loss
             signal_data['take_profit'] = _take_profit
             record_trade(signal_data, price_data, action, TRADE_CONFIG['amount'])
+            # 登记新持仓的止盈止损价位，交由后台监视器高频检查
+            if action in ('open_long', 'open_short'):
+                sltp_watcher.set_levels(
+                    'long' if action == 'open_long' else 'short',
+                    _stop_loss, _take_profit, price_data.get('price', 0), TRADE_CONFIG['amount'])
             # 同步到Web内存，便于前端展示
             web_data['trade_history'].append({
                 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
@@ -1802,12 +2314,13 @@ def wait_for_next_period():
     return seconds_to_wait
 
 
-def trading_bot():
-    # 首次运行不等待，之后每次等待到下一个整点
+def trading_bot(price_data=None):
+    # 首次运行不等待，之后每次等待到下一个整点（流模式由K线收盘事件驱动并传入price_data）
     global has_run_once
-    wait_seconds = 0 if not has_run_once else wait_for_next_period()
-    if wait_seconds > 0:
-        time.sleep(wait_seconds)
+    if price_data is None:
+        wait_seconds = 0 if not has_run_once else wait_for_next_period()
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
     has_run_once = True
 
     """主交易机器人函数"""
@@ -1818,7 +2331,8 @@ def trading_bot():
     print("=" * 60)
 
     # 1. 获取增强版K线数据
-    price_data = get_btc_ohlcv_enhanced()
+    if price_data is None:
+        price_data = get_btc_ohlcv_enhanced()
     if not price_data:
         return
 
@@ -1946,23 +2460,24 @@ def trading_bot():
             web_data['profit_curve'].pop(0)
     
     web_data['current_price'] = price_data['price']
-    # 在更新持仓前检查止盈/止损是否触发平仓
-    try:
-        check_stop_take_profit(price_data['price'])
-    except Exception:
-        pass
-    # 优先真实持仓，失败回退纸上推导
-    cur_pos = None
-    try:
-        cur_pos = get_current_position()
-    except Exception:
+    with _trade_lock:
+        # 在更新持仓前检查止盈/止损是否触发平仓
+        try:
+            check_stop_take_profit(price_data['price'])
+        except Exception:
+            pass
+        # 优先真实持仓，失败回退纸上推导
         cur_pos = None
-    if not cur_pos:
         try:
-            cur_pos = compute_paper_position(price_data['price'])
+            cur_pos = get_current_position()
         except Exception:
             cur_pos = None
-    web_data['current_position'] = cur_pos
+        if not cur_pos:
+            try:
+                cur_pos = compute_paper_position(price_data['price'])
+            except Exception:
+                cur_pos = None
+        web_data['current_position'] = cur_pos
     web_data['last_update'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
     # 保存K线数据
@@ -1979,8 +2494,10 @@ def trading_bot():
         pass
     
     # 保障数值字段为浮点数，避免前端toFixed报错
-    stop_loss_val = to_float(signal_data.get('stop_loss'), price_data['price'] * 0.98)
-    take_profit_val = to_float(signal_data.get('take_profit'), price_data['price'] * 1.02)
+    default_sl, default_tp = default_stops(price_data['price'], price_data.get('volatility_analysis'),
+                                           signal_data.get('signal'))
+    stop_loss_val = to_float(signal_data.get('stop_loss'), default_sl)
+    take_profit_val = to_float(signal_data.get('take_profit'), default_tp)
 
     # 保存AI决策
     ai_decision = {
@@ -2009,6 +2526,9 @@ def trading_bot():
     except Exception as e_stats:
         print(f"更新胜率统计失败: {e_stats}")
 
+    # 6. 多品种批量扫描（配置 SCAN_SYMBOLS 时）
+    update_symbol_scan()
+
 
 
 def main():
@@ -2029,12 +2549,23 @@ def main():
     if not setup_exchange():
         print("交易所初始化失败，将继续进入模拟交易，仅加载行情与AI决策")
 
-    print("执行频率: 每15分钟整点执行")
+    # 启动止盈止损监视（模拟/测试模式）
+    start_sltp_watcher()
+
+    stream_mode = TRADE_CONFIG['stream_mode'] and start_kline_stream()
+    if stream_mode:
+        print("执行频率: K线收盘即触发（WebSocket流模式）")
+    else:
+        print("执行频率: 每15分钟整点执行")
 
     # 循环执行（不使用schedule）
     loop_count = 0
     while True:
-        trading_bot()  # 函数内部会自己等待整点
+        if stream_mode:
+            # 首次立即执行，之后等待K线收盘事件；流中断时price_data为None，回退整点轮询
+            trading_bot(wait_for_stream_candle() if has_run_once else None)
+        else:
+            trading_bot()  # 函数内部会自己等待整点
         
         # 内存监控和清理（每10次循环执行一次）
         loop_count += 1
@@ -2061,8 +2592,9 @@ def main():
             except Exception as e:
                 print(f"⚠️ 内存监控失败: {e}")
 
-        # 执行完后等待一段时间再检查（避免频繁循环）
-        time.sleep(60)  # 每分钟检查一次
+        # 执行完后等待一段时间再检查（避免频繁循环；流模式由收盘事件节流）
+        if not stream_mode:
+            time.sleep(60)  # 每分钟检查一次
 
 
 if __name__ == "__main__":
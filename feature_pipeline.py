@@ -0,0 +1,260 @@
+"""
+特征管线 - 声明式指标注册表 + 依赖图，只计算消费方请求的指标
+
+每个特征声明：输入（原始K线列或其他特征）、回看窗口（得到完整窗口值所需的K线数）与计算函数。
+管线对请求的特征做拓扑排序，只计算它们及其依赖，中间结果（如 ema_12、volume_ma）在一次计算内共享。
+K线数量少于某特征的有效回看窗口（自身与全部依赖中的最大值）时，在结果中报告。
+
+用法：
+    result = feature_pipeline.compute(columns, ('rsi', 'macd'))
+    result.values['rsi'][-1], result.short  # {'macd': (34, 20)} 表示需要34根，实际20根
+"""
+
+import numpy as np
+
+from indicator_kernels import ewm_mean, fill_missing, rolling_max, rolling_mean, rolling_min, rolling_std
+
+RAW_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+# price_data['technical_data'] 的字段（单品种与批量扫描共用）
+TECHNICAL_DATA_FEATURES = ('sma_5', 'sma_20', 'sma_50', 'rsi', 'macd', 'macd_signal', 'macd_histogram',
+                           'bb_upper', 'bb_lower', 'bb_position', 'volume_ratio')
+
+
+class Feature:
+    """注册表中的一个特征"""
+
+    __slots__ = ('name', 'inputs', 'lookback', 'compute', 'public')
+
+    def __init__(self, name, inputs, lookback, compute, public=True):
+        self.name = name
+        self.inputs = tuple(inputs)
+        self.lookback = lookback
+        self.compute = compute
+        self.public = public  # 中间量（public=False）不做缺失值填充，也不出现在结果中
+
+
+class FeatureResult:
+    """一次管线计算的结果"""
+
+    __slots__ = ('values', 'short', 'computed')
+
+    def __init__(self, values, short, computed):
+        self.values = values      # {请求的特征: 数组}
+        self.short = short        # {特征: (所需K线数, 实际K线数)}，窗口不足的特征
+        self.computed = computed  # 实际计算的特征（含中间量），按计算顺序
+
+    def latest(self):
+        """每个请求特征的最后一个值（二维输入时为每个品种的最后一个值组成的数组）"""
+        return {name: arr[..., -1] if arr.ndim > 1 else float(arr[-1])
+                for name, arr in self.values.items()}
+
+
+FEATURE_REGISTRY = {}
+
+
+def register_feature(name, inputs, lookback=1, public=True, registry=None):
+    """装饰器：注册特征计算函数 fn(*输入数组) -> 数组"""
+    def decorator(fn):
+        (FEATURE_REGISTRY if registry is None else registry)[name] = Feature(name, inputs, lookback, fn, public)
+        return fn
+    return decorator
+
+
+class FeaturePipeline:
+    """按依赖图解析并计算特征"""
+
+    def __init__(self, registry=None):
+        self.registry = FEATURE_REGISTRY if registry is None else registry
+        self._order_cache = {}
+
+    def resolve(self, requested):
+        """返回计算 requested 所需的特征（拓扑序，依赖在前）"""
+        key = tuple(requested)
+        order = self._order_cache.get(key)
+        if order is not None:
+            return order
+        order, state = [], {}
+
+        def visit(name, path):
+            if name in RAW_COLUMNS or state.get(name) == 'done':
+                return
+            if name not in self.registry:
+                raise KeyError(f"未注册的特征: {name}")
+            if state.get(name) == 'visiting':
+                raise ValueError(f"特征依赖存在环: {' -> '.join(path + [name])}")
+            state[name] = 'visiting'
+            for dep in self.registry[name].inputs:
+                visit(dep, path + [name])
+            state[name] = 'done'
+            order.append(name)
+
+        for name in key:
+            visit(name, [])
+        self._order_cache[key] = order
+        return order
+
+    def effective_lookback(self, name):
+        """特征自身与全部依赖中最大的回看窗口"""
+        if name in RAW_COLUMNS:
+            return 1
+        feature = self.registry[name]
+        return max([feature.lookback] + [self.effective_lookback(dep) for dep in feature.inputs])
+
+    def window_report(self, requested, available):
+        """窗口不足的请求特征 {特征: (所需K线数, 实际K线数)}"""
+        short = {}
+        for name in requested:
+            need = self.effective_lookback(name)
+            if available < need:
+                short[name] = (need, available)
+        return short
+
+    def compute(self, columns, requested):
+        """columns: {原始列名: float64数组（一维，或 品种×时间 的二维）}；只计算 requested 及其依赖"""
+        requested = tuple(requested)
+        order = self.resolve(requested)
+        values = dict(columns)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for name in order:
+                feature = self.registry[name]
+                values[name] = feature.compute(*(values[dep] for dep in feature.inputs))
+        for name in order:
+            if self.registry[name].public:
+                fill_missing(values[name])
+        n = columns['close'].shape[-1]
+        return FeatureResult(
+            {name: values[name] for name in requested},
+            self.window_report(requested, n),
+            order,
+        )
+
+    def latest(self, columns, requested):
+        """只取最后一行的便捷接口，返回 (最新值字典, 窗口不足报告)"""
+        result = self.compute(columns, requested)
+        return result.latest(), result.short
+
+
+# ---- 内置特征：与 indicator_kernels.compute_indicators 口径一致 ----
+
+@register_feature('sma_5', ('close',), lookback=5)
+def _sma_5(close):
+    return rolling_mean(close, 5, 1)
+
+
+@register_feature('sma_20', ('close',), lookback=20)
+def _sma_20(close):
+    return rolling_mean(close, 20, 1)
+
+
+@register_feature('sma_50', ('close',), lookback=50)
+def _sma_50(close):
+    return rolling_mean(close, 50, 1)
+
+
+@register_feature('ema_12', ('close',), lookback=12)
+def _ema_12(close):
+    return ewm_mean(close, 12)
+
+
+@register_feature('ema_26', ('close',), lookback=26)
+def _ema_26(close):
+    return ewm_mean(close, 26)
+
+
+@register_feature('macd', ('ema_12', 'ema_26'), lookback=26)
+def _macd(ema_12, ema_26):
+    return ema_12 - ema_26
+
+
+@register_feature('macd_signal', ('macd',), lookback=34)
+def _macd_signal(macd):
+    return ewm_mean(macd, 9)
+
+
+@register_feature('macd_histogram', ('macd', 'macd_signal'), lookback=34)
+def _macd_histogram(macd, macd_signal):
+    return macd - macd_signal
+
+
+@register_feature('price_delta', ('close',), lookback=2, public=False)
+def _price_delta(close):
+    # 首个差分记为0，与原实现 where() 的结果一致
+    delta = np.zeros_like(close)
+    np.subtract(close[..., 1:], close[..., :-1], out=delta[..., 1:])
+    return delta
+
+
+@register_feature('avg_gain', ('price_delta',), lookback=15, public=False)
+def _avg_gain(delta):
+    return rolling_mean(np.maximum(delta, 0.0), 14)
+
+
+@register_feature('avg_loss', ('price_delta',), lookback=15, public=False)
+def _avg_loss(delta):
+    return rolling_mean(np.maximum(-delta, 0.0), 14)
+
+
+@register_feature('rsi', ('avg_gain', 'avg_loss'), lookback=15)
+def _rsi(avg_gain, avg_loss):
+    return 100 - 100 / (1 + avg_gain / avg_loss)
+
+
+@register_feature('bb_middle', ('close',), lookback=20)
+def _bb_middle(close):
+    return rolling_mean(close, 20)
+
+
+@register_feature('bb_std', ('close',), lookback=20, public=False)
+def _bb_std(close):
+    return rolling_std(close, 20)
+
+
+@register_feature('bb_upper', ('bb_middle', 'bb_std'), lookback=20)
+def _bb_upper(bb_middle, bb_std):
+    return bb_middle + bb_std * 2
+
+
+@register_feature('bb_lower', ('bb_middle', 'bb_std'), lookback=20)
+def _bb_lower(bb_middle, bb_std):
+    return bb_middle - bb_std * 2
+
+
+@register_feature('bb_position', ('close', 'bb_upper', 'bb_lower'), lookback=20)
+def _bb_position(close, bb_upper, bb_lower):
+    return (close - bb_lower) / (bb_upper - bb_lower)
+
+
+@register_feature('volume_ma', ('volume',), lookback=20)
+def _volume_ma(volume):
+    return rolling_mean(volume, 20)
+
+
+@register_feature('volume_ratio', ('volume', 'volume_ma'), lookback=20)
+def _volume_ratio(volume, volume_ma):
+    return volume / volume_ma
+
+
+@register_feature('resistance', ('high',), lookback=20)
+def _resistance(high):
+    return rolling_max(high, 20)
+
+
+@register_feature('support', ('low',), lookback=20)
+def _support(low):
+    return rolling_min(low, 20)
+
+
+@register_feature('recent_high', ('high',), lookback=20)
+def _recent_high(high):
+    # 支撑阻力位分析用：最近20根最高价，不足20根时取已有K线
+    return rolling_max(high, 20, 1)
+
+
+@register_feature('recent_low', ('low',), lookback=20)
+def _recent_low(low):
+    return rolling_min(low, 20, 1)
+
+
+# 进程内共享管线
+feature_pipeline = FeaturePipeline()
@@ -0,0 +1,115 @@
+"""
+共享HTTP客户端 - 所有辅助REST调用（情绪指标、公共价格、健康检查等）统一走这里
+
+- 单个 requests.Session 复用 keep-alive 连接，避免每次请求重新 TCP+TLS 握手；
+- 每个主机的连接池上限（HTTP_POOL_MAXSIZE），池满时排队等待而不是无限建连；
+- 未显式指定时使用默认超时（连接/读取），杜绝无超时的请求；
+- 对 429/5xx 和连接错误按指数退避重试，遵守 Retry-After；
+- 按主机统计请求数、失败数与延迟。
+"""
+
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HTTP_CONFIG = {
+    'connect_timeout': float(os.getenv('HTTP_CONNECT_TIMEOUT', '3')),
+    'read_timeout': float(os.getenv('HTTP_READ_TIMEOUT', '10')),
+    'pool_connections': 10,                                # 缓存的主机连接池数量
+    'pool_maxsize': int(os.getenv('HTTP_POOL_MAXSIZE', '4')),  # 每个主机的最大连接数
+    'retries': 2,
+    'backoff_factor': 0.3,                                 # 0.3s, 0.6s, ...
+    'retry_statuses': (429, 500, 502, 503, 504),
+}
+
+_session = None
+_session_lock = threading.Lock()
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def _build_session():
+    retry = Retry(
+        total=HTTP_CONFIG['retries'],
+        connect=HTTP_CONFIG['retries'],
+        read=HTTP_CONFIG['retries'],
+        status=HTTP_CONFIG['retries'],
+        backoff_factor=HTTP_CONFIG['backoff_factor'],
+        status_forcelist=HTTP_CONFIG['retry_statuses'],
+        # 这里的POST都是只读查询接口，可以安全重试
+        allowed_methods=frozenset(['GET', 'HEAD', 'POST']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_CONFIG['pool_connections'],
+        pool_maxsize=HTTP_CONFIG['pool_maxsize'],
+        pool_block=True,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """进程内共享的 Session（惰性创建）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def _record(host, latency_ms, status=None, error=None):
+    with _metrics_lock:
+        m = _metrics.setdefault(host, {
+            'requests': 0, 'errors': 0, 'avg_latency_ms': None,
+            'max_latency_ms': 0.0, 'last_status': None, 'last_error': None
+        })
+        m['requests'] += 1
+        if error is not None or (status is not None and status >= 400):
+            m['errors'] += 1
+            m['last_error'] = error or f"HTTP {status}"
+        m['last_status'] = status
+        # 指数加权平均延迟
+        if m['avg_latency_ms'] is None:
+            m['avg_latency_ms'] = latency_ms
+        else:
+            m['avg_latency_ms'] = 0.2 * latency_ms + 0.8 * m['avg_latency_ms']
+        m['max_latency_ms'] = max(m['max_latency_ms'], latency_ms)
+
+
+def request(method, url, **kwargs):
+    """发送请求（带默认超时、重试与延迟统计），异常原样抛出"""
+    kwargs.setdefault('timeout', (HTTP_CONFIG['connect_timeout'], HTTP_CONFIG['read_timeout']))
+    host = urlparse(url).netloc
+    started = time.time()
+    try:
+        response = get_session().request(method, url, **kwargs)
+    except Exception as e:
+        _record(host, (time.time() - started) * 1000, error=str(e)[:200])
+        raise
+    _record(host, (time.time() - started) * 1000, status=response.status_code)
+    return response
+
+
+def http_get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def http_post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def get_http_metrics():
+    """各主机请求统计快照"""
+    with _metrics_lock:
+        return {host: dict(m) for host, m in _metrics.items()}
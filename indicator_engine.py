@@ -0,0 +1,360 @@
+"""
+流式技术指标引擎 - 每根已收盘K线 O(1) 更新
+
+与 indicator_kernels.compute_indicators 的口径保持一致（同一段历史输入时，最后一行结果相同）：
+- SMA: 滑动窗口累加和（sma_5/20/50 为 min_periods=1，其余 rolling 为满窗口才有值）；
+- EMA/MACD: pandas ewm(adjust=True) 的递推形式 num/den；
+- RSI: 涨跌幅的14周期简单滑动均值（与现有实现一致，而非Wilder平滑）；
+- 布林带: 窗口化 Welford 增删方差（ddof=1）；
+- 支撑/阻力: 单调队列维护滑动最高/最低。
+
+只维护请求指标（features，按特征管线依赖图展开）所需的滚动状态，未请求的指标不计算。
+update() 提交一根已收盘K线；preview() 在不改变状态的前提下计算"加上当前未收盘K线"后的结果。
+结果为 NaN 的指标沿用上一次有效值，对应原实现的 bfill().ffill() 在最后一行上的效果。
+运行 `python indicator_engine.py` 逐根比较流式结果与整段窗口计算。
+"""
+
+import math
+from collections import deque
+
+NAN = float('nan')
+
+INDICATOR_COLUMNS = [
+    'sma_5', 'sma_20', 'sma_50', 'ema_12', 'ema_26', 'macd', 'macd_signal', 'macd_histogram',
+    'rsi', 'bb_middle', 'bb_upper', 'bb_lower', 'bb_position', 'volume_ma', 'volume_ratio',
+    'resistance', 'support',
+]
+
+
+def _div(a, b):
+    """与 pandas 一致的除法：x/0 -> ±inf，0/0 -> NaN"""
+    if b == 0:
+        if a == 0 or math.isnan(a):
+            return NAN
+        return math.copysign(math.inf, a) if b >= 0 else -math.copysign(math.inf, a)
+    return a / b
+
+
+class RollingMean:
+    """滑动均值：累加和 O(1) 更新，定期重算以消除浮点漂移"""
+
+    RESYNC_EVERY = 1000
+
+    def __init__(self, window, min_periods=None):
+        self.window = window
+        self.min_periods = window if min_periods is None else min_periods
+        self.values = deque()
+        self.total = 0.0
+        self._updates = 0
+
+    def _value(self, total, n):
+        return total / n if n >= self.min_periods and n > 0 else NAN
+
+    def peek(self, x):
+        total = self.total + x
+        n = len(self.values) + 1
+        if n > self.window:
+            total -= self.values[0]
+            n -= 1
+        return self._value(total, n)
+
+    def push(self, x):
+        self.values.append(x)
+        self.total += x
+        if len(self.values) > self.window:
+            self.total -= self.values.popleft()
+        self._updates += 1
+        if self._updates % self.RESYNC_EVERY == 0:
+            self.total = math.fsum(self.values)
+        return self._value(self.total, len(self.values))
+
+
+class RollingStd:
+    """滑动标准差（ddof=1）：Welford 增删"""
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    @staticmethod
+    def _add(n, mean, m2, x):
+        n += 1
+        d = x - mean
+        mean += d / n
+        m2 += d * (x - mean)
+        return n, mean, m2
+
+    @staticmethod
+    def _remove(n, mean, m2, y):
+        if n <= 1:
+            return 0, 0.0, 0.0
+        n -= 1
+        d = y - mean
+        mean -= d / n
+        m2 -= d * (y - mean)
+        return n, mean, m2
+
+    def _value(self, n, m2):
+        if n < self.window:
+            return NAN
+        return math.sqrt(max(m2, 0.0) / (n - 1))
+
+    def peek(self, x):
+        n, mean, m2 = self.n, self.mean, self.m2
+        if len(self.values) == self.window:
+            n, mean, m2 = self._remove(n, mean, m2, self.values[0])
+        n, mean, m2 = self._add(n, mean, m2, x)
+        return self._value(n, m2)
+
+    def push(self, x):
+        if len(self.values) == self.window:
+            self.n, self.mean, self.m2 = self._remove(self.n, self.mean, self.m2, self.values.popleft())
+        self.values.append(x)
+        self.n, self.mean, self.m2 = self._add(self.n, self.mean, self.m2, x)
+        return self._value(self.n, self.m2)
+
+
+class RollingExtreme:
+    """滑动最高/最低：单调队列，均摊 O(1)"""
+
+    def __init__(self, window, mode='max'):
+        self.window = window
+        self.better = (lambda a, b: a >= b) if mode == 'max' else (lambda a, b: a <= b)
+        self.queue = deque()  # (序号, 值)，值单调
+        self.count = 0
+
+    def _front_after_evict(self, idx):
+        """新序号 idx 入队前，窗口内剩余的最优值"""
+        for pos in range(min(2, len(self.queue))):
+            i, v = self.queue[pos]
+            if i > idx - self.window:
+                return v
+        return None
+
+    def peek(self, x, min_periods=None):
+        best = self._front_after_evict(self.count)
+        value = x if best is None or self.better(x, best) else best
+        n = min(self.count + 1, self.window)
+        return value if n >= (self.window if min_periods is None else min_periods) else NAN
+
+    def push(self, x, min_periods=None):
+        idx = self.count
+        while self.queue and self.better(x, self.queue[-1][1]):
+            self.queue.pop()
+        self.queue.append((idx, x))
+        while self.queue[0][0] <= idx - self.window:
+            self.queue.popleft()
+        self.count += 1
+        n = min(self.count, self.window)
+        return self.queue[0][1] if n >= (self.window if min_periods is None else min_periods) else NAN
+
+
+class EwmMean:
+    """pandas ewm(span, adjust=True).mean() 的递推"""
+
+    def __init__(self, span):
+        self.decay = 1.0 - 2.0 / (span + 1.0)
+        self.num = 0.0
+        self.den = 0.0
+
+    def peek(self, x):
+        return (x + self.decay * self.num) / (1.0 + self.decay * self.den)
+
+    def push(self, x):
+        self.num = x + self.decay * self.num
+        self.den = 1.0 + self.decay * self.den
+        return self.num / self.den
+
+
+class StreamingIndicators:
+    """单个品种/周期的流式指标状态
+
+    features: 消费方请求的指标；按特征管线的依赖图展开后只维护所需的滚动状态（None 表示全部）
+    """
+
+    def __init__(self, levels_lookback=20, features=None):
+        self.levels_lookback = levels_lookback
+        # indicator_kernels -> indicator_engine 已有导入关系，特征管线在此延迟导入以避免循环
+        from feature_pipeline import FEATURE_REGISTRY, feature_pipeline
+
+        self.features = tuple(features) if features is not None else None
+        names = feature_pipeline.resolve(self.features) if features is not None else FEATURE_REGISTRY
+        self._needed = frozenset(names)
+        self.reset()
+
+    def reset(self):
+        self.sma_5 = RollingMean(5, 1)
+        self.sma_20 = RollingMean(20, 1)
+        self.sma_50 = RollingMean(50, 1)
+        self.ema_12 = EwmMean(12)
+        self.ema_26 = EwmMean(26)
+        self.macd_signal = EwmMean(9)
+        self.gain = RollingMean(14)
+        self.loss = RollingMean(14)
+        self.bb_middle = RollingMean(20)
+        self.bb_std = RollingStd(20)
+        self.volume_ma = RollingMean(20)
+        self.high_max = RollingExtreme(20, 'max')
+        self.low_min = RollingExtreme(20, 'min')
+        self.recent_high = RollingExtreme(self.levels_lookback, 'max')
+        self.recent_low = RollingExtreme(self.levels_lookback, 'min')
+        self.prev_close = None
+        self.last_ts = None
+        self.count = 0
+        self.last_valid = {}
+        self._latest = None
+
+    def _step(self, o, h, l, c, v, commit):
+        op = 'push' if commit else 'peek'
+        want = self._needed.__contains__
+
+        def run(component, x, *args):
+            return getattr(component, op)(x, *args)
+
+        values = {'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+
+        if want('sma_5'):
+            values['sma_5'] = run(self.sma_5, c)
+        if want('sma_20'):
+            values['sma_20'] = run(self.sma_20, c)
+        if want('sma_50'):
+            values['sma_50'] = run(self.sma_50, c)
+
+        if want('ema_12'):
+            values['ema_12'] = run(self.ema_12, c)
+        if want('ema_26'):
+            values['ema_26'] = run(self.ema_26, c)
+        if want('macd'):
+            macd = values['ema_12'] - values['ema_26']
+            values['macd'] = macd
+            if want('macd_signal'):
+                values['macd_signal'] = run(self.macd_signal, macd)
+            if want('macd_histogram'):
+                values['macd_histogram'] = macd - values['macd_signal']
+
+        if want('rsi'):
+            delta = c - self.prev_close if self.prev_close is not None else NAN
+            avg_gain = run(self.gain, delta if delta > 0 else 0.0)
+            avg_loss = run(self.loss, -delta if delta < 0 else 0.0)
+            values['rsi'] = 100 - _div(100, 1 + _div(avg_gain, avg_loss))
+
+        if want('bb_middle'):
+            bb_middle = run(self.bb_middle, c)
+            values['bb_middle'] = bb_middle
+            if want('bb_std'):
+                bb_std = run(self.bb_std, c)
+                bb_upper = bb_middle + bb_std * 2
+                bb_lower = bb_middle - bb_std * 2
+                if want('bb_upper'):
+                    values['bb_upper'] = bb_upper
+                if want('bb_lower'):
+                    values['bb_lower'] = bb_lower
+                if want('bb_position'):
+                    values['bb_position'] = _div(c - bb_lower, bb_upper - bb_lower)
+
+        if want('volume_ma'):
+            volume_ma = run(self.volume_ma, v)
+            values['volume_ma'] = volume_ma
+            if want('volume_ratio'):
+                values['volume_ratio'] = _div(v, volume_ma)
+
+        if want('resistance'):
+            values['resistance'] = run(self.high_max, h)
+        if want('support'):
+            values['support'] = run(self.low_min, l)
+        # 支撑阻力位分析使用的最近N根最高/最低（不要求满窗口）
+        if want('recent_high'):
+            values['recent_high'] = run(self.recent_high, h, 1)
+        if want('recent_low'):
+            values['recent_low'] = run(self.recent_low, l, 1)
+
+        # 对应原实现的 ffill：NaN 沿用上一次已提交的有效值
+        for key in INDICATOR_COLUMNS:
+            if key not in values:
+                continue
+            value = values[key]
+            if isinstance(value, float) and math.isnan(value):
+                values[key] = self.last_valid.get(key, NAN)
+            elif commit:
+                self.last_valid[key] = value
+        return values
+
+    def update(self, row):
+        """提交一根已收盘K线 [ts, o, h, l, c, v]，返回该K线对应的指标快照"""
+        ts, o, h, l, c, v = int(row[0]), *(float(x) for x in row[1:6])
+        values = self._step(o, h, l, c, v, commit=True)
+        self.prev_close = c
+        self.last_ts = ts
+        self.count += 1
+        values['timestamp'] = ts
+        self._latest = values
+        return values
+
+    def preview(self, row):
+        """计算加入未收盘K线后的指标快照，不改变内部状态"""
+        values = self._step(*(float(x) for x in row[1:6]), commit=False)
+        values['timestamp'] = int(row[0])
+        return values
+
+    def snapshot(self):
+        """最近一根已提交K线的指标快照"""
+        return dict(self._latest) if self._latest else None
+
+
+def _self_check():
+    """逐根提交K线，与整段窗口计算（indicator_kernels，已与 pandas 实现对齐）在每一根上的最后一行比较"""
+    import numpy as np
+
+    from indicator_kernels import compute_indicators
+    from synthetic_market import generate_ohlcv, to_ohlcv_rows
+
+    def window_last(rows):
+        arr = np.asarray(rows, dtype=np.float64)
+        out = compute_indicators(arr[:, 1], arr[:, 2], arr[:, 3], arr[:, 4], arr[:, 5])
+        return {name: out[name][-1] for name in INDICATOR_COLUMNS}
+
+    def assert_close(got, expected, where):
+        for name in INDICATOR_COLUMNS:
+            a, b = got[name], expected[name]
+            if math.isnan(a) and math.isnan(b):
+                continue
+            if not math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9):
+                raise AssertionError(f"{where} 指标 {name} 不一致: 流式 {a} / 整段 {b}")
+
+    worst = 0.0
+    for n, checkpoints in ((300, None), (5000, (999, 1000, 2500, 4999))):
+        rows = to_ohlcv_rows(generate_ohlcv(n, seed=n))
+        engine = StreamingIndicators()
+        for i, row in enumerate(rows):
+            if checkpoints is None or i in checkpoints:
+                # 预览未收盘K线：结果与加入该K线的整段计算一致，且不改变状态
+                before = engine.snapshot()
+                assert_close(engine.preview(row), window_last(rows[:i + 1]), f"n={n} 第{i + 1}根(预览)")
+                assert engine.snapshot() == before
+            got = engine.update(row)
+            if checkpoints is None or i in checkpoints:
+                expected = window_last(rows[:i + 1])
+                assert_close(got, expected, f"n={n} 第{i + 1}根")
+                for name in INDICATOR_COLUMNS:
+                    if not math.isnan(expected[name]):
+                        worst = max(worst, abs(got[name] - expected[name]) / max(abs(expected[name]), 1.0))
+    print(f"✅ 流式指标逐根提交与整段窗口计算一致（最大相对误差 {worst:.2e}）")
+
+    # 只请求部分指标：结果与全量引擎一致，且不计算未请求（也不是其依赖）的指标
+    requested = ('rsi', 'bb_position', 'recent_high')
+    full, partial = StreamingIndicators(), StreamingIndicators(features=requested)
+    for row in to_ohlcv_rows(generate_ohlcv(200, seed=7)):
+        expected, got = full.update(row), partial.update(row)
+        for name in requested:
+            a, b = got[name], expected[name]
+            assert a == b or (math.isnan(a) and math.isnan(b)), f"按需计算 {name} 不一致: {a} / {b}"
+    skipped = [name for name in INDICATOR_COLUMNS if name not in got]
+    assert 'sma_50' in skipped and 'macd' in skipped and 'bb_upper' in got
+    print(f"✅ 按需计算 {', '.join(requested)}：跳过 {len(skipped)} 个未请求的指标")
+
+
+if __name__ == "__main__":
+    _self_check()
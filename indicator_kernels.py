@@ -0,0 +1,256 @@
+"""
+NumPy 技术指标内核 - 无 pandas 的整段计算路径
+
+输入为连续的 float64 数组，结果写入预先分配的输出数组（可跨周期复用，避免每轮分配）。
+所有内核沿最后一维（时间）计算，既可传入单个品种的一维序列，也可传入 (品种 × 时间) 的二维数组批量计算。
+口径与原 pandas 实现一致：
+- rolling(...).mean()/std()/max()/min() 的 min_periods 语义；
+- ewm(span, adjust=True).mean()；
+- RSI 使用 14 周期简单滑动均值；
+- 最后统一做 bfill().ffill() 等价的缺失值填充。
+
+compute_indicators() 是整段计算的参考口径：流式引擎（indicator_engine）与特征管线都与其最后一行对齐。
+运行 `python indicator_kernels.py` 执行与 pandas 参考实现的一致性自检。
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from indicator_engine import INDICATOR_COLUMNS
+
+
+def allocate_outputs(shape):
+    """为给定形状（n 或 (品种数, n)）预分配全部指标输出数组"""
+    return {name: np.empty(shape, dtype=np.float64) for name in INDICATOR_COLUMNS}
+
+
+def rolling_mean(x, window, min_periods=None, out=None):
+    """滑动均值；不足 min_periods 的位置为 NaN
+
+    用累加和之差计算；先减去每行首个值再累加，保证长序列下的精度。
+    """
+    min_periods = window if min_periods is None else min_periods
+    n = x.shape[-1]
+    out = np.empty(x.shape) if out is None else out
+    if n == 0:
+        return out
+    ref = x[..., :1]
+    csum = np.cumsum(x - ref, axis=-1)
+    head = min(window, n)
+    np.divide(csum[..., :head], np.arange(1, head + 1, dtype=np.float64), out=out[..., :head])
+    if n > window:
+        np.subtract(csum[..., window:], csum[..., :-window], out=out[..., window:])
+        out[..., window:] /= window
+    out += ref
+    out[..., :min(min_periods - 1, n)] = np.nan
+    return out
+
+
+def rolling_std(x, window, out=None):
+    """满窗口滑动标准差（ddof=1）：先求窗口均值，再按窗口内偏移逐项累加离差平方（数值稳定）"""
+    n = x.shape[-1]
+    out = np.empty(x.shape) if out is None else out
+    out[..., :min(window - 1, n)] = np.nan
+    if n >= window:
+        m = n - window + 1
+        mean = rolling_mean(x, window)[..., window - 1:]
+        acc = out[..., window - 1:]
+        acc[...] = 0.0
+        dev = np.empty(mean.shape)
+        for k in range(window):
+            np.subtract(x[..., k:k + m], mean, out=dev)
+            dev *= dev
+            acc += dev
+        acc /= window - 1
+        np.sqrt(acc, out=acc)
+    return out
+
+
+def _rolling_extreme(x, window, min_periods, out, reduce, accumulate):
+    min_periods = window if min_periods is None else min_periods
+    n = x.shape[-1]
+    out = np.empty(x.shape) if out is None else out
+    head = min(window - 1, n)
+    if head > 0:
+        accumulate(x[..., :head], axis=-1, out=out[..., :head])
+        out[..., :min(min_periods - 1, head)] = np.nan
+    if n >= window:
+        reduce(sliding_window_view(x, window, axis=-1), axis=-1, out=out[..., window - 1:])
+    return out
+
+
+def rolling_max(x, window, min_periods=None, out=None):
+    return _rolling_extreme(x, window, min_periods, out, np.max, np.maximum.accumulate)
+
+
+def rolling_min(x, window, min_periods=None, out=None):
+    return _rolling_extreme(x, window, min_periods, out, np.min, np.minimum.accumulate)
+
+
+def decayed_cumsum(x, decay, out):
+    """y[t] = x[t] + decay * y[t-1]，分块向量化（块内缩放因子不超过1e8，避免溢出与精度损失）"""
+    n = x.shape[-1]
+    block = max(1, int(np.log(1e8) / -np.log(decay))) if decay > 0 else 1
+    powers = decay ** np.arange(block, dtype=np.float64)
+    inv_powers = 1.0 / powers
+    carry = 0.0
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        m = stop - start
+        seg = out[..., start:stop]
+        np.multiply(x[..., start:stop], inv_powers[:m], out=seg)
+        np.cumsum(seg, axis=-1, out=seg)
+        seg += carry * decay
+        seg *= powers[:m]
+        carry = seg[..., -1:].copy()
+    return out
+
+
+def ewm_mean(x, span, out=None):
+    """等价于 pandas ewm(span=span, adjust=True).mean()"""
+    n = x.shape[-1]
+    out = np.empty(x.shape) if out is None else out
+    decay = 1.0 - 2.0 / (span + 1.0)
+    decayed_cumsum(x, decay, out)
+    # 分母与数据无关，所有品种共用一行
+    den = decayed_cumsum(np.ones(n), decay, np.empty(n))
+    out /= den
+    return out
+
+
+def fill_missing(x):
+    """沿时间维原地执行 bfill().ffill()"""
+    mask = np.isnan(x)
+    if not mask.any():
+        return x
+    first = np.argmax(~mask, axis=-1)
+    # 常见情形：缺失值只出现在开头（指标预热期）且各行预热长度相同
+    lead = int(first.flat[0])
+    if lead > 0 and np.all(first == lead) and np.all(mask.sum(axis=-1) == lead):
+        x[..., :lead] = x[..., lead:lead + 1]
+        return x
+    idx = np.where(mask, 0, np.arange(x.shape[-1]))
+    np.maximum.accumulate(idx, axis=-1, out=idx)
+    # 开头的缺失值取第一个有效值（bfill）；整行缺失时保持NaN
+    np.maximum(idx, first[..., None], out=idx)
+    x[...] = np.take_along_axis(x, idx, axis=-1)
+    return x
+
+
+def compute_indicators(open_, high, low, close, volume, out=None):
+    """计算全部指标，返回 {列名: 数组}；out 为 allocate_outputs 预分配的输出"""
+    if out is None or out['sma_5'].shape != close.shape:
+        out = allocate_outputs(close.shape)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 移动平均线
+        rolling_mean(close, 5, 1, out['sma_5'])
+        rolling_mean(close, 20, 1, out['sma_20'])
+        rolling_mean(close, 50, 1, out['sma_50'])
+
+        # 指数移动平均线与MACD
+        ewm_mean(close, 12, out['ema_12'])
+        ewm_mean(close, 26, out['ema_26'])
+        np.subtract(out['ema_12'], out['ema_26'], out=out['macd'])
+        ewm_mean(out['macd'], 9, out['macd_signal'])
+        np.subtract(out['macd'], out['macd_signal'], out=out['macd_histogram'])
+
+        # RSI：首个差分为NaN，按原实现记为0
+        delta = np.empty(close.shape)
+        delta[..., 0] = 0.0
+        np.subtract(close[..., 1:], close[..., :-1], out=delta[..., 1:])
+        gain = rolling_mean(np.maximum(delta, 0.0), 14)
+        loss = rolling_mean(np.maximum(-delta, 0.0), 14)
+        rsi = out['rsi']
+        np.divide(gain, loss, out=rsi)
+        rsi += 1.0
+        np.divide(100.0, rsi, out=rsi)
+        np.subtract(100.0, rsi, out=rsi)
+
+        # 布林带
+        rolling_mean(close, 20, None, out['bb_middle'])
+        bb_std = rolling_std(close, 20)
+        bb_std *= 2
+        np.add(out['bb_middle'], bb_std, out=out['bb_upper'])
+        np.subtract(out['bb_middle'], bb_std, out=out['bb_lower'])
+        np.divide(close - out['bb_lower'], out['bb_upper'] - out['bb_lower'], out=out['bb_position'])
+
+        # 成交量均线
+        rolling_mean(volume, 20, None, out['volume_ma'])
+        np.divide(volume, out['volume_ma'], out=out['volume_ratio'])
+
+        # 支撑阻力位
+        rolling_max(high, 20, out=out['resistance'])
+        rolling_min(low, 20, out=out['support'])
+
+    for name in INDICATOR_COLUMNS:
+        fill_missing(out[name])
+    return out
+
+
+def _pandas_reference(df):
+    """原 pandas 实现（仅用于一致性自检）"""
+    df = df.copy()
+    df['sma_5'] = df['close'].rolling(window=5, min_periods=1).mean()
+    df['sma_20'] = df['close'].rolling(window=20, min_periods=1).mean()
+    df['sma_50'] = df['close'].rolling(window=50, min_periods=1).mean()
+    df['ema_12'] = df['close'].ewm(span=12).mean()
+    df['ema_26'] = df['close'].ewm(span=26).mean()
+    df['macd'] = df['ema_12'] - df['ema_26']
+    df['macd_signal'] = df['macd'].ewm(span=9).mean()
+    df['macd_histogram'] = df['macd'] - df['macd_signal']
+    delta = df['close'].diff()
+    gain = (delta.where(delta > 0, 0)).rolling(14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
+    df['rsi'] = 100 - (100 / (1 + gain / loss))
+    df['bb_middle'] = df['close'].rolling(20).mean()
+    bb_std = df['close'].rolling(20).std()
+    df['bb_upper'] = df['bb_middle'] + (bb_std * 2)
+    df['bb_lower'] = df['bb_middle'] - (bb_std * 2)
+    df['bb_position'] = (df['close'] - df['bb_lower']) / (df['bb_upper'] - df['bb_lower'])
+    df['volume_ma'] = df['volume'].rolling(20).mean()
+    df['volume_ratio'] = df['volume'] / df['volume_ma']
+    df['resistance'] = df['high'].rolling(20).max()
+    df['support'] = df['low'].rolling(20).min()
+    return df.bfill().ffill()
+
+
+def _self_check():
+    import time
+
+    import pandas as pd
+
+    from synthetic_market import generate_ohlcv
+
+    worst = 0.0
+    for n in (1, 2, 13, 14, 15, 20, 21, 50, 100, 200, 1000, 20000):
+        arrays = generate_ohlcv(n, seed=n)
+        out = compute_indicators(arrays['open'], arrays['high'], arrays['low'],
+                                 arrays['close'], arrays['volume'])
+        ref = _pandas_reference(pd.DataFrame(arrays))
+        for name in INDICATOR_COLUMNS:
+            expected = ref[name].to_numpy()
+            if not np.allclose(out[name], expected, rtol=1e-9, atol=1e-9, equal_nan=True):
+                raise AssertionError(f"n={n} 指标 {name} 与pandas结果不一致")
+            with np.errstate(invalid='ignore'):
+                diff = np.nanmax(np.abs(out[name] - expected) / np.maximum(np.abs(expected), 1.0), initial=0.0)
+            worst = max(worst, diff)
+    print(f"✅ 指标内核与pandas实现一致（最大相对误差 {worst:.2e}）")
+
+    arrays = generate_ohlcv(200, seed=0)
+    df = pd.DataFrame(arrays)
+    out = allocate_outputs(200)
+    rounds = 200
+    started = time.perf_counter()
+    for _ in range(rounds):
+        compute_indicators(arrays['open'], arrays['high'], arrays['low'], arrays['close'], arrays['volume'], out)
+    numpy_ms = (time.perf_counter() - started) / rounds * 1000
+    started = time.perf_counter()
+    for _ in range(rounds):
+        _pandas_reference(df)
+    pandas_ms = (time.perf_counter() - started) / rounds * 1000
+    print(f"⏱️ 200根K线单次计算: numpy {numpy_ms:.3f}ms, pandas {pandas_ms:.3f}ms")
+
+
+if __name__ == "__main__":
+    _self_check()
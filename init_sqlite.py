@@ -3,7 +3,6 @@
 
 import sqlite3
 import os
-import json
 from datetime import datetime
 
 def create_data_directory():
@@ -18,10 +17,10 @@ def create_data_directory():
 def get_btc_price():
     """获取BTC价格（简化版本）"""
     try:
-        import urllib.request
-        response = urllib.request.urlopen("https://api.binance.com/api/v3/ticker/price?symbol=BTCUSDT", timeout=5)
-        data = json.loads(response.read().decode())
-        return float(data['price'])
+        from http_client import http_get
+        response = http_get("https://api.binance.com/api/v3/ticker/price?symbol=BTCUSDT", timeout=5)
+        response.raise_for_status()
+        return float(response.json()['price'])
     except:
         return 108254.04  # 默认价格
 
@@ -0,0 +1,252 @@
+"""
+循环型指标内核 - 可选 JIT 编译（numba），未安装时自动回退到 NumPy 实现
+
+ATR（Wilder 平滑）与摆动枢轴点本质上是逐根递推/逐点比较的循环，向量化写法要么需要技巧
+（分块衰减累加），要么需要滑动窗口视图。这里把每个内核写成两份：
+- 循环版：普通 Python 循环，安装 numba 时以 njit 编译执行；
+- NumPy 版：未安装 numba 时使用，结果与循环版一致（浮点误差内）。
+
+后端在导入时确定（KERNEL_BACKEND），INDICATOR_JIT=false 可强制使用 NumPy 版。
+调用方：波动率跟踪器（VolatilityTracker.warm → atr）与支撑阻力位引擎（LevelsEngine.warm → swing_pivots）
+从历史重建状态时使用。
+numba 为可选依赖，不在 requirements.txt 中；回测等长历史场景可 `pip install numba` 获得加速。
+运行 `python jit_kernels.py` 执行一致性自检；安装 numba 时另做 numba 与 NumPy 后端的长序列基准。
+"""
+
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from indicator_kernels import decayed_cumsum
+
+# numba 为可选依赖：不可用时使用 NumPy 实现
+try:
+    import numba as _numba
+    _NUMBA_AVAILABLE = True
+except Exception as _numba_err:
+    _numba = None
+    _NUMBA_AVAILABLE = False
+
+KERNEL_BACKEND = 'numba' if _NUMBA_AVAILABLE and os.getenv('INDICATOR_JIT', 'true').lower() == 'true' else 'numpy'
+
+
+# ========== 循环版（numba 可编译的子集：标量循环 + numpy 数组） ==========
+
+def _atr_loop(high, low, close, period, out):
+    n = close.shape[0]
+    total = 0.0
+    value = 0.0
+    for i in range(n):
+        tr = high[i] - low[i]
+        if i > 0:
+            tr = max(tr, abs(high[i] - close[i - 1]), abs(low[i] - close[i - 1]))
+        if i < period:
+            total += tr
+            if i == period - 1:
+                value = total / period
+                out[i] = value
+            else:
+                out[i] = np.nan
+        else:
+            value = (value * (period - 1) + tr) / period
+            out[i] = value
+    return out
+
+
+def _pivots_loop(high, low, span, is_high, is_low):
+    n = high.shape[0]
+    for i in range(n):
+        is_high[i] = False
+        is_low[i] = False
+    for i in range(span, n - span):
+        h = high[i]
+        lo = low[i]
+        ph = True
+        pl = True
+        for j in range(i - span, i + span + 1):
+            if j == i:
+                continue
+            if high[j] >= h:
+                ph = False
+            if low[j] <= lo:
+                pl = False
+        is_high[i] = ph
+        is_low[i] = pl
+    return is_high, is_low
+
+
+# ========== NumPy 版 ==========
+
+def _wilder_mean(x, period, out):
+    """Wilder 平滑：out[period-1] 为前 period 项均值，此后 out[t] = out[t-1] + (x[t] - out[t-1]) / period"""
+    n = x.shape[0]
+    out[:min(period - 1, n)] = np.nan
+    if n < period:
+        return out
+    # y[t] = d*y[t-1] + x[t]/period 等价于 z = y*period 的衰减累加 z[t] = d*z[t-1] + x[t]
+    seq = x[period - 1:].copy()
+    seq[0] = x[:period].sum()
+    tail = out[period - 1:]
+    decayed_cumsum(seq, (period - 1) / period, tail)
+    tail /= period
+    return out
+
+
+def _atr_numpy(high, low, close, period, out):
+    tr = high - low
+    if close.shape[0] > 1:
+        prev = close[:-1]
+        np.maximum(tr[1:], np.abs(high[1:] - prev), out=tr[1:])
+        np.maximum(tr[1:], np.abs(low[1:] - prev), out=tr[1:])
+    return _wilder_mean(tr, period, out)
+
+
+def _pivots_numpy(high, low, span, is_high, is_low):
+    is_high[:] = False
+    is_low[:] = False
+    width = 2 * span + 1
+    if high.shape[0] < width:
+        return is_high, is_low
+    hw = sliding_window_view(high, width)
+    lw = sliding_window_view(low, width)
+    others_high = np.maximum(hw[:, :span].max(axis=1, initial=-np.inf), hw[:, span + 1:].max(axis=1, initial=-np.inf))
+    others_low = np.minimum(lw[:, :span].min(axis=1, initial=np.inf), lw[:, span + 1:].min(axis=1, initial=np.inf))
+    is_high[span:-span or None] = hw[:, span] > others_high
+    is_low[span:-span or None] = lw[:, span] < others_low
+    return is_high, is_low
+
+
+_LOOP_KERNELS = {
+    'atr': _atr_loop,
+    'pivots': _pivots_loop,
+}
+
+_NUMPY_KERNELS = {
+    'atr': _atr_numpy,
+    'pivots': _pivots_numpy,
+}
+
+def _compile_numba():
+    """以 njit 编译循环版内核（惰性编译，首次调用时生成机器码）"""
+    jit = _numba.njit(cache=True, nogil=True)
+    return {name: jit(fn) for name, fn in _LOOP_KERNELS.items()}
+
+
+_KERNELS = _compile_numba() if KERNEL_BACKEND == 'numba' else _NUMPY_KERNELS
+
+
+def _series(x):
+    return np.ascontiguousarray(x, dtype=np.float64)
+
+
+# ========== 公共接口（一维序列） ==========
+
+def atr(high, low, close, period=14):
+    """Wilder 平均真实波幅；首根真实波幅取 high-low，第 period 根起有值"""
+    high, low, close = _series(high), _series(low), _series(close)
+    return _KERNELS['atr'](high, low, close, period, np.empty(close.shape[0]))
+
+
+def swing_pivots(high, low, span=3):
+    """摆动枢轴点：最高(最低)价严格高(低)于左右各 span 根时为真，返回 (is_high, is_low) 布尔数组
+
+    口径与 LevelsEngine 的增量确认一致；末尾 span 根尚未确认，恒为假。
+    """
+    high, low = _series(high), _series(low)
+    n = high.shape[0]
+    return _KERNELS['pivots'](high, low, span, np.empty(n, dtype=np.bool_), np.empty(n, dtype=np.bool_))
+
+
+def _run(kernels, name, arrays):
+    """按 name 调用给定后端的内核（自检/基准用）"""
+    n = arrays['close'].shape[0]
+    if name == 'atr':
+        return kernels['atr'](arrays['high'], arrays['low'], arrays['close'], 14, np.empty(n))
+    return kernels['pivots'](arrays['high'], arrays['low'], 3, np.empty(n, dtype=np.bool_), np.empty(n, dtype=np.bool_))
+
+
+def _same(a, b):
+    if isinstance(a, tuple):
+        return all(np.array_equal(x, y) for x, y in zip(a, b))
+    return np.allclose(a, b, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+def _self_check():
+    import time
+
+    from levels_engine import LevelsEngine
+    from synthetic_market import generate_ohlcv
+    from volatility_tracker import VolatilityTracker
+
+    print(f"⚙️ 循环型指标内核后端: {KERNEL_BACKEND}" + ("" if _NUMBA_AVAILABLE else "（未安装numba）"))
+    backends = {'python循环': _LOOP_KERNELS, 'numpy': _NUMPY_KERNELS}
+    if _NUMBA_AVAILABLE:
+        # INDICATOR_JIT=false 时运行时不用 numba，但自检与基准仍比较两个后端
+        backends['numba'] = _KERNELS if KERNEL_BACKEND == 'numba' else _compile_numba()
+        warmup = {k: v for k, v in generate_ohlcv(50, seed=0).items() if k != 'timestamp'}
+        started = time.perf_counter()
+        for name in _LOOP_KERNELS:
+            _run(backends['numba'], name, warmup)
+        print(f"⏱️ numba 编译/加载耗时 {time.perf_counter() - started:.2f}s（cache=True，编译结果缓存到磁盘）")
+
+    for n in (1, 2, 7, 14, 15, 16, 199, 200, 201, 3000):
+        arrays = {k: np.ascontiguousarray(v, dtype=np.float64)
+                  for k, v in generate_ohlcv(n, seed=n, model='regime').items() if k != 'timestamp'}
+        for name in _LOOP_KERNELS:
+            expected = _run(_LOOP_KERNELS, name, arrays)
+            for label, kernels in backends.items():
+                if not _same(_run(kernels, name, arrays), expected):
+                    raise AssertionError(f"n={n} 内核 {name} 的 {label} 实现与循环版不一致")
+    print(f"✅ {'/'.join(backends)} 各内核结果一致")
+
+    # 批量建立状态（warm）与逐根 update 一致
+    for n in (1, 2, 7, 14, 15, 300, 1200):
+        data = generate_ohlcv(n, seed=n + 7, model='regime')
+        rows = [[int(data['timestamp'][i])] + [float(data[k][i]) for k in ('open', 'high', 'low', 'close', 'volume')]
+                for i in range(n)]
+        incremental, bulk = VolatilityTracker('15m'), VolatilityTracker('15m')
+        levels_incremental, levels_bulk = LevelsEngine(), LevelsEngine()
+        for row in rows:
+            incremental.update(row)
+            levels_incremental.update(row)
+        bulk.warm(data['high'], data['low'], data['close'], last_ts=rows[-1][0])
+        levels_bulk.warm(data['timestamp'], data['high'], data['low'], data['close'], data['volume'])
+        a, b = incremental.state(), bulk.state()
+        for key in a:
+            if isinstance(a[key], float):
+                if not np.allclose(a[key], b[key], rtol=1e-9, equal_nan=True):
+                    raise AssertionError(f"n={n} 波动率 {key}: 逐根 {a[key]} != 批量 {b[key]}")
+            elif a[key] != b[key]:
+                raise AssertionError(f"n={n} 波动率 {key}: 逐根 {a[key]} != 批量 {b[key]}")
+        if incremental.to_dict()['tr_sum'] != bulk.to_dict()['tr_sum']:
+            raise AssertionError(f"n={n} 波动率 tr_sum 不一致")
+        price = rows[-1][4]
+        a, b = levels_incremental.levels(price), levels_bulk.levels(price)
+        if a != b or list(levels_incremental.pivots) != list(levels_bulk.pivots):
+            raise AssertionError(f"n={n} 支撑阻力位: 逐根 {a} != 批量 {b}")
+    print("✅ VolatilityTracker.warm / LevelsEngine.warm 与逐根 update 一致")
+
+    # 长序列基准：numba 与 NumPy 后端（Python 循环版只用于一致性校验，不参与计时）
+    if not _NUMBA_AVAILABLE:
+        print("⏭️ 未安装numba，跳过 numba/NumPy 长序列基准（pip install numba 后重新运行）")
+        return
+    for n in (200_000, 2_000_000):   # 约 5.7 年 / 57 年的 15m K线
+        arrays = {k: np.ascontiguousarray(v, dtype=np.float64)
+                  for k, v in generate_ohlcv(n, seed=1, model='regime').items() if k != 'timestamp'}
+        print(f"⏱️ {n} 根K线单次计算（5次取最快）:")
+        for name in _LOOP_KERNELS:
+            timings = {}
+            for label in ('numpy', 'numba'):
+                best = float('inf')
+                for _ in range(5):
+                    started = time.perf_counter()
+                    _run(backends[label], name, arrays)
+                    best = min(best, time.perf_counter() - started)
+                timings[label] = best * 1000
+            print(f"   {name}: numpy {timings['numpy']:.1f}ms, numba {timings['numba']:.1f}ms "
+                  f"（{timings['numpy'] / timings['numba']:.1f}x）")
+
+
+if __name__ == "__main__":
+    _self_check()
@@ -0,0 +1,356 @@
+"""
+Binance USDT-M K线/标记价格 WebSocket 流
+
+订阅 <symbol>@kline_<tf> 与 <symbol>@markPrice@1s 两个流，在内存中维护K线窗口：
+- 未收盘K线原地更新，收盘帧（k.x == true）触发 on_candle_close 回调；
+- 标记价格帧更新 mark_price 并触发 on_mark_price 回调；
+- 连接断开后指数退避重连。
+
+帧处理与传输解耦：既可以连接真实/本地 WebSocket 服务（url 可配置），
+也可以用 ReplayKlineSource 回放录制的帧文件（record_path 录制），便于离线验证。
+LocalReplayServer 是本地 WebSocket 服务端（仅标准库），把录制的帧经真实的 WebSocket 传输
+推送给 KlineStream，连接/收帧/断开路径与线上一致；`python kline_stream.py` 执行端到端自检。
+"""
+
+import base64
+import hashlib
+import json
+import socket
+import threading
+import time
+
+from candle_buffer import CandleBuffer
+
+# websocket-client 为可选依赖：不可用时流模式自动回退到REST轮询
+try:
+    import websocket as _websocket
+    _WEBSOCKET_AVAILABLE = True
+except Exception as _ws_err:
+    _websocket = None
+    _WEBSOCKET_AVAILABLE = False
+
+BINANCE_USDM_WS_URL = 'wss://fstream.binance.com/stream?streams='
+
+
+def stream_symbol(symbol):
+    """'BTC/USDT' 或 'BTC/USDT:USDT' -> 'btcusdt'"""
+    return symbol.split(':')[0].replace('/', '').lower()
+
+
+def build_stream_url(symbol, timeframe, base_url=BINANCE_USDM_WS_URL):
+    """组合流地址：K线 + 1秒标记价格"""
+    s = stream_symbol(symbol)
+    return f"{base_url}{s}@kline_{timeframe}/{s}@markPrice@1s"
+
+
+def parse_kline_frame(data):
+    """解析K线帧，返回 (ohlcv行, 是否收盘)"""
+    k = data['k']
+    row = [int(k['t']), float(k['o']), float(k['h']), float(k['l']), float(k['c']), float(k['v'])]
+    return row, bool(k.get('x'))
+
+
+class KlineStream:
+    """K线流客户端：维护内存K线窗口，并在K线收盘时回调"""
+
+    def __init__(self, symbol, timeframe, buffer=None, capacity=36,
+                 on_candle_close=None, on_mark_price=None, url=None, record_path=None):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.buffer = buffer if buffer is not None else CandleBuffer(capacity, timeframe)
+        self.on_candle_close = on_candle_close
+        self.on_mark_price = on_mark_price
+        self.url = url or build_stream_url(symbol, timeframe)
+        self.record_path = record_path
+        self.mark_price = None
+        self.last_message_at = None
+        self.last_close_latency_ms = None
+        self.connected = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._ws = None
+
+    # ---------- 帧处理 ----------
+
+    def handle_message(self, raw):
+        """处理一帧原始消息（字符串或已解析的dict）"""
+        if self.record_path and isinstance(raw, str):
+            try:
+                with open(self.record_path, 'a', encoding='utf-8') as f:
+                    f.write(raw.strip() + '\n')
+            except Exception as e:
+                print(f"录制WebSocket帧失败: {e}")
+
+        msg = json.loads(raw) if isinstance(raw, str) else raw
+        data = msg.get('data', msg)  # 组合流包一层 {"stream":..., "data":...}
+        event = data.get('e')
+        self.last_message_at = time.time()
+
+        if event == 'kline':
+            row, closed = parse_kline_frame(data)
+            with self._lock:
+                self.buffer.update([row])
+            if closed:
+                close_time = int(data['k'].get('T', row[0]))
+                self.last_close_latency_ms = int(time.time() * 1000) - close_time
+                if self.on_candle_close:
+                    self.on_candle_close(self, row)
+        elif event == 'markPriceUpdate':
+            self.mark_price = float(data['p'])
+            if self.on_mark_price:
+                self.on_mark_price(self.mark_price)
+
+    def snapshot(self):
+        """线程安全地获取当前K线窗口（ccxt列表格式）"""
+        with self._lock:
+            return self.buffer.to_ohlcv()
+
+    # ---------- 连接管理 ----------
+
+    def _on_open(self, ws):
+        self.connected = True
+        print(f"✅ WebSocket已连接: {self.url}")
+
+    def _on_message(self, ws, message):
+        try:
+            self.handle_message(message)
+        except Exception as e:
+            print(f"处理WebSocket消息失败: {e}")
+
+    def _on_error(self, ws, error):
+        print(f"⚠️ WebSocket错误: {error}")
+
+    def _on_close(self, ws, code, reason):
+        self.connected = False
+        print(f"WebSocket连接关闭: {code} {reason}")
+
+    def run_forever(self):
+        """阻塞运行，断线后指数退避重连，直到 stop()"""
+        if not _WEBSOCKET_AVAILABLE:
+            raise RuntimeError('websocket-client 不可用，请安装 websocket-client 或关闭 STREAM_MODE')
+        backoff = 1
+        while not self._stop.is_set():
+            started = time.time()
+            self._ws = _websocket.WebSocketApp(
+                self.url,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_error=self._on_error,
+                on_close=self._on_close,
+            )
+            self._ws.run_forever(ping_interval=20, ping_timeout=10)
+            self.connected = False
+            if self._stop.is_set():
+                break
+            # 连接维持较久后视为正常断开，重置退避
+            if time.time() - started > 60:
+                backoff = 1
+            print(f"🔁 {backoff}秒后重连WebSocket...")
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 60)
+
+    def start(self):
+        """在后台线程中运行"""
+        if self._thread and self._thread.is_alive():
+            return self._thread
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='kline-stream', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+
+    def is_healthy(self, max_silence=30):
+        """最近 max_silence 秒内收到过消息视为健康"""
+        return self.last_message_at is not None and time.time() - self.last_message_at < max_silence
+
+
+class ReplayKlineSource:
+    """本地回放源：按录制顺序把帧喂给 KlineStream，代替真实WebSocket连接"""
+
+    def __init__(self, frames):
+        self.frames = frames
+
+    @classmethod
+    def from_file(cls, path):
+        """读取 record_path 录制的帧文件（每行一帧JSON）"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls([line for line in f if line.strip()])
+
+    def replay(self, stream, interval=0.0):
+        """依次回放所有帧，interval>0 时模拟帧间隔"""
+        for frame in self.frames:
+            stream.handle_message(frame)
+            if interval > 0:
+                time.sleep(interval)
+        return len(self.frames)
+
+
+class LocalReplayServer:
+    """本地 WebSocket 回放服务：每个连接按录制顺序推送全部帧，之后保持连接直到客户端断开或 stop()"""
+
+    _GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+    def __init__(self, frames, host='127.0.0.1', port=0, interval=0.0):
+        self.frames = [f.strip() if isinstance(f, str) else json.dumps(f) for f in frames]
+        self.interval = interval
+        self.connections = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(4)
+        self._sock.settimeout(0.2)
+        self.host, self.port = self._sock.getsockname()[:2]
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        return cls(ReplayKlineSource.from_file(path).frames, **kwargs)
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/stream"
+
+    @staticmethod
+    def _encode(payload, opcode=0x1):
+        """服务端帧（不加掩码）"""
+        data = payload.encode('utf-8') if isinstance(payload, str) else payload
+        n = len(data)
+        if n < 126:
+            header = bytes([0x80 | opcode, n])
+        elif n < 65536:
+            header = bytes([0x80 | opcode, 126]) + n.to_bytes(2, 'big')
+        else:
+            header = bytes([0x80 | opcode, 127]) + n.to_bytes(8, 'big')
+        return header + data
+
+    def _handshake(self, conn):
+        request = b''
+        while b'\r\n\r\n' not in request:
+            chunk = conn.recv(4096)
+            if not chunk:
+                return False
+            request += chunk
+        key = None
+        for line in request.decode('latin-1').split('\r\n'):
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'sec-websocket-key':
+                key = value.strip()
+        if key is None:
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + self._GUID).encode()).digest()).decode()
+        conn.sendall(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                      f'Sec-WebSocket-Accept: {accept}\r\n\r\n').encode())
+        return True
+
+    def _serve(self, conn):
+        with conn:
+            conn.settimeout(0.2)
+            try:
+                if not self._handshake(conn):
+                    return
+                self.connections += 1
+                for frame in self.frames:
+                    if self._stop.is_set():
+                        break
+                    conn.sendall(self._encode(frame))
+                    if self.interval > 0:
+                        time.sleep(self.interval)
+                # 客户端的 ping/close 帧不需要应答即可结束回放，只等待其断开
+                while not self._stop.is_set():
+                    try:
+                        if not conn.recv(4096):
+                            break
+                    except socket.timeout:
+                        continue
+                conn.sendall(self._encode(b'\x03\xe8', opcode=0x8))
+            except OSError:
+                pass
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._accept_loop, name='ws-replay', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self._sock.close()
+
+
+def _kline_frame(symbol, timeframe, row, closed, tf_ms):
+    """构造组合流格式的K线帧（与 Binance 推送字段一致）"""
+    s = stream_symbol(symbol)
+    return json.dumps({'stream': f"{s}@kline_{timeframe}", 'data': {
+        'e': 'kline', 's': s.upper(), 'k': {
+            't': row[0], 'T': row[0] + tf_ms - 1, 'i': timeframe, 'x': closed,
+            'o': str(row[1]), 'h': str(row[2]), 'l': str(row[3]), 'c': str(row[4]), 'v': str(row[5])}}})
+
+
+def _self_check():
+    """本地 WebSocket 服务回放帧 -> KlineStream 真实连接接收，校验收盘回调与K线窗口"""
+    if not _WEBSOCKET_AVAILABLE:
+        print("⚠️ websocket-client 不可用，跳过 WebSocket 回放自检")
+        return
+    from candle_buffer import timeframe_to_ms
+
+    symbol, timeframe = 'BTC/USDT:USDT', '15m'
+    tf_ms = timeframe_to_ms(timeframe)
+    t0 = 90000000
+    frames = []
+    for i in range(3):
+        ts = t0 + i * tf_ms
+        frames.append(_kline_frame(symbol, timeframe, [ts, 100 + i, 100 + i, 100 + i, 100 + i, 0.1], False, tf_ms))
+        frames.append(json.dumps({'stream': 'btcusdt@markPrice@1s',
+                                  'data': {'e': 'markPriceUpdate', 'p': str(100.5 + i)}}))
+        frames.append(_kline_frame(symbol, timeframe, [ts, 100 + i, 102 + i, 99 + i, 101 + i, 10.0 + i], True, tf_ms))
+    frames.append(_kline_frame(symbol, timeframe, [t0 + 3 * tf_ms, 103, 103, 103, 103, 0.2], False, tf_ms))
+
+    closed_rows = []
+    done = threading.Event()
+
+    def on_close(stream, row):
+        closed_rows.append(row)
+        if len(closed_rows) == 3:
+            done.set()
+
+    server = LocalReplayServer(frames).start()
+    stream = KlineStream(symbol, timeframe, capacity=10, on_candle_close=on_close, url=server.url)
+    try:
+        stream.start()
+        assert done.wait(10), f"10秒内只收到 {len(closed_rows)} 根收盘K线"
+        deadline = time.time() + 5
+        while len(stream.buffer) < 4 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        stream.stop()
+        server.stop()
+    rows = stream.snapshot()
+    assert [r[0] for r in closed_rows] == [t0 + i * tf_ms for i in range(3)]
+    assert rows[:3] == [[t0 + i * tf_ms, 100.0 + i, 102.0 + i, 99.0 + i, 101.0 + i, 10.0 + i] for i in range(3)], rows
+    assert rows[3][0] == t0 + 3 * tf_ms and stream.mark_price == 102.5
+    print(f"✅ 本地WebSocket回放 {len(frames)} 帧：收盘回调{len(closed_rows)}次，窗口{len(rows)}根，"
+          f"标记价格{stream.mark_price}，连接{server.connections}次")
+
+
+if __name__ == "__main__":
+    _self_check()
@@ -0,0 +1,196 @@
+"""
+支撑阻力位引擎 - 摆动枢轴点 + 价位聚类 + 成交量分布（Volume Profile），随K线收盘增量更新
+
+- 枢轴点：某根K线的最高(最低)价是左右各 pivot_span 根中的最高(最低)，在其右侧 pivot_span 根收盘后确认；
+- 聚类：价格相近（cluster_pct 以内）的枢轴点合并为一个价位，触及次数越多、越近期越强；
+- 成交量分布：按价格分桶累计成交量（每根K线的成交量均匀分摊到其最高-最低区间），
+  给出成交量最大的价位（POC）与包含70%成交量的价值区间。
+
+窗口为最近 history 根已收盘K线：新K线进入时增量累加，滑出窗口的K线同步扣除，
+聚类与价值区间只在数据变化后的首次查询时重算，因此每个决策周期几乎没有额外开销。
+引擎为空时用 warm() 从一段历史批量建立状态，枢轴点由 jit_kernels.swing_pivots 一次识别。
+"""
+
+import math
+from collections import deque
+
+import numpy as np
+
+import jit_kernels
+
+LEVELS_CONFIG = {
+    'history': 500,          # 参与计算的已收盘K线数量
+    'pivot_span': 3,         # 枢轴点左右各需的K线数
+    'cluster_pct': 0.003,    # 价位聚类阈值（相对价格 0.3%）
+    'bin_pct': 0.001,        # 成交量分布的价格分桶宽度（相对价格 0.1%）
+    'value_area': 0.7,       # 价值区间包含的成交量比例
+    'max_levels': 3,         # 上下方各输出的价位数量
+}
+
+
+class LevelsEngine:
+    """单个品种/周期的支撑阻力位状态"""
+
+    def __init__(self, config=None):
+        self.config = dict(LEVELS_CONFIG, **(config or {}))
+        self.reset()
+
+    def reset(self):
+        self.candles = deque()   # (ts, high, low, volume, 分桶贡献)
+        self.pivots = deque()    # (ts, price, 'high'|'low')
+        self.profile = {}        # 分桶序号 -> 成交量
+        self.bin_size = None     # 首根K线确定，之后固定，保证分桶可以增量扣除
+        self.last_ts = None
+        self._recent = deque()   # 待确认枢轴点的最近 2*span+1 根 (ts, high, low)
+        self._clusters = None
+        self._value_area = None
+
+    def _bins_for(self, high, low, volume):
+        lo = math.floor(low / self.bin_size)
+        hi = max(lo, math.floor(high / self.bin_size))
+        share = volume / (hi - lo + 1)
+        return lo, hi, share
+
+    def update(self, row):
+        """提交一根已收盘K线 [ts, o, h, l, c, v]"""
+        ts, high, low, volume = int(row[0]), float(row[2]), float(row[3]), float(row[5])
+        if self.bin_size is None:
+            self.bin_size = max(float(row[4]) * self.config['bin_pct'], 1e-12)
+
+        # 成交量分布：进入窗口累加，滑出窗口扣除
+        contribution = self._bins_for(high, low, volume)
+        lo, hi, share = contribution
+        for b in range(lo, hi + 1):
+            self.profile[b] = self.profile.get(b, 0.0) + share
+        self.candles.append((ts, contribution))
+        if len(self.candles) > self.config['history']:
+            _, (olo, ohi, oshare) = self.candles.popleft()
+            for b in range(olo, ohi + 1):
+                remaining = self.profile.get(b, 0.0) - oshare
+                if remaining <= 1e-12:
+                    self.profile.pop(b, None)
+                else:
+                    self.profile[b] = remaining
+
+        # 枢轴点：中间那根在左右 span 根内为极值即确认
+        span = self.config['pivot_span']
+        self._recent.append((ts, high, low))
+        if len(self._recent) > 2 * span + 1:
+            self._recent.popleft()
+        if len(self._recent) == 2 * span + 1:
+            mid_ts, mid_high, mid_low = self._recent[span]
+            others = [c for i, c in enumerate(self._recent) if i != span]
+            if all(mid_high > c[1] for c in others):
+                self.pivots.append((mid_ts, mid_high, 'high'))
+            if all(mid_low < c[2] for c in others):
+                self.pivots.append((mid_ts, mid_low, 'low'))
+
+        oldest = self.candles[0][0]
+        while self.pivots and self.pivots[0][0] < oldest:
+            self.pivots.popleft()
+
+        self.last_ts = ts
+        self._clusters = None
+        self._value_area = None
+
+    def warm(self, ts, high, low, close, volume):
+        """用一段已收盘K线的数组批量建立状态，等价于 reset() 后逐根 update()"""
+        self.reset()
+        ts = np.asarray(ts, dtype=np.int64)
+        high, low, volume = (np.asarray(a, dtype=np.float64) for a in (high, low, volume))
+        n = ts.shape[0]
+        if n == 0:
+            return
+        self.bin_size = max(float(close[0]) * self.config['bin_pct'], 1e-12)
+        start = max(0, n - self.config['history'])
+
+        for i in range(start, n):
+            contribution = self._bins_for(float(high[i]), float(low[i]), float(volume[i]))
+            lo, hi, share = contribution
+            for b in range(lo, hi + 1):
+                self.profile[b] = self.profile.get(b, 0.0) + share
+            self.candles.append((int(ts[i]), contribution))
+
+        span = self.config['pivot_span']
+        is_high, is_low = jit_kernels.swing_pivots(high, low, span)
+        oldest = int(ts[start])
+        for i in np.flatnonzero(is_high | is_low).tolist():
+            if ts[i] < oldest:
+                continue
+            if is_high[i]:
+                self.pivots.append((int(ts[i]), float(high[i]), 'high'))
+            if is_low[i]:
+                self.pivots.append((int(ts[i]), float(low[i]), 'low'))
+        self._recent.extend((int(ts[i]), float(high[i]), float(low[i])) for i in range(max(0, n - 2 * span - 1), n))
+        self.last_ts = int(ts[-1])
+
+    def clusters(self):
+        """聚类后的价位列表 [{'price', 'touches', 'last_ts'}]，按价格升序"""
+        if self._clusters is not None:
+            return self._clusters
+        clusters = []
+        for ts, price, _ in sorted(self.pivots, key=lambda p: p[1]):
+            if clusters:
+                c = clusters[-1]
+                center = c['sum'] / c['touches']
+                if abs(price - center) <= center * self.config['cluster_pct']:
+                    c['sum'] += price
+                    c['touches'] += 1
+                    c['last_ts'] = max(c['last_ts'], ts)
+                    continue
+            clusters.append({'sum': price, 'touches': 1, 'last_ts': ts})
+        self._clusters = [
+            {'price': c['sum'] / c['touches'], 'touches': c['touches'], 'last_ts': c['last_ts']}
+            for c in clusters
+        ]
+        return self._clusters
+
+    def value_area(self):
+        """(POC, 价值区间下沿, 价值区间上沿)，无数据时为 None"""
+        if self._value_area is not None or not self.profile:
+            return self._value_area
+        bins = sorted(self.profile)
+        volumes = [self.profile[b] for b in bins]
+        poc_i = max(range(len(bins)), key=volumes.__getitem__)
+        target = sum(volumes) * self.config['value_area']
+        lo_i = hi_i = poc_i
+        covered = volumes[poc_i]
+        # 从POC向两侧扩展，每次并入成交量较大的一侧
+        while covered < target and (lo_i > 0 or hi_i < len(bins) - 1):
+            below = volumes[lo_i - 1] if lo_i > 0 else -1.0
+            above = volumes[hi_i + 1] if hi_i < len(bins) - 1 else -1.0
+            if above >= below:
+                hi_i += 1
+                covered += above
+            else:
+                lo_i -= 1
+                covered += below
+        size = self.bin_size
+        self._value_area = (
+            (bins[poc_i] + 0.5) * size,
+            bins[lo_i] * size,
+            (bins[hi_i] + 1) * size,
+        )
+        return self._value_area
+
+    def levels(self, price):
+        """当前价格上方的阻力位与下方的支撑位（近者在前），以及成交量分布关键价"""
+        max_levels = self.config['max_levels']
+        clusters = self.clusters()
+        resistances = [c for c in clusters if c['price'] > price][:max_levels]
+        supports = [c for c in reversed(clusters) if c['price'] < price][:max_levels]
+        result = {
+            'pivot_resistances': [round(c['price'], 2) for c in resistances],
+            'pivot_supports': [round(c['price'], 2) for c in supports],
+            'pivot_resistance_touches': [c['touches'] for c in resistances],
+            'pivot_support_touches': [c['touches'] for c in supports],
+            'volume_poc': None,
+            'value_area_low': None,
+            'value_area_high': None,
+            'levels_history': len(self.candles),
+        }
+        value_area = self.value_area()
+        if value_area:
+            result['volume_poc'], result['value_area_low'], result['value_area_high'] = (
+                round(v, 2) for v in value_area)
+        return result
@@ -0,0 +1,194 @@
+"""
+多模型并发决策 - 同一 Prompt 同时发给多个 OpenAI 兼容接口（DeepSeek / 阿里百炼Qwen），统一截止时间
+
+合并方式（AI_ENSEMBLE_MODE）：
+- first: 取最先返回的有效决策；
+- vote: 按 signal 多数表决，已过半数即提前结束；平票时按信心加权决出；
+- weighted: 按信心加权（HIGH=3/MEDIUM=2/LOW=1），领先者已无法被剩余模型追平即提前结束。
+胜出方向中信心最高的回复作为最终决策（保留其止损止盈与理由）。
+
+慢模型不会拖慢决策周期：截止时间一到即用已返回的结果合并，迟到的回复只计入延迟统计。
+每个模型的成功率/延迟（EWMA）与和最终决策的一致率持续统计。
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from source_race import SourceStats
+
+# OpenAI 兼容接口：名称 -> 地址/模型/密钥环境变量
+AI_PROVIDERS = {
+    'deepseek': {
+        'label': 'DeepSeek',
+        'base_url': 'https://api.deepseek.com',
+        'model': 'deepseek-chat',
+        'api_key_env': 'DEEPSEEK_API_KEY',
+    },
+    'qwen': {
+        'label': '阿里百炼',
+        'base_url': 'https://dashscope.aliyuncs.com/compatible-mode/v1',
+        'model': 'qwen-max',
+        'api_key_env': 'DASHSCOPE_API_KEY',
+    },
+}
+
+ENSEMBLE_MODES = ('first', 'vote', 'weighted')
+CONFIDENCE_WEIGHTS = {'HIGH': 3, 'MEDIUM': 2, 'LOW': 1}
+
+
+def _weight(decision):
+    return CONFIDENCE_WEIGHTS.get(str(decision.get('confidence', 'LOW')).upper(), 1)
+
+
+def _tally(replies, weighted):
+    """{信号: 票数或信心权重}"""
+    totals = {}
+    for decision in replies.values():
+        signal = str(decision.get('signal', 'HOLD')).upper()
+        totals[signal] = totals.get(signal, 0) + (_weight(decision) if weighted else 1)
+    return totals
+
+
+def combine(replies, mode='vote'):
+    """合并各模型的有效决策，返回 (最终决策, 胜出信号)；replies 为 {模型名: 决策}，按返回先后排列"""
+    if not replies:
+        return None, None
+    if mode == 'first':
+        decision = next(iter(replies.values()))
+        return decision, str(decision.get('signal', 'HOLD')).upper()
+    totals = _tally(replies, weighted=(mode == 'weighted'))
+    best = max(totals.values())
+    leaders = [s for s, v in totals.items() if v == best]
+    if len(leaders) > 1:
+        # 平票：按信心加权决出，仍持平时取 HOLD（若在其中）或最先返回者的方向
+        weights = _tally({n: d for n, d in replies.items()
+                          if str(d.get('signal', 'HOLD')).upper() in leaders}, weighted=True)
+        top = max(weights.values())
+        leaders = [s for s in leaders if weights.get(s) == top]
+        if len(leaders) > 1:
+            leaders = ['HOLD'] if 'HOLD' in leaders else leaders[:1]
+    signal = leaders[0]
+    candidates = [d for d in replies.values() if str(d.get('signal', 'HOLD')).upper() == signal]
+    return max(candidates, key=_weight), signal
+
+
+def _decided(replies, mode, outstanding):
+    """剩余 outstanding 个模型无论如何回复都不会改变结果时返回True"""
+    if not replies:
+        return False
+    if mode == 'first':
+        return True
+    totals = sorted(_tally(replies, weighted=(mode == 'weighted')).values(), reverse=True)
+    runner_up = totals[1] if len(totals) > 1 else 0
+    remaining = outstanding * (max(CONFIDENCE_WEIGHTS.values()) if mode == 'weighted' else 1)
+    return totals[0] > runner_up + remaining
+
+
+class LLMEnsemble:
+    """多模型并发调用与合并"""
+
+    def __init__(self, members, mode='vote', deadline=20.0):
+        """members: {名称: (OpenAI客户端, 模型名)}"""
+        if mode not in ENSEMBLE_MODES:
+            raise ValueError(f"不支持的合并方式: {mode}（可选 {', '.join(ENSEMBLE_MODES)}）")
+        self.members = members
+        self.mode = mode
+        self.deadline = deadline
+        self._executor = ThreadPoolExecutor(max_workers=max(2, len(members) * 2), thread_name_prefix='llm-ensemble')
+        self._lock = threading.Lock()
+        self._stats = {name: SourceStats() for name in members}
+        self._agree = {name: 0 for name in members}
+        self._compared = {name: 0 for name in members}
+        self._timeouts = {name: 0 for name in members}
+        self._runs = 0
+        self._unanimous = 0
+        self.last_run = None
+
+    @property
+    def names(self):
+        return list(self.members)
+
+    def _call(self, name, messages, parse, kwargs):
+        client, model = self.members[name]
+        started = time.time()
+        try:
+            response = client.chat.completions.create(model=model, messages=messages,
+                                                      timeout=self.deadline, **kwargs)
+            decision = parse(response)
+            if decision is None:
+                raise ValueError('回复未能解析为有效决策')
+        except Exception as e:
+            with self._lock:
+                self._stats[name].record(False, (time.time() - started) * 1000, str(e)[:200])
+            raise
+        with self._lock:
+            self._stats[name].record(True, (time.time() - started) * 1000)
+        return decision
+
+    def run(self, messages, parse, **kwargs):
+        """并发调用全部模型，返回 (最终决策或None, 本轮详情)
+
+        parse(response) 将接口响应转换为决策字典，无效时返回None
+        """
+        started = time.time()
+        end = started + self.deadline
+        pending = {self._executor.submit(self._call, name, messages, parse, kwargs): name for name in self.members}
+        replies = {}
+        errors = {}
+        while pending and not _decided(replies, self.mode, len(pending)):
+            remaining = end - time.time()
+            if remaining <= 0:
+                break
+            done, _ = wait(list(pending), timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    replies[name] = future.result()
+                except Exception as e:
+                    errors[name] = str(e)[:200]
+                    print(f"⚠️ 模型 {name} 失败: {e}")
+
+        timed_out = list(pending.values()) if time.time() >= end else []
+        decision, signal = combine(replies, self.mode)
+        signals = {name: str(d.get('signal', 'HOLD')).upper() for name, d in replies.items()}
+        agreement = sum(1 for s in signals.values() if s == signal) / len(signals) if signals else None
+
+        with self._lock:
+            self._runs += 1
+            if len(signals) > 1 and agreement == 1.0:
+                self._unanimous += 1
+            for name, s in signals.items():
+                self._compared[name] += 1
+                self._agree[name] += s == signal
+            for name in timed_out:
+                self._timeouts[name] += 1
+            self.last_run = {
+                'mode': self.mode,
+                'signal': signal,
+                'replies': signals,
+                'errors': errors,
+                'timed_out': timed_out,
+                'skipped': [name for name in pending.values() if name not in timed_out],
+                'agreement': round(agreement, 3) if agreement is not None else None,
+                'latency_ms': round((time.time() - started) * 1000, 1),
+            }
+            return decision, dict(self.last_run)
+
+    def stats(self):
+        with self._lock:
+            providers = {}
+            for name, st in self._stats.items():
+                info = st.to_dict()
+                info['timeouts'] = self._timeouts[name]
+                info['agreement_rate'] = (round(self._agree[name] / self._compared[name], 3)
+                                          if self._compared[name] else None)
+                providers[name] = info
+            return {
+                'mode': self.mode,
+                'deadline_seconds': self.deadline,
+                'runs': self._runs,
+                'unanimous_runs': self._unanimous,
+                'providers': providers,
+                'last_run': self.last_run,
+            }
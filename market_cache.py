@@ -0,0 +1,93 @@
+"""
+交易所市场元数据缓存
+
+load_markets() 是 Binance 最重的接口之一。这里把市场数据按交易所缓存在内存和磁盘上：
+- 内存中已加载且未过期时直接复用；
+- 进程重启后优先从磁盘恢复（未过期时不访问网络）；
+- 过期后才重新下载，并写回磁盘。
+"""
+
+import json
+import os
+import threading
+import time
+
+MARKET_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'data')
+MARKET_CACHE_TTL = int(os.getenv('MARKET_CACHE_TTL', str(6 * 60 * 60)))  # 默认6小时
+
+
+class MarketCache:
+    """按交易所id缓存 markets/currencies，支持TTL与磁盘持久化"""
+
+    def __init__(self, cache_dir=MARKET_CACHE_DIR, ttl=MARKET_CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self._entries = {}  # exchange_id -> {'loaded_at', 'markets', 'currencies'}
+        self._lock = threading.Lock()
+
+    def _path(self, exchange_id):
+        return os.path.join(self.cache_dir, f"markets_{exchange_id}.json")
+
+    def _is_fresh(self, entry):
+        return entry is not None and time.time() - entry.get('loaded_at', 0) < self.ttl
+
+    def _read_disk(self, exchange_id):
+        path = self._path(exchange_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"读取市场缓存失败(忽略继续): {e}")
+            return None
+
+    def _write_disk(self, exchange_id, entry):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self._path(exchange_id) + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(exchange_id))
+        except Exception as e:
+            print(f"写入市场缓存失败(忽略继续): {e}")
+
+    def ensure(self, client):
+        """确保 client 已加载市场数据，必要时才真正调用 load_markets()"""
+        exchange_id = getattr(client, 'id', 'exchange')
+        with self._lock:
+            entry = self._entries.get(exchange_id)
+            if not self._is_fresh(entry):
+                entry = self._read_disk(exchange_id)
+                if not self._is_fresh(entry):
+                    client.load_markets(True)
+                    entry = {
+                        'loaded_at': time.time(),
+                        'markets': client.markets,
+                        'currencies': getattr(client, 'currencies', None),
+                    }
+                    client._market_cache_stamp = entry['loaded_at']
+                    self._write_disk(exchange_id, entry)
+                    print(f"✅ 已下载并缓存 {exchange_id} 市场数据（{len(entry['markets'] or {})}个）")
+                self._entries[exchange_id] = entry
+
+            # 同一个缓存条目已装入该客户端时无需重复设置
+            if not client.markets or getattr(client, '_market_cache_stamp', None) != entry['loaded_at']:
+                client.set_markets(entry['markets'], entry.get('currencies'))
+                client._market_cache_stamp = entry['loaded_at']
+            return client.markets
+
+    def invalidate(self, exchange_id=None):
+        """清除缓存（例如交易所上新合约后手动刷新）"""
+        with self._lock:
+            ids = [exchange_id] if exchange_id else list(self._entries)
+            for eid in ids:
+                self._entries.pop(eid, None)
+                try:
+                    os.remove(self._path(eid))
+                except OSError:
+                    pass
+
+
+# 进程内共享的缓存实例
+market_cache = MarketCache()
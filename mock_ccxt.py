@@ -9,6 +9,8 @@ import json
 import time
 from typing import Dict, Any, Optional
 
+from http_client import http_get
+
 __version__ = "mock-1.0.0"
 
 # 可用的交易所列表
@@ -88,7 +90,7 @@ class OKX(MockExchange):
             # 调用OKX公共API
             url = f"https://www.okx.com/api/v5/market/ticker?instId={okx_symbol}"
             
-            response = requests.get(url, timeout=10)
+            response = http_get(url, timeout=10)
             response.raise_for_status()
             
             data = response.json()
@@ -0,0 +1,89 @@
+"""
+高周期共振特征 - 基于本地重采样的 1h/4h/1d 已收盘K线计算趋势与动量
+
+每个周期的特征只在该周期有新K线收盘时重算（依据 CandleResampler.closed_count），
+其余决策周期直接复用缓存，几乎没有额外开销，也不产生额外的交易所请求。
+"""
+
+import threading
+
+import numpy as np
+
+from feature_pipeline import feature_pipeline
+
+MTF_FEATURES = ('rsi', 'macd_histogram')
+MTF_LOOKBACK = 20  # 趋势均线回看窗口（高周期K线数）
+
+
+def required_bars(lookback=MTF_LOOKBACK):
+    """每个高周期得到完整特征所需的已收盘K线数（均线窗口与 RSI/MACD 有效回看中的最大值）"""
+    return max([lookback + 1] + [feature_pipeline.effective_lookback(name) for name in MTF_FEATURES])
+
+
+def timeframe_features(bars, lookback=MTF_LOOKBACK):
+    """单个高周期的趋势/动量特征；K线不足2根时返回None"""
+    if len(bars) < 2:
+        return None
+    block = np.asarray(bars, dtype=np.float64)
+    closes = block[:, 4]
+    sma = closes[-lookback:].mean()
+    prev_sma = closes[-lookback - 1:-1].mean()
+    latest, _ = feature_pipeline.latest({'close': closes, 'volume': block[:, 5]}, MTF_FEATURES)
+    histogram = latest['macd_histogram']
+    return {
+        'trend': "上涨" if closes[-1] > sma else "下跌",
+        'change_pct': (closes[-1] - closes[-2]) / closes[-2] * 100,
+        'sma_slope_pct': (sma - prev_sma) / prev_sma * 100,
+        'rsi': latest['rsi'],
+        'macd_histogram': histogram,
+        'momentum': "多头" if histogram > 0 else "空头",
+        'bars': len(bars),
+        'complete': len(bars) >= required_bars(lookback),  # K线数不足回看窗口时，特征仅供参考
+        'last_bar_ts': int(block[-1, 0]),
+    }
+
+
+def confluence(features):
+    """多周期共振：趋势与动量同向的周期数"""
+    valid = {tf: f for tf, f in features.items() if f}
+    if not valid:
+        return None
+    bullish = sum(1 for f in valid.values() if f['trend'] == "上涨" and f['momentum'] == "多头")
+    bearish = sum(1 for f in valid.values() if f['trend'] == "下跌" and f['momentum'] == "空头")
+    total = len(valid)
+    if bullish == total:
+        label = "共振上涨"
+    elif bearish == total:
+        label = "共振下跌"
+    elif bullish > bearish:
+        label = "偏多"
+    elif bearish > bullish:
+        label = "偏空"
+    else:
+        label = "分歧"
+    return {'label': label, 'bullish': bullish, 'bearish': bearish, 'timeframes': total}
+
+
+class MtfFeatureCache:
+    """按高周期收盘计数缓存特征"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resampler = None
+        self._features = {}
+        self._counts = {}
+        self.recomputed = 0
+
+    def get(self, resampler, timeframes):
+        with self._lock:
+            if resampler is not self._resampler:
+                self._resampler = resampler
+                self._features, self._counts = {}, {}
+            for tf in timeframes:
+                count = resampler.closed_count(tf)
+                if tf in self._features and self._counts.get(tf) == count:
+                    continue
+                self._features[tf] = timeframe_features(resampler.bars(tf, include_forming=False))
+                self._counts[tf] = count
+                self.recomputed += 1
+            return {tf: self._features[tf] for tf in timeframes}
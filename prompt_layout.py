@@ -0,0 +1,159 @@
+"""
+Prompt 布局与 token 预算 - 静态前缀在前、行情数据在后，配合接口侧的前缀缓存
+
+- 角色、原则、盈亏比规则、决策标准、输出格式等静态内容放在 system 消息中，同一周期配置下逐字节不变，
+  每次调用都能命中接口的前缀缓存（DeepSeek 上下文硬盘缓存 / OpenAI prompt caching）；
+- 每周期变化的行情数据只出现在其后的 user 消息中，按分段组装；超出 token 预算时按优先级丢弃可选分段，
+  必需分段始终保留；
+- token 数按 DeepSeek 文档的换算估计（中文约0.6、其他字符约0.3 token/字），并用接口返回的
+  usage.prompt_tokens 持续校准；
+- 从 usage 中读取缓存命中 token（DeepSeek: prompt_cache_hit_tokens；
+  OpenAI 兼容: prompt_tokens_details.cached_tokens），统计命中率。
+
+流式调用时 usage 只在最后一个数据块中返回（需 stream_options.include_usage）；
+决策JSON完整后提前关闭的流拿不到 usage，只计入 usage_unavailable。
+"""
+
+import os
+import threading
+
+PROMPT_CONFIG = {
+    'token_budget': int(os.getenv('PROMPT_TOKEN_BUDGET', '3000')),  # 整个 Prompt（system+user）的 token 上限
+    'cjk_token_ratio': 0.6,     # 中文字符 -> token
+    'other_token_ratio': 0.3,   # 其他字符 -> token
+}
+
+
+def _is_cjk(ch):
+    return '一' <= ch <= '鿿' or '　' <= ch <= '〿' or '＀' <= ch <= '￯'
+
+
+def estimate_tokens(text, config=None):
+    """按字符类别估计 token 数（未经校准）"""
+    config = config or PROMPT_CONFIG
+    cjk = sum(1 for ch in text if _is_cjk(ch))
+    return int(cjk * config['cjk_token_ratio'] + (len(text) - cjk) * config['other_token_ratio']) + 1
+
+
+def fit_sections(sections, budget, fixed_tokens=0, estimate=estimate_tokens):
+    """按预算组装行情分段，返回 (文本, 估计token数, 丢弃的分段名)
+
+    sections: [(名称, 文本, 优先级)]，优先级为None表示必需；超出预算时先丢弃优先级数值大的分段。
+    分段保持原有顺序拼接。
+    """
+    costs = [estimate(text) for _, text, _ in sections]
+    total = fixed_tokens + sum(costs)
+    dropped = set()
+    optional = sorted((i for i, (_, _, priority) in enumerate(sections) if priority is not None),
+                      key=lambda i: sections[i][2], reverse=True)
+    for i in optional:
+        if total <= budget:
+            break
+        dropped.add(i)
+        total -= costs[i]
+    text = "\n".join(sections[i][1] for i in range(len(sections)) if i not in dropped)
+    return text, total, [sections[i][0] for i in sorted(dropped)]
+
+
+def _usage_value(obj, name):
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def parse_usage(usage):
+    """接口 usage -> {'prompt_tokens', 'completion_tokens', 'cached_tokens'}；无 usage 返回None"""
+    if usage is None:
+        return None
+    prompt_tokens = _usage_value(usage, 'prompt_tokens')
+    cached = _usage_value(usage, 'prompt_cache_hit_tokens')
+    if cached is None:
+        cached = _usage_value(_usage_value(usage, 'prompt_tokens_details'), 'cached_tokens')
+    return {
+        'prompt_tokens': int(prompt_tokens or 0),
+        'completion_tokens': int(_usage_value(usage, 'completion_tokens') or 0),
+        'cached_tokens': int(cached) if cached is not None else None,
+    }
+
+
+class PromptStats:
+    """Prompt 大小、预算裁剪与前缀缓存命中统计（线程安全）"""
+
+    def __init__(self, config=None):
+        self.config = dict(PROMPT_CONFIG, **(config or {}))
+        self._lock = threading.Lock()
+        self._calibration = 1.0   # 实际/估计 token 比例的移动平均
+        self._stats = {
+            'prompts': 0, 'trimmed': 0, 'calls': 0, 'usage_unavailable': 0,
+            'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0, 'cache_reported': 0,
+        }
+        self.last_prompt = None
+        self.last_usage = None
+
+    def estimate(self, text):
+        """校准后的 token 估计"""
+        return int(estimate_tokens(text, self.config) * self._calibration)
+
+    def build(self, system_prompt, sections):
+        """组装消息，返回 (messages, 本次详情)"""
+        system_tokens = self.estimate(system_prompt)
+        user_text, total, dropped = fit_sections(sections, self.config['token_budget'],
+                                                 fixed_tokens=system_tokens, estimate=self.estimate)
+        info = {
+            'system_tokens_est': system_tokens,
+            'total_tokens_est': total,
+            'budget': self.config['token_budget'],
+            'dropped_sections': dropped,
+            'over_budget': total > self.config['token_budget'],
+            # 未校准的估计，收到 usage 后用于更新校准系数
+            'raw_tokens_est': estimate_tokens(system_prompt, self.config) + estimate_tokens(user_text, self.config),
+        }
+        with self._lock:
+            self._stats['prompts'] += 1
+            self._stats['trimmed'] += bool(dropped)
+            self.last_prompt = dict(info)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_text},
+        ]
+        return messages, info
+
+    def record_usage(self, usage, raw_estimate=None):
+        """记录一次调用的 usage；返回解析后的 usage（无 usage 时为None）
+
+        raw_estimate 为该次 Prompt 未校准的估计，缺省取最近一次 build 的结果。
+        """
+        parsed = parse_usage(usage)
+        with self._lock:
+            if raw_estimate is None and self.last_prompt:
+                raw_estimate = self.last_prompt['raw_tokens_est']
+            self._stats['calls'] += 1
+            if parsed is None:
+                self._stats['usage_unavailable'] += 1
+                return None
+            self._stats['prompt_tokens'] += parsed['prompt_tokens']
+            self._stats['completion_tokens'] += parsed['completion_tokens']
+            if parsed['cached_tokens'] is not None:
+                self._stats['cached_tokens'] += parsed['cached_tokens']
+                self._stats['cache_reported'] += parsed['prompt_tokens']
+            if raw_estimate and parsed['prompt_tokens']:
+                self._calibration += 0.2 * (parsed['prompt_tokens'] / raw_estimate - self._calibration)
+            self.last_usage = parsed
+        return parsed
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            reported = s.pop('cache_reported')
+            s['cache_hit_rate'] = round(s['cached_tokens'] / reported, 4) if reported else None
+            s['token_budget'] = self.config['token_budget']
+            s['estimate_calibration'] = round(self._calibration, 3)
+            s['last_prompt'] = self.last_prompt
+            s['last_usage'] = self.last_usage
+            return s
+
+
+# 进程内共享：交易循环记录，Web 面板读取统计
+prompt_stats = PromptStats()
@@ -0,0 +1,249 @@
+"""
+交易所请求调度器 - 所有 ccxt 调用共享一份 Binance USDM 限频预算
+
+- 权重令牌桶：对应 REQUEST_WEIGHT 2400/分钟（按IP计），预留一定余量；
+- 下单令牌桶：对应 ORDERS 300/10秒；
+- 优先级排队：预算紧张时下单 > 账户 > 行情；
+- 相同的只读请求在途时合并（coalesce），后到者直接复用结果；
+- 读取响应头 X-MBX-USED-WEIGHT-1M 校准剩余预算，遇到 429/418 时整体暂停。
+
+用法：exchange = ScheduledExchange(ccxt.binanceusdm({...}))，其余代码照常调用 exchange.xxx()。
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+PRIORITY_ORDER = 0
+PRIORITY_ACCOUNT = 1
+PRIORITY_MARKET = 2
+
+RATE_LIMIT_CONFIG = {
+    'weight_limit': 2400,   # 每分钟请求权重
+    'weight_period': 60.0,
+    'order_limit': 300,     # 每10秒下单数
+    'order_period': 10.0,
+    'headroom': 0.9,        # 只使用90%的预算，留给其他进程/手工操作
+    'ban_pause': 60.0,      # 429/418 且无 Retry-After 时的暂停秒数
+}
+
+
+def klines_weight(args, kwargs):
+    """K线接口权重随 limit 变化（Binance USDM 规则）"""
+    limit = kwargs.get('limit')
+    if limit is None and len(args) > 3:
+        limit = args[3]
+    limit = limit or 500
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+# 方法名 -> (权重或权重函数, 优先级, 占用下单数, 是否可合并)
+ENDPOINT_RULES = {
+    'load_markets': (1, PRIORITY_MARKET, 0, True),
+    'fetch_ohlcv': (klines_weight, PRIORITY_MARKET, 0, True),
+    'fetch_ticker': (1, PRIORITY_MARKET, 0, True),
+    'fetch_mark_price': (1, PRIORITY_MARKET, 0, True),
+    'fetch_balance': (5, PRIORITY_ACCOUNT, 0, True),
+    'fetch_positions': (5, PRIORITY_ACCOUNT, 0, True),
+    'set_leverage': (1, PRIORITY_ACCOUNT, 0, False),
+    'set_margin_mode': (1, PRIORITY_ACCOUNT, 0, False),
+    'create_order': (1, PRIORITY_ORDER, 1, False),
+    'create_market_order': (1, PRIORITY_ORDER, 1, False),
+    'cancel_order': (1, PRIORITY_ORDER, 0, False),
+}
+
+
+class TokenBucket:
+    """按时间线性回填的令牌桶"""
+
+    def __init__(self, capacity, period):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """还需等待多久才能取出 amount 个令牌"""
+        self._refill(now)
+        if amount <= 0 or self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.tokens -= amount
+
+    def sync_used(self, used, now):
+        """按服务端报告的已用权重校准（只会减少剩余令牌）"""
+        self._refill(now)
+        self.tokens = min(self.tokens, self.capacity - used)
+
+
+class RequestScheduler:
+    """带优先级与请求合并的权重调度器"""
+
+    def __init__(self, config=None):
+        cfg = dict(RATE_LIMIT_CONFIG, **(config or {}))
+        self.config = cfg
+        self.weight_bucket = TokenBucket(cfg['weight_limit'] * cfg['headroom'], cfg['weight_period'])
+        self.order_bucket = TokenBucket(cfg['order_limit'] * cfg['headroom'], cfg['order_period'])
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._stats = {'requests': 0, 'coalesced': 0, 'throttled': 0, 'wait_ms': 0.0}
+
+    def acquire(self, weight, priority=PRIORITY_MARKET, orders=0):
+        """阻塞直到预算允许，并按优先级先后放行"""
+        ticket = (priority, next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._waiters[0] == ticket:
+                        wait = max(
+                            self.weight_bucket.wait_time(weight, now),
+                            self.order_bucket.wait_time(orders, now),
+                            self._paused_until - now,
+                        )
+                        if wait <= 0:
+                            self.weight_bucket.take(weight, now)
+                            self.order_bucket.take(orders, now)
+                            return
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait(1.0)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._stats['requests'] += 1
+                self._stats['wait_ms'] += (time.monotonic() - started) * 1000
+                self._cond.notify_all()
+
+    def pause(self, seconds):
+        """遇到限频响应时暂停所有请求"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._stats['throttled'] += 1
+            self._cond.notify_all()
+        print(f"⛔ 触发交易所限频，暂停请求{seconds:.0f}秒")
+
+    def sync_used_weight(self, used):
+        with self._cond:
+            self.weight_bucket.sync_used(used, time.monotonic())
+
+    def call(self, fn, weight=1, priority=PRIORITY_MARKET, orders=0, key=None):
+        """在预算内执行 fn()；key 不为空时合并相同的在途请求"""
+        owner = True
+        if key is not None:
+            with self._inflight_lock:
+                future = self._inflight.get(key)
+                if future is None:
+                    future = Future()
+                    self._inflight[key] = future
+                else:
+                    owner = False
+            if not owner:
+                with self._cond:
+                    self._stats['coalesced'] += 1
+                return future.result()
+
+        try:
+            self.acquire(weight, priority, orders)
+            result = fn()
+        except Exception as e:
+            if type(e).__name__ in ('RateLimitExceeded', 'DDoSProtection'):
+                self.pause(self.config['ban_pause'])
+            if key is not None:
+                self._finish(key, future, error=e)
+            raise
+        if key is not None:
+            self._finish(key, future, result=result)
+        return result
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._inflight_lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            self.weight_bucket._refill(now)
+            return dict(
+                self._stats,
+                weight_available=round(self.weight_bucket.tokens, 1),
+                paused_seconds=round(max(0.0, self._paused_until - now), 1),
+                queued=len(self._waiters),
+            )
+
+
+def _freeze(value):
+    """把参数转换为可哈希的合并键"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class ScheduledExchange:
+    """ccxt 交易所对象的代理：受控方法经调度器执行，其余属性原样透传"""
+
+    def __init__(self, client, scheduler=None):
+        object.__setattr__(self, '_client', client)
+        object.__setattr__(self, '_scheduler', scheduler or request_scheduler)
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        rule = ENDPOINT_RULES.get(name)
+        if rule is None or not callable(attr):
+            return attr
+        weight, priority, orders, coalesce = rule
+
+        def scheduled(*args, **kwargs):
+            w = weight(args, kwargs) if callable(weight) else weight
+            key = None
+            if coalesce:
+                key = (getattr(self._client, 'id', ''), id(self._client), name, _freeze(args), _freeze(kwargs))
+            result = self._scheduler.call(lambda: attr(*args, **kwargs), w, priority, orders, key)
+            self._sync_headers()
+            return result
+
+        return scheduled
+
+    def __setattr__(self, name, value):
+        setattr(self._client, name, value)
+
+    def _sync_headers(self):
+        headers = getattr(self._client, 'last_response_headers', None) or {}
+        for k, v in headers.items():
+            if k.lower() == 'x-mbx-used-weight-1m':
+                try:
+                    self._scheduler.sync_used_weight(int(v))
+                except (TypeError, ValueError):
+                    pass
+                break
+
+
+# 进程内共享调度器：所有交易所客户端（含Web面板触发的请求）共用同一预算
+request_scheduler = RequestScheduler()
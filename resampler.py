@@ -0,0 +1,141 @@
+"""
+多周期K线重采样 - 由单一基础周期序列在本地合成更高周期K线
+
+基础周期（如 1m/5m/15m）每收盘一根，就增量并入各目标周期的当前K线：
+开盘取桶内第一根、最高/最低取极值、收盘取最后一根、成交量累加。
+桶按 UTC 纪元对齐（与 Binance 的 1h/4h/1d 划分一致），
+桶内最后一根基础K线收盘即视为该高周期K线收盘。
+
+只有从桶边界开始、中间没有缺失的桶才作为已收盘K线输出：首根基础K线落在桶中间
+（序列起点或缺口之后）或桶内有缺口的K线会被丢弃，避免高周期特征混入残缺K线。
+"""
+
+import threading
+import time
+
+from candle_buffer import CandleBuffer, timeframe_to_ms
+
+
+class CandleResampler:
+    """将基础周期已收盘K线增量聚合为多个更高周期"""
+
+    def __init__(self, base_timeframe, target_timeframes, capacity=200):
+        self.base_timeframe = base_timeframe
+        self.base_ms = timeframe_to_ms(base_timeframe)
+        self.targets = {}
+        for tf in target_timeframes:
+            tf_ms = timeframe_to_ms(tf)
+            if tf_ms < self.base_ms or tf_ms % self.base_ms:
+                raise ValueError(f"{tf} 不是基础周期 {base_timeframe} 的整数倍")
+            self.targets[tf] = CandleBuffer(capacity, tf)
+        self.last_base_ts = None
+        self._forming = {}  # 周期 -> {'bar': 当前正在聚合的K线, 'next_ts': 下一根基础K线, 'complete': 是否完整}
+        self._closed_counts = {tf: 0 for tf in self.targets}
+        self._dropped_counts = {tf: 0 for tf in self.targets}
+        self._lock = threading.Lock()
+
+    def _merge(self, tf, row):
+        """把一根基础K线并入目标周期，返回该周期是否因此收盘了一根完整K线"""
+        buf = self.targets[tf]
+        tf_ms = buf.timeframe_ms
+        ts, o, h, l, c, v = row[:6]
+        bucket = ts // tf_ms * tf_ms
+        state = self._forming.get(tf)
+        if state is not None and state['bar'][0] == bucket:
+            bar = state['bar']
+            bar[2] = max(bar[2], h)
+            bar[3] = min(bar[3], l)
+            bar[4] = c
+            bar[5] += v
+            if ts != state['next_ts']:
+                state['complete'] = False
+        else:
+            if state is not None:
+                # 上一个桶没等到最后一根基础K线（缺口），不输出
+                self._dropped_counts[tf] += 1
+            state = {'bar': [bucket, o, h, l, c, v], 'complete': ts == bucket}
+            self._forming[tf] = state
+        state['next_ts'] = ts + self.base_ms
+        if ts + self.base_ms != bucket + tf_ms:
+            return False
+        del self._forming[tf]
+        if not state['complete']:
+            self._dropped_counts[tf] += 1
+            return False
+        buf.update([state['bar']])
+        return True
+
+    def update(self, rows, now_ms=None):
+        """输入基础周期K线（可重复、可含未收盘K线），只处理新的已收盘K线。
+        返回本次收盘的高周期列表。"""
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        closed = []
+        with self._lock:
+            for row in sorted(rows, key=lambda r: r[0]):
+                ts = int(row[0])
+                if self.last_base_ts is not None and ts <= self.last_base_ts:
+                    continue
+                if ts + self.base_ms > now_ms:
+                    break  # 基础K线未收盘
+                values = [ts] + [float(x) for x in row[1:6]]
+                for tf in self.targets:
+                    if self._merge(tf, values):
+                        self._closed_counts[tf] += 1
+                        if tf not in closed:
+                            closed.append(tf)
+                self.last_base_ts = ts
+        return closed
+
+    def bars(self, tf, include_forming=True):
+        """目标周期K线（ccxt列表格式，时间升序）；include_forming 时附带仍在聚合、且从桶边界开始的当前K线"""
+        with self._lock:
+            rows = self.targets[tf].to_ohlcv()
+            state = self._forming.get(tf)
+            if include_forming and state is not None and state['complete']:
+                rows.append(list(state['bar']))
+        return rows
+
+    def closed_count(self, tf):
+        """自创建以来该周期收盘的K线数（用于判断是否需要重新计算高周期特征）"""
+        return self._closed_counts[tf]
+
+    def dropped_count(self, tf):
+        """因起点不在桶边界或桶内有缺口而丢弃的K线数"""
+        return self._dropped_counts[tf]
+
+
+_resamplers = {}
+_resamplers_lock = threading.Lock()
+
+
+def get_resampler(key, base_timeframe, target_timeframes, capacity=200):
+    """获取进程内共享的重采样器；key 通常为 (数据源, 符号, 基础周期)，不同来源/品种互不混合"""
+    with _resamplers_lock:
+        resampler = _resamplers.get(key)
+        if resampler is None or resampler.base_timeframe != base_timeframe:
+            resampler = CandleResampler(base_timeframe, target_timeframes, capacity)
+            _resamplers[key] = resampler
+        return resampler
+
+
+def _self_check():
+    """基础序列从1h桶中间开始、中途有缺口时，只输出完整的1h K线"""
+    base_ms = timeframe_to_ms('15m')
+    hour = timeframe_to_ms('1h')
+    start = 100 * hour + 2 * base_ms          # 从第100小时的第3根15m开始
+    ts_list = [start + i * base_ms for i in range(14)]
+    ts_list = [t for t in ts_list if t != 102 * hour + base_ms]  # 第102小时缺一根
+    rows = [[t, 1.0, 2.0, 0.5, 1.5, 1.0] for t in ts_list]
+
+    resampler = CandleResampler('15m', ['1h'])
+    resampler.update(rows, now_ms=ts_list[-1] + base_ms)
+    bars = resampler.bars('1h', include_forming=False)
+    assert [b[0] for b in bars] == [101 * hour, 103 * hour], bars
+    assert all(b[5] == 4.0 for b in bars), bars
+    assert resampler.dropped_count('1h') == 2, resampler.dropped_count('1h')
+    assert resampler.closed_count('1h') == 2
+    print(f"✅ 1h: 输出{len(bars)}根完整K线，丢弃{resampler.dropped_count('1h')}根残缺K线（起点在桶中间/桶内缺口）")
+
+
+if __name__ == "__main__":
+    _self_check()
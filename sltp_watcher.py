@@ -0,0 +1,109 @@
+"""
+止盈止损监视器 - 在两次决策之间高频检查标记价格
+
+开仓后把方向与止损/止盈价保存在内存中，后台线程每隔几秒（或在每个WebSocket价格推送时）
+比较最新价格，触发后回调平仓。检查过程不访问数据库，也不运行指标与AI流程。
+触发时先原子地取出并清空持仓价位，保证同一持仓只会平仓一次；
+价位每次登记/清除都会递增 version，回调方可据此丢弃在此期间已被平仓或替换的持仓的触发。
+"""
+
+import threading
+
+
+def evaluate_stop_take_profit(side, stop_loss, take_profit, price):
+    """判断价格是否触发止损/止盈，返回 (触发原因, 平仓动作, 平仓信号)，未触发返回 (None, None, None)"""
+    if side == 'long':
+        if price <= stop_loss:
+            return '止损触发', 'close_long', 'SELL'
+        if price >= take_profit:
+            return '止盈触发', 'close_long', 'SELL'
+    elif side == 'short':
+        if price >= stop_loss:
+            return '止损触发', 'close_short', 'BUY'
+        if price <= take_profit:
+            return '止盈触发', 'close_short', 'BUY'
+    return None, None, None
+
+
+class StopTakeProfitWatcher:
+    """内存中的持仓止盈止损监视器"""
+
+    def __init__(self, price_source=None, on_trigger=None, interval=3.0):
+        self.price_source = price_source  # 无参函数，返回最新价格或None
+        self.on_trigger = on_trigger      # on_trigger(levels, price, triggered, close_action, close_signal)
+        self.interval = interval
+        self.synced = False               # 是否已从数据库同步过持仓（之后以内存为准）
+        self.last_price = None
+        self.version = 0                  # 价位每次登记/清除递增
+        self._levels = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def set_levels(self, side, stop_loss, take_profit, entry_price=None, amount=None):
+        """开仓后登记止损/止盈价"""
+        with self._lock:
+            self.version += 1
+            self._levels = {
+                'side': side,
+                'stop_loss': float(stop_loss),
+                'take_profit': float(take_profit),
+                'entry_price': entry_price,
+                'amount': amount,
+                'version': self.version,
+            }
+            self.synced = True
+
+    def clear(self):
+        """持仓已平仓（反转、止盈止损等）时清除价位"""
+        with self._lock:
+            self.version += 1
+            self._levels = None
+            self.synced = True
+
+    def is_current(self, levels):
+        """触发的价位是否仍是最近一次登记的持仓（期间未被清除或替换）"""
+        with self._lock:
+            return levels.get('version') == self.version
+
+    def levels(self):
+        with self._lock:
+            return dict(self._levels) if self._levels else None
+
+    def on_price(self, price):
+        """检查一个价格，触发则回调并返回True"""
+        if price is None:
+            return False
+        self.last_price = price
+        with self._lock:
+            levels = self._levels
+            if not levels:
+                return False
+            triggered, close_action, close_signal = evaluate_stop_take_profit(
+                levels['side'], levels['stop_loss'], levels['take_profit'], price)
+            if not triggered:
+                return False
+            self._levels = None
+        if self.on_trigger:
+            self.on_trigger(levels, price, triggered, close_action, close_signal)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._levels and self.price_source:
+                try:
+                    self.on_price(self.price_source())
+                except Exception as e:
+                    print(f"止盈止损监视检查失败: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return self._thread
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sltp-watcher', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
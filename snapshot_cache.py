@@ -0,0 +1,89 @@
+"""
+指标快照缓存 - 同一根K线内复用已计算的 price_data（指标、趋势与支撑阻力分析）
+
+键为 (符号, 周期, 最新K线开盘时间)。Web面板初始化、交易循环、优化报告等调用方在同一根K线内
+只会触发一次拉取与计算；并发的相同请求合并为一次（后到者等待先到者的结果）。
+新K线开盘后键自然变化，旧条目按数量上限淘汰。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from candle_buffer import timeframe_to_ms
+
+
+def current_candle_key(symbol, timeframe, now_ms=None):
+    """当前（未收盘）K线对应的缓存键，无需访问网络"""
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    tf_ms = timeframe_to_ms(timeframe)
+    return (symbol, timeframe, now_ms // tf_ms * tf_ms)
+
+
+class SnapshotCache:
+    """按K线开盘时间分桶的进程内缓存（线程安全，带请求合并）"""
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}  # 键 -> threading.Event
+        self._stats = {'hits': 0, 'misses': 0, 'waits': 0}
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key, loader, cacheable=None):
+        """命中直接返回；否则调用 loader()，cacheable(value) 为真时写入缓存"""
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value
+            with self._lock:
+                event = self._loading.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self._loading[key] = event
+                    self._stats['misses'] += 1
+                    owner = True
+                else:
+                    self._stats['waits'] += 1
+                    owner = False
+            if owner:
+                break
+            # 等待先到者完成后重新检查；其结果不可缓存（如回退数据）时由某个等待者接手加载
+            event.wait()
+
+        try:
+            value = loader()
+            if value is not None and (cacheable is None or cacheable(value)):
+                self.put(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            event.set()
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+# 进程内共享：Web面板与交易循环共用
+indicator_snapshot_cache = SnapshotCache()
@@ -0,0 +1,135 @@
+"""
+数据源对冲竞速
+
+对同一份数据的多个候选来源（如 USDM 主接口 / 备用客户端、Binance / Coinbase / CoinGecko），
+在统一截止时间内并发请求，取第一个通过校验的结果：
+- 候选按历史成功率与平均延迟排序，最优的先发；
+- hedge_delay > 0 时，其余来源在前一个未及时返回（或已失败）后才依次补发，避免无谓的重复请求；
+- 每个来源的成功率与延迟（EWMA）持续统计，迟到的结果也会计入。
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class SourceStats:
+    """单个数据源的成功率与延迟统计"""
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.success = 0
+        self.failure = 0
+        self.latency_ms = None  # EWMA
+        self.last_error = None
+
+    def record(self, ok, latency_ms, error=None):
+        if ok:
+            self.success += 1
+        else:
+            self.failure += 1
+            self.last_error = error
+        if self.latency_ms is None:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms = self.alpha * latency_ms + (1 - self.alpha) * self.latency_ms
+
+    @property
+    def success_rate(self):
+        total = self.success + self.failure
+        # 无记录的数据源给中性先验，保证新来源有机会被尝试
+        return (self.success + 1) / (total + 2)
+
+    def to_dict(self):
+        return {
+            'success': self.success,
+            'failure': self.failure,
+            'success_rate': round(self.success_rate, 3),
+            'latency_ms': round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            'last_error': self.last_error,
+        }
+
+
+class SourceRacer:
+    """在截止时间内对冲请求多个候选数据源"""
+
+    def __init__(self, max_workers=8):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='source-race')
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _get_stats(self, name):
+        with self._lock:
+            if name not in self._stats:
+                self._stats[name] = SourceStats()
+            return self._stats[name]
+
+    def _score(self, name):
+        st = self._get_stats(name)
+        latency = st.latency_ms if st.latency_ms is not None else 0.0
+        # 成功率优先，延迟其次
+        return (-round(st.success_rate, 1), latency)
+
+    def ranked(self, candidates):
+        """按成功率、延迟对候选排序（稳定排序，统计相同时保持原有优先级）"""
+        return sorted(candidates, key=lambda c: self._score(c[0]))
+
+    def _run(self, name, fn, validate):
+        started = time.time()
+        try:
+            result = fn()
+            if validate is not None and not validate(result):
+                raise ValueError('返回结果未通过校验')
+        except Exception as e:
+            self._get_stats(name).record(False, (time.time() - started) * 1000, str(e)[:200])
+            raise
+        self._get_stats(name).record(True, (time.time() - started) * 1000)
+        return result
+
+    def race(self, candidates, deadline=10.0, hedge_delay=0.0, validate=None):
+        """对冲竞速，返回 (来源名, 结果)；全部失败或超时返回 (None, None)
+
+        candidates: [(name, fn), ...]，fn 无参数
+        deadline: 统一截止时间（秒）
+        hedge_delay: 补发下一个来源前的等待时间，0 表示全部同时发出
+        validate: 结果校验函数，返回False视为失败
+        """
+        queue = list(self.ranked(candidates))
+        end = time.time() + deadline
+        pending = {}
+        next_launch = time.time()
+
+        while queue or pending:
+            now = time.time()
+            if now >= end:
+                break
+            # 到了补发时间（或没有在途请求）则发出下一个候选
+            if queue and (not pending or now >= next_launch):
+                name, fn = queue.pop(0)
+                pending[self._executor.submit(self._run, name, fn, validate)] = name
+                next_launch = now + hedge_delay
+                continue
+
+            wait_until = min(end, next_launch) if queue else end
+            done, _ = wait(list(pending), timeout=max(0.0, wait_until - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    return name, future.result()
+                except Exception as e:
+                    print(f"⚠️ 数据源 {name} 失败: {e}")
+                    # 失败后立即补发下一个候选
+                    next_launch = time.time()
+
+        if pending:
+            print(f"⏱️ 数据源竞速超时({deadline}s)，未返回: {', '.join(pending.values())}")
+        return None, None
+
+    def stats(self):
+        """各数据源统计快照"""
+        with self._lock:
+            return {name: st.to_dict() for name, st in self._stats.items()}
+
+
+# 进程内共享实例
+source_racer = SourceRacer()
@@ -0,0 +1,110 @@
+"""
+流式补全的增量JSON解析 - 决策对象一完整即关闭流
+
+模型按 token 流式返回时，逐块扫描文本：跳过对象之前的说明文字或 ```json 围栏，
+在字符串之外按花括号深度跟踪第一个 JSON 对象，深度回到0即视为完整，立即关闭流。
+对象之后的解释文字、Markdown 不再等待，也不再计入输出 token。
+
+read_completion() 同时兼容非流式响应，调用方无需区分两种模式。
+usage 只在流的最后一块返回（需 stream_options.include_usage），提前关闭时为None。
+"""
+
+import time
+
+
+class JsonObjectScanner:
+    """增量扫描第一个顶层 JSON 对象（正确处理字符串内的花括号与转义）"""
+
+    def __init__(self, max_chars=20000):
+        self.max_chars = max_chars
+        self.reset()
+
+    def reset(self):
+        self._parts = []
+        self._chars = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self.result = None
+
+    @property
+    def done(self):
+        return self.result is not None
+
+    def feed(self, text):
+        """追加一段文本；对象完整时返回对象文本，否则返回None"""
+        if self.done or not text:
+            return self.result
+        if not self._started:
+            start = text.find('{')
+            if start == -1:
+                return None
+            self._started = True
+            text = text[start:]
+        for i, ch in enumerate(text):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '{':
+                self._depth += 1
+            elif ch == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[:i + 1])
+                    self.result = ''.join(self._parts)
+                    return self.result
+        self._parts.append(text)
+        self._chars += len(text)
+        if self._chars > self.max_chars:
+            raise ValueError(f"JSON对象超过 {self.max_chars} 字符仍未结束")
+        return None
+
+    def partial(self):
+        """已收到的对象文本（未完整）"""
+        return ''.join(self._parts)
+
+
+def read_completion(response, max_chars=20000):
+    """读取补全文本，返回 (文本, 统计)
+
+    非流式响应直接返回 message.content；流式响应逐块扫描，决策对象完整即关闭流并只返回对象文本。
+    流结束仍未得到完整对象时返回收到的全部文本，由调用方按解析失败处理。
+    """
+    if hasattr(response, 'choices'):
+        content = response.choices[0].message.content if response.choices else None
+        return content, {'streamed': False, 'usage': getattr(response, 'usage', None)}
+
+    started = time.perf_counter()
+    scanner = JsonObjectScanner(max_chars)
+    received = []
+    info = {'streamed': True, 'chunks': 0, 'first_token_s': None, 'early_stop': False, 'usage': None}
+    try:
+        for chunk in response:
+            if getattr(chunk, 'usage', None) is not None:
+                info['usage'] = chunk.usage
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if not text:
+                continue
+            info['chunks'] += 1
+            if info['first_token_s'] is None:
+                info['first_token_s'] = round(time.perf_counter() - started, 3)
+            received.append(text)
+            if scanner.feed(text) is not None:
+                info['early_stop'] = True
+                break
+    finally:
+        # 提前结束时关闭连接，服务端停止生成
+        close = getattr(response, 'close', None)
+        if close is not None:
+            close()
+    info['elapsed_s'] = round(time.perf_counter() - started, 3)
+    return (scanner.result if scanner.done else ''.join(received)), info
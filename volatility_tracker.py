@@ -0,0 +1,237 @@
+"""
+波动率与行情状态跟踪 - ATR / 已实现波动率 / 波动状态，每根已收盘K线 O(1) 更新
+
+- ATR: Wilder 平滑（与 jit_kernels.atr 口径一致：首根真实波幅取 high-low，第 atr_period 根起有值）；
+- 已实现波动率: 最近 vol_window 根对数收益率的标准差（窗口化 Welford）；
+- 基准波动率: 对数收益率平方的长周期 EWMA，短期/基准之比给出 低波动/正常/高波动 状态；
+- 默认止损止盈: 按 ATR 的倍数给出价位距离，替代固定的 -2%/+3%（无数据时仍回退到固定比例）。
+
+从一段历史建立状态（重建、临时计算）时用 warm() 批量计算，ATR 走 jit_kernels 内核，
+结果与逐根 update() 一致（浮点误差内）。
+
+状态可序列化为 JSON（data/volatility_<符号>_<周期>.json），进程重启后从上次的K线继续，
+与新K线之间有缺口时由调用方重建。
+"""
+
+import json
+import math
+import os
+
+import numpy as np
+
+import jit_kernels
+from candle_buffer import timeframe_to_ms
+from indicator_engine import RollingStd
+from indicator_kernels import decayed_cumsum
+
+NAN = float('nan')
+
+VOLATILITY_STATE_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+VOLATILITY_CONFIG = {
+    'atr_period': 14,
+    'vol_window': 96,          # 已实现波动率窗口（15m 周期约1天）
+    'baseline_span': 960,      # 基准波动率 EWMA 跨度（15m 周期约10天）
+    'low_ratio': 0.7,          # 短期/基准 低于此值为低波动
+    'high_ratio': 1.5,         # 短期/基准 高于此值为高波动
+    'stop_atr': 1.5,           # 默认止损距离 = stop_atr × ATR
+    'reward_ratio': 1.5,       # 默认止盈距离 = 止损距离 × reward_ratio（盈亏比1.5:1）
+    'min_stop_pct': 0.005,     # 止损距离下限（相对价格）
+    'max_stop_pct': 0.05,      # 止损距离上限（相对价格）
+    'fallback_stop_pct': 0.02, # 波动率未就绪时的固定止损比例
+}
+
+# 影响跟踪器内部状态的参数：与磁盘状态不一致时丢弃旧状态重建
+STATE_KEYS = ('atr_period', 'vol_window', 'baseline_span')
+
+REGIME_LABELS = {'low': "低波动", 'normal': "正常", 'high': "高波动", 'unknown': "未知"}
+
+
+class VolatilityTracker:
+    """单个品种/周期的波动率状态"""
+
+    def __init__(self, timeframe='15m', config=None):
+        self.timeframe = timeframe
+        self.config = dict(VOLATILITY_CONFIG, **(config or {}))
+        # 每年K线数，用于年化波动率
+        self.periods_per_year = 365 * 24 * 60 * 60 * 1000 / timeframe_to_ms(timeframe)
+        self.reset()
+
+    def reset(self):
+        self.last_ts = None
+        self.prev_close = None
+        self.count = 0
+        self.atr = NAN
+        self._tr_sum = 0.0
+        self._returns = RollingStd(self.config['vol_window'])
+        self._std = NAN
+        self._baseline_var = NAN
+        self._state = None
+
+    def update(self, row):
+        """提交一根已收盘K线 [ts, o, h, l, c, v]"""
+        ts, high, low, close = int(row[0]), float(row[2]), float(row[3]), float(row[4])
+        period = self.config['atr_period']
+
+        tr = high - low
+        if self.prev_close is not None:
+            tr = max(tr, abs(high - self.prev_close), abs(low - self.prev_close))
+        if self.count < period:
+            self._tr_sum += tr
+            if self.count == period - 1:
+                self.atr = self._tr_sum / period
+        else:
+            self.atr = (self.atr * (period - 1) + tr) / period
+
+        if self.prev_close is not None and self.prev_close > 0 and close > 0:
+            r = math.log(close / self.prev_close)
+            self._std = self._returns.push(r)
+            alpha = 2.0 / (self.config['baseline_span'] + 1.0)
+            if math.isnan(self._baseline_var):
+                self._baseline_var = r * r
+            else:
+                self._baseline_var += alpha * (r * r - self._baseline_var)
+
+        self.prev_close = close
+        self.last_ts = ts
+        self.count += 1
+        self._state = None
+
+    def warm(self, high, low, close, last_ts=None):
+        """用一段已收盘K线的 high/low/close 数组批量建立状态，等价于 reset() 后逐根 update()"""
+        self.reset()
+        high, low, close = (np.asarray(a, dtype=np.float64) for a in (high, low, close))
+        n = close.shape[0]
+        if n == 0:
+            return
+        period = self.config['atr_period']
+
+        if n >= period:
+            self.atr = float(jit_kernels.atr(high, low, close, period)[-1])
+        tr = high[:period] - low[:period]
+        if n > 1:
+            prev = close[:tr.shape[0] - 1]
+            tr[1:] = np.maximum(tr[1:], np.maximum(np.abs(high[1:period] - prev), np.abs(low[1:period] - prev)))
+        self._tr_sum = sum(tr.tolist())   # 与逐根累加的顺序一致
+
+        prev, cur = close[:-1], close[1:]
+        valid = (prev > 0) & (cur > 0)
+        returns = np.log(cur[valid] / prev[valid])
+        for r in returns[-self.config['vol_window']:].tolist():
+            self._std = self._returns.push(r)
+        if returns.shape[0]:
+            # b[0] = r0², b[t] = (1-α)·b[t-1] + α·r[t]²
+            alpha = 2.0 / (self.config['baseline_span'] + 1.0)
+            seq = alpha * returns * returns
+            seq[0] = returns[0] * returns[0]
+            self._baseline_var = float(decayed_cumsum(seq, 1.0 - alpha, np.empty_like(seq))[-1])
+
+        self.prev_close = float(close[-1])
+        self.last_ts = None if last_ts is None else int(last_ts)
+        self.count = n
+
+    def state(self):
+        """当前波动率快照（字典，数值为 NaN 表示尚未就绪）"""
+        if self._state is not None:
+            return self._state
+        std = self._std
+        baseline = math.sqrt(self._baseline_var) if not math.isnan(self._baseline_var) else NAN
+        ratio = std / baseline if baseline > 0 and not math.isnan(std) else NAN
+        if math.isnan(ratio):
+            regime = 'unknown'
+        elif ratio < self.config['low_ratio']:
+            regime = 'low'
+        elif ratio > self.config['high_ratio']:
+            regime = 'high'
+        else:
+            regime = 'normal'
+        price = self.prev_close or NAN
+        self._state = {
+            'atr': self.atr,
+            'atr_pct': self.atr / price * 100 if price > 0 else NAN,
+            'realized_vol_pct': std * 100,
+            'annualized_vol_pct': std * math.sqrt(self.periods_per_year) * 100,
+            'baseline_vol_pct': baseline * 100,
+            'vol_ratio': ratio,
+            'regime': regime,
+            'regime_label': REGIME_LABELS[regime],
+            'candles': self.count,
+            'last_ts': self.last_ts,
+        }
+        return self._state
+
+    def to_dict(self):
+        return {
+            'timeframe': self.timeframe,
+            'config': self.config,
+            'last_ts': self.last_ts,
+            'prev_close': self.prev_close,
+            'count': self.count,
+            'atr': None if math.isnan(self.atr) else self.atr,
+            'tr_sum': self._tr_sum,
+            'returns': list(self._returns.values),
+            'baseline_var': None if math.isnan(self._baseline_var) else self._baseline_var,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        tracker = cls(data['timeframe'])
+        tracker.last_ts = data['last_ts']
+        tracker.prev_close = data['prev_close']
+        tracker.count = data['count']
+        tracker.atr = NAN if data['atr'] is None else data['atr']
+        tracker._tr_sum = data['tr_sum']
+        for r in data['returns'][-tracker.config['vol_window']:]:
+            tracker._std = tracker._returns.push(r)
+        tracker._baseline_var = NAN if data['baseline_var'] is None else data['baseline_var']
+        return tracker
+
+
+def default_stops(price, state=None, signal='BUY', config=None):
+    """按 ATR 给出默认 (止损, 止盈)；ATR 未就绪时回退为固定比例
+
+    SELL 的止损在价格上方；BUY/HOLD 按多头方向给出。
+    """
+    config = dict(VOLATILITY_CONFIG, **(config or {}))
+    atr = (state or {}).get('atr', NAN)
+    if price > 0 and atr is not None and not math.isnan(atr) and atr > 0:
+        stop_pct = min(max(config['stop_atr'] * atr / price, config['min_stop_pct']), config['max_stop_pct'])
+    else:
+        stop_pct = config['fallback_stop_pct']
+    take_pct = stop_pct * config['reward_ratio']
+    if signal == 'SELL':
+        return price * (1 + stop_pct), price * (1 - take_pct)
+    return price * (1 - stop_pct), price * (1 + take_pct)
+
+
+def _state_path(symbol, timeframe, directory=VOLATILITY_STATE_DIR):
+    safe = symbol.replace('/', '').replace(':', '_')
+    return os.path.join(directory, f"volatility_{safe}_{timeframe}.json")
+
+
+def load_tracker(symbol, timeframe, directory=VOLATILITY_STATE_DIR):
+    """从磁盘恢复跟踪器；文件不存在、损坏或配置不同时返回新的空跟踪器"""
+    path = _state_path(symbol, timeframe, directory)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            saved = data.get('config') or {}
+            if data.get('timeframe') == timeframe and all(saved.get(k) == VOLATILITY_CONFIG[k] for k in STATE_KEYS):
+                return VolatilityTracker.from_dict(data)
+        except Exception as e:
+            print(f"读取波动率状态失败(忽略继续): {e}")
+    return VolatilityTracker(timeframe)
+
+
+def save_tracker(tracker, symbol, directory=VOLATILITY_STATE_DIR):
+    """原子写入跟踪器状态"""
+    path = _state_path(symbol, tracker.timeframe, directory)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(tracker.to_dict(), f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"写入波动率状态失败(忽略继续): {e}")
@@ -3,7 +3,6 @@ from flask_cors import CORS
 import threading
 import sys
 import os
-import requests
 from datetime import datetime
 
 # 获取当前文件所在目录
@@ -12,6 +11,7 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # 导入主程序
 import deepseekok2
 from paper_trading import init_db, list_trades, compute_win_rate_from_db
+from http_client import http_get, get_http_metrics
 
 # 明确指定模板和静态文件路径
 app = Flask(__name__, 
@@ -234,6 +234,14 @@ def get_profit_curve():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/scan')
+def get_symbol_scan():
+    """获取多品种批量扫描结果（需配置 SCAN_SYMBOLS）"""
+    try:
+        return jsonify(deepseekok2.web_data['symbol_scan'])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/ai_model_info')
 def get_ai_model_info():
     """获取AI模型信息和连接状态"""
@@ -259,7 +267,7 @@ def get_health():
     """检查到交易所公共API的连通性"""
     def check(url, timeout=5):
         try:
-            resp = requests.get(url, timeout=timeout)
+            resp = http_get(url, timeout=timeout)
             return {'reachable': True, 'status_code': resp.status_code}
         except Exception as e:
             return {'reachable': False, 'error': str(e)}
@@ -268,6 +276,13 @@ def get_health():
         'okx_market': check('https://www.okx.com/api/v5/market/ticker?instId=BTC-USDT-SWAP'),
         'binance_futures': check('https://fapi.binance.com/fapi/v1/ping'),
         'binance_spot': check('https://api.binance.com/api/v3/ping'),
+        'data_sources': deepseekok2.source_racer.stats(),
+        'http': get_http_metrics(),
+        'exchange_budget': deepseekok2.request_scheduler.stats(),
+        'indicator_snapshot_cache': deepseekok2.indicator_snapshot_cache.stats(),
+        'decision_cache': deepseekok2.decision_cache.stats(),
+        'ai_ensemble': deepseekok2.ai_ensemble.stats() if deepseekok2.ai_ensemble else None,
+        'prompt': deepseekok2.prompt_stats.stats(),
         'last_check': deepseekok2.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
     return jsonify(results)